@@ -0,0 +1,101 @@
+"""
+Análisis antitrampas (src/antitrampas.py) sobre tracks GPS.
+
+1. Comprobación: una carrera normal no debe dar ningún motivo y cada trampa
+   fabricada (teletransporte, tramo en coche, vuelta reenviada, track generado,
+   tiempo hacia atrás) debe dar el suyo, como rechazo o como aviso.
+2. Tiempos con tracks de 1k, 10k y 100k puntos: el análisis va en línea en
+   /carreras/guardar antes de tocar la base de datos, así que con 10k puntos
+   tiene que quedarse en pocos milisegundos. También se mide el paso de los
+   PuntoGPS de la petición a arrays.
+
+Uso:  python -m benchmarks.bench_antitrampas [--repeticiones 50]
+"""
+import argparse
+import datetime
+import statistics
+import time
+import numpy as np
+from src import antitrampas
+from src.routers.carreras import PuntoGPS, arrays_de_puntos
+
+
+def carrera(n, semilla=7):
+    # Corredor a ~3 m/s con rumbo cambiante, muestreado a ~1 Hz, con ruido de GPS
+    rnd = np.random.default_rng(semilla)
+    rumbo = np.cumsum(rnd.normal(0, 0.05, n))
+    paso = rnd.normal(3.0, 0.4, n)
+    lats = 40.4168 + np.cumsum(paso * np.cos(rumbo)) / 111_000 + rnd.normal(0, 2e-5, n)
+    lons = -3.7038 + np.cumsum(paso * np.sin(rumbo)) / 85_000 + rnd.normal(0, 2e-5, n)
+    segundos = np.cumsum(rnd.normal(1.0, 0.05, n)) - 1.0
+    return lats, lons, segundos
+
+
+def trampas(n=3_000):
+    lats, lons, segundos = carrera(n)
+    casos = {"normal": (lats, lons, segundos)}
+
+    t_lats = lats.copy()
+    for i in (500, 1_200, 2_000):
+        t_lats[i:] += 0.05                                  # Saltos de ~5 km de un segundo a otro
+    casos["teletransporte"] = (t_lats, lons, segundos)
+
+    c_lats, c_lons = lats.copy(), lons.copy()
+    tramo = slice(1_000, 1_300)                             # 5 minutos a ~15 m/s (54 km/h)
+    avance = np.cumsum(np.full(300, 12.0)) / 111_000
+    c_lats[tramo] += avance
+    c_lats[1_300:] += avance[-1]
+    casos["vehiculo"] = (c_lats, c_lons, segundos)
+
+    vuelta = n // 4                                         # La misma vuelta reenviada cuatro veces
+    casos["reenviado"] = (np.tile(lats[:vuelta], 4), np.tile(lons[:vuelta], 4), segundos[:vuelta * 4])
+
+    indices = np.arange(n)
+    casos["generado"] = (40.4 + indices * 2.5e-5, np.full(n, -3.7), indices.astype(np.float64))
+
+    r_segundos = segundos.copy()
+    r_segundos[1_500:1_510] -= 30
+    casos["tiempo atrás"] = (lats, lons, r_segundos)
+    return casos
+
+
+def comprobar():
+    for nombre, (lats, lons, segundos) in trampas().items():
+        analisis = antitrampas.analizar(lats, lons, segundos)
+        motivos = analisis["rechazos"] + analisis["avisos"]
+        if (nombre == "normal") == bool(motivos):
+            raise SystemExit(f"❌ {nombre}: {motivos or 'no se ha detectado'}")
+        veredicto = "rechazo" if analisis["rechazos"] else "aviso" if motivos else ""
+        print(f"✅ {nombre:<15} {veredicto:<8} {'; '.join(motivos) or 'sin motivos'}")
+
+
+def mediana_ms(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return statistics.median(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    comprobar()
+
+    print(f"\n{'puntos':>8} | {'análisis (ms)':>13} | {'a arrays (ms)':>13}")
+    print("-" * 42)
+    for n in [1_000, 10_000, 100_000]:
+        lats, lons, segundos = carrera(n)
+        inicio = datetime.datetime(2026, 1, 1, 8, 0, 0)
+        puntos = [PuntoGPS(latitud=la, longitud=lo, orden=i, timestamp=inicio + datetime.timedelta(seconds=s))
+                  for i, (la, lo, s) in enumerate(zip(lats.tolist(), lons.tolist(), segundos.tolist()))]
+        analisis = mediana_ms(lambda: antitrampas.analizar(lats, lons, segundos), args.repeticiones)
+        conversion = mediana_ms(lambda: arrays_de_puntos(puntos), max(1, args.repeticiones // 10))
+        print(f"{n:>8} | {analisis:>13.2f} | {conversion:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
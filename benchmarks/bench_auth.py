@@ -0,0 +1,51 @@
+"""
+Coste por petición de obtener_runner_actual con la caché de tokens activada y desactivada.
+
+Uso:  python -m benchmarks.bench_auth [--peticiones 100000] [--tokens 100]
+Simula 'tokens' usuarios que repiten su token en bucle (lo normal con tokens de 7 días).
+Necesita la base de datos migrada: cada fallo de caché comprueba ahí si el token está revocado.
+"""
+import argparse
+import time
+from fastapi.security import HTTPAuthorizationCredentials
+from src import dependencies
+
+
+def medir(credenciales, peticiones, cache_activa):
+    dependencies.CACHE_TOKENS_ACTIVA = cache_activa
+    dependencies._tokens.clear()
+    t0 = time.perf_counter()
+    for i in range(peticiones):
+        dependencies.obtener_runner_actual(credenciales[i % len(credenciales)])
+    return (time.perf_counter() - t0) / peticiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=100_000)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    credenciales = [
+        HTTPAuthorizationCredentials(scheme="Bearer",
+                                     credentials=dependencies.crear_token_acceso({"sub": str(i), "name": f"runner{i}"}))
+        for i in range(1, args.tokens + 1)
+    ]
+
+    # Comprobación: los dos caminos devuelven el mismo runner
+    for cred in credenciales:
+        dependencies.CACHE_TOKENS_ACTIVA = False
+        sin = dependencies.obtener_runner_actual(cred)
+        dependencies.CACHE_TOKENS_ACTIVA = True
+        assert dependencies.obtener_runner_actual(cred) == dependencies.obtener_runner_actual(cred) == sin
+
+    sin_cache = medir(credenciales, args.peticiones, False)
+    con_cache = medir(credenciales, args.peticiones, True)
+    print(f"{'modo':>10} {'µs/petición':>12}")
+    print(f"{'sin caché':>10} {sin_cache * 1e6:>12.2f}")
+    print(f"{'con caché':>10} {con_cache * 1e6:>12.2f}")
+    print(f"Mejora: x{sin_cache / con_cache:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Rendimiento de la API con muchos clientes a la vez, con la capa de datos en sus dos modos:
+DB_ASYNC=0 (pool psycopg2 + threadpool) y DB_ASYNC=1 (pool asíncrono de psycopg 3).
+
+Uso:  python -m benchmarks.bench_concurrencia [--clientes 50 200 1000] [--duracion 10]
+Levanta un uvicorn por modo (un solo worker) contra la base de datos configurada
+(INTERNAL_DATABASE_URL o la conexión local) y lanza 'clientes' peticiones concurrentes
+en bucle sobre endpoints de lectura calientes. Solo lee: conviene tener datos (carreras,
+capturas, seguidores) para que las consultas hagan algo. Necesita httpx.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+import numpy as np
+
+# Mezcla de peticiones: cacheadas, sin caché y el feed (la consulta más lenta)
+RUTAS = [
+    "/ranking/global",
+    "/ranking/pais/España",
+    "/ranking/temporada",
+    "/social/feed/1",
+    "/zonas/mapa/cambios?desde=0&limite=200",
+    "/zonas/mapa/vista?zoom=12&min_lat=40.30&min_lon=-3.80&max_lat=40.50&max_lon=-3.60",
+]
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrancar_servidor(modo, puerto):
+    entorno = dict(os.environ, DB_ASYNC=modo)
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno,
+    )
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(f"http://127.0.0.1:{puerto}/", timeout=1).status_code == 200:
+                return proceso
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError(f"El servidor (DB_ASYNC={modo}) no arrancó")
+
+
+async def cliente(http, fin, latencias, errores, desfase):
+    i = desfase
+    while time.monotonic() < fin:
+        ruta = RUTAS[i % len(RUTAS)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            r = await http.get(ruta)
+            if r.status_code != 200:
+                errores.append(r.status_code)
+                continue
+        except httpx.HTTPError:
+            errores.append("red")
+            continue
+        latencias.append(time.perf_counter() - t0)
+
+
+async def carga(puerto, clientes, duracion):
+    latencias, errores = [], []
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", limits=limites, timeout=60) as http:
+        # Calentamos cachés y pools antes de medir
+        await asyncio.gather(*(http.get(r) for r in RUTAS))
+        fin = time.monotonic() + duracion
+        await asyncio.gather(*(cliente(http, fin, latencias, errores, i) for i in range(clientes)))
+    return np.array(latencias), errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos de carga por nivel")
+    parser.add_argument("--modos", nargs="+", default=["0", "1"], help="Valores de DB_ASYNC a probar")
+    args = parser.parse_args()
+
+    print(f"{'DB_ASYNC':>8} {'clientes':>9} {'pet/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    for modo in args.modos:
+        puerto = puerto_libre()
+        servidor = arrancar_servidor(modo, puerto)
+        try:
+            for n in args.clientes:
+                latencias, errores = asyncio.run(carga(puerto, n, args.duracion))
+                if len(latencias):
+                    p50, p95, p99 = np.percentile(latencias, [50, 95, 99]) * 1000
+                else:
+                    p50 = p95 = p99 = float("nan")
+                print(f"{modo:>8} {n:>9} {len(latencias) / args.duracion:>9.1f} "
+                      f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {len(errores):>8}")
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
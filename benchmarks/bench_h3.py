@@ -0,0 +1,110 @@
+"""
+Motor H3 vectorizado frente a la versión original por segmentos.
+
+1. Comprobación de equivalencia: genera cientos de tracks aleatorios
+   (paseos cortos, saltos largos, puntos repetidos, ida y vuelta, cerca
+   de pentágonos y del antimeridiano) y exige que ambos devuelvan
+   EXACTAMENTE el mismo conjunto de celdas.
+2. Tiempos con tracks densos de 1k, 10k y 100k puntos.
+
+Uso:  python -m benchmarks.bench_h3 [--casos 500] [--semilla 1]
+"""
+import argparse
+import random
+import time
+import h3
+import numpy as np
+from src import motor_h3
+from src.motor_h3 import RESOLUCION_H3
+
+
+def referencia(lats, lons):
+    """Copia literal del cálculo anterior (strings hex, dos latlng_to_cell por segmento)."""
+    hexagonos_strings = set()
+    if len(lats) < 2:
+        if len(lats) == 1:
+            hexagonos_strings.add(h3.latlng_to_cell(lats[0], lons[0], RESOLUCION_H3))
+        return {int(h, 16) for h in hexagonos_strings}
+    for i in range(len(lats) - 1):
+        h3_inicio = h3.latlng_to_cell(lats[i], lons[i], RESOLUCION_H3)
+        h3_fin = h3.latlng_to_cell(lats[i + 1], lons[i + 1], RESOLUCION_H3)
+        try:
+            hexagonos_strings.update(h3.grid_path_cells(h3_inicio, h3_fin))
+        except Exception:
+            hexagonos_strings.add(h3_inicio)
+            hexagonos_strings.add(h3_fin)
+    return {int(h, 16) for h in hexagonos_strings}
+
+
+# Puntos de partida "raros": un pentágono de resolución 10 y el antimeridiano
+ORIGENES_ESPECIALES = [h3.cell_to_latlng(h3.get_pentagons(RESOLUCION_H3)[3]), (-16.5, 179.999)]
+
+
+def track_aleatorio(rnd):
+    n = rnd.choice([0, 1, 2, 3, rnd.randint(4, 60), rnd.randint(60, 800)])
+    if rnd.random() < 0.15:
+        lat, lon = rnd.choice(ORIGENES_ESPECIALES)
+    else:
+        lat, lon = rnd.uniform(-70, 70), rnd.uniform(-180, 180)
+    paso = rnd.choice([1e-6, 3e-5, 3e-4, 3e-3, 0.05])
+    lats, lons = [], []
+    for _ in range(n):
+        r = rnd.random()
+        if r < 0.2 and lats:
+            pass                                   # Punto repetido (GPS parado)
+        elif r < 0.25 and len(lats) > 3:
+            lat, lon = lats[rnd.randrange(len(lats))], lons[rnd.randrange(len(lons))]  # Vuelta atrás
+        elif r < 0.27:
+            lat, lon = lat + rnd.uniform(-0.5, 0.5), lon + rnd.uniform(-0.5, 0.5)    # Salto largo
+        else:
+            lat, lon = lat + rnd.gauss(0, paso), lon + rnd.gauss(0, paso)
+        lat = max(-89.9, min(89.9, lat))
+        lon = (lon + 180) % 360 - 180
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons
+
+
+def comprobar_equivalencia(casos, semilla):
+    rnd = random.Random(semilla)
+    for caso in range(casos):
+        lats, lons = track_aleatorio(rnd)
+        esperado = referencia(lats, lons)
+        obtenido = motor_h3.celdas_recorridas(np.array(lats), np.array(lons))
+        if esperado != obtenido:
+            raise SystemExit(f"❌ Caso {caso}: difieren ({len(esperado)} vs {len(obtenido)} celdas)")
+    print(f"✅ {casos} tracks aleatorios: mismo conjunto de celdas en ambas versiones")
+
+
+def track_denso(n):
+    # Corredor a ~3 m/s muestreado a 1 Hz, con algo de ruido GPS
+    rnd = np.random.default_rng(7)
+    lats = 40.4168 + np.cumsum(np.full(n, 2e-5)) + rnd.normal(0, 5e-6, n)
+    lons = -3.7038 + np.cumsum(np.full(n, 1e-5)) + rnd.normal(0, 5e-6, n)
+    return lats, lons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--casos", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    comprobar_equivalencia(args.casos, args.semilla)
+
+    print(f"\n{'puntos':>8} | {'original (s)':>12} | {'vectorizado (s)':>15} | {'x':>5}")
+    print("-" * 50)
+    for n in [1_000, 10_000, 100_000]:
+        lats, lons = track_denso(n)
+        lista_lats, lista_lons = lats.tolist(), lons.tolist()
+        t0 = time.perf_counter()
+        a = referencia(lista_lats, lista_lons)
+        t1 = time.perf_counter()
+        b = motor_h3.celdas_recorridas(lats, lons)
+        t2 = time.perf_counter()
+        assert a == b
+        print(f"{n:>8} | {t1 - t0:>12.4f} | {t2 - t1:>15.4f} | {(t1 - t0) / (t2 - t1):>5.1f}")
+
+
+if __name__ == "__main__":
+    main()
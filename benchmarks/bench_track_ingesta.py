@@ -0,0 +1,89 @@
+"""
+Compara las tres formas de guardar un track GPS en track_point:
+executemany (lo de antes), execute_values y COPY FROM STDIN.
+
+Uso:  python -m benchmarks.bench_track_ingesta [--repeticiones 3]
+Necesita una base de datos con la tabla track_point (usa la misma
+configuración que la API: INTERNAL_DATABASE_URL o la conexión local).
+Se escribe en una copia temporal de track_point (sin claves foráneas)
+dentro de una transacción que se deshace al final.
+"""
+import argparse
+import datetime
+import time
+from psycopg2.extras import execute_values
+from src.database import abrir_conexion_directa
+from src.routers.carreras import PuntoGPS
+from src import tracks
+
+TAMANOS = [1_000, 10_000, 100_000]
+
+
+def generar_puntos(n):
+    inicio = datetime.datetime(2026, 1, 1, 8, 0, 0)
+    return [
+        PuntoGPS(latitud=40.4168 + i * 1e-5, longitud=-3.7038 + i * 1e-5, orden=i,
+                 timestamp=inicio + datetime.timedelta(seconds=i))
+        for i in range(n)
+    ]
+
+
+def con_executemany(cur, id_ruta, puntos):
+    inicio = puntos[0].timestamp
+    datos = [(id_ruta, p.latitud, p.longitud, p.orden, (p.timestamp - inicio).total_seconds()) for p in puntos]
+    cur.executemany("""
+        INSERT INTO track_point (id_ruta, latitud, longitud, orden, timestamp_relativo)
+        VALUES (%s, %s, %s, %s, %s)
+    """, datos)
+
+
+def con_execute_values(cur, id_ruta, puntos):
+    inicio = puntos[0].timestamp
+    execute_values(cur, tracks.SQL_INSERT_TRACK, tracks._filas_track(id_ruta, puntos, inicio),
+                   page_size=tracks.TAM_PAGINA_INSERT)
+
+
+def con_copy(cur, id_ruta, puntos):
+    cur.copy_expert(tracks.SQL_COPY_TRACK, tracks.buffer_copy_track(id_ruta, puntos, puntos[0].timestamp))
+
+
+ESTRATEGIAS = [("executemany", con_executemany), ("execute_values", con_execute_values), ("copy", con_copy)]
+
+
+def medir(conn, funcion, puntos, repeticiones):
+    mejores = []
+    for _ in range(repeticiones):
+        cur = conn.cursor()
+        # La tabla temporal tapa a la real durante esta transacción
+        cur.execute("CREATE TEMP TABLE track_point (LIKE public.track_point INCLUDING DEFAULTS)")
+        t0 = time.perf_counter()
+        funcion(cur, -1, puntos)
+        mejores.append(time.perf_counter() - t0)
+        cur.close()
+        conn.rollback()
+    return min(mejores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--sin-executemany-desde", type=int, default=100_000,
+                        help="Saltar executemany a partir de este tamaño (tarda minutos)")
+    args = parser.parse_args()
+
+    conn = abrir_conexion_directa()
+    print(f"{'puntos':>8} | {'estrategia':<15} | {'segundos':>9} | {'puntos/s':>10}")
+    print("-" * 52)
+    for n in TAMANOS:
+        puntos = generar_puntos(n)
+        for nombre, funcion in ESTRATEGIAS:
+            if nombre == "executemany" and n >= args.sin_executemany_desde:
+                print(f"{n:>8} | {nombre:<15} | {'(saltado)':>9} |")
+                continue
+            segundos = medir(conn, funcion, puntos, args.repeticiones)
+            print(f"{n:>8} | {nombre:<15} | {segundos:>9.3f} | {n / segundos:>10.0f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+-- Marcadores pre-agregados para los endpoints /ranking/*
+-- Se mantienen de forma incremental al guardar capturas (src/clasificaciones.py)
+-- y se pueden reconstruir con: python -m src.cli reconstruir-clasificaciones
+
+CREATE TABLE IF NOT EXISTS puntuacion_runner (
+    id_runner INTEGER PRIMARY KEY,
+    puntos BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_runner_puntos ON puntuacion_runner (puntos DESC);
+
+CREATE TABLE IF NOT EXISTS puntuacion_equipo (
+    id_equipo INTEGER PRIMARY KEY,
+    puntos BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_equipo_puntos ON puntuacion_equipo (puntos DESC);
+
+CREATE TABLE IF NOT EXISTS puntuacion_pais (
+    pais TEXT NOT NULL,
+    id_runner INTEGER NOT NULL,
+    puntos BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (pais, id_runner)
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_pais_puntos ON puntuacion_pais (pais, puntos DESC);
+
+CREATE TABLE IF NOT EXISTS puntuacion_municipio (
+    municipio TEXT NOT NULL,
+    id_runner INTEGER NOT NULL,
+    puntos BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (municipio, id_runner)
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_municipio_puntos ON puntuacion_municipio (municipio, puntos DESC);
+
+CREATE TABLE IF NOT EXISTS puntuacion_temporada (
+    id_temporada INTEGER NOT NULL,
+    id_runner INTEGER NOT NULL,
+    puntos BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_temporada, id_runner)
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_temporada_puntos ON puntuacion_temporada (id_temporada, puntos DESC);
+
+CREATE TABLE IF NOT EXISTS puntuacion_equipo_temporada (
+    id_temporada INTEGER NOT NULL,
+    id_equipo INTEGER NOT NULL,
+    puntos BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_temporada, id_equipo)
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_equipo_temporada_puntos ON puntuacion_equipo_temporada (id_temporada, puntos DESC);
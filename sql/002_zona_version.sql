@@ -0,0 +1,12 @@
+-- Secuencia de cambios del mapa: cada vez que una zona cambia de dueño, equipo o color
+-- recibe un número de versión nuevo. Los clientes piden solo lo que cambió desde la
+-- última versión que vieron (GET /zonas/mapa/cambios?desde=N).
+
+CREATE SEQUENCE IF NOT EXISTS zona_version_seq;
+
+ALTER TABLE zona ADD COLUMN IF NOT EXISTS version BIGINT;
+UPDATE zona SET version = nextval('zona_version_seq') WHERE version IS NULL;
+ALTER TABLE zona ALTER COLUMN version SET DEFAULT nextval('zona_version_seq');
+ALTER TABLE zona ALTER COLUMN version SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_zona_version ON zona (version);
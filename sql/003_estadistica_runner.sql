@@ -0,0 +1,58 @@
+-- Contadores por runner para el motor de logros (src/motor_logros.py).
+-- Se actualizan en la misma transacción que cada carrera/captura, así comprobar los
+-- logros no depende de lo largo que sea el historial del runner.
+
+CREATE TABLE IF NOT EXISTS estadistica_runner (
+    id_runner INTEGER PRIMARY KEY,
+    capturas BIGINT NOT NULL DEFAULT 0,
+    zonas_nuevas BIGINT NOT NULL DEFAULT 0,
+    robos BIGINT NOT NULL DEFAULT 0,
+    defensas BIGINT NOT NULL DEFAULT 0,
+    carreras BIGINT NOT NULL DEFAULT 0,
+    distancia_metros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    racha_dias INTEGER NOT NULL DEFAULT 0,        -- Días seguidos corriendo hasta ultimo_dia
+    mejor_racha_dias INTEGER NOT NULL DEFAULT 0,
+    ultimo_dia DATE
+);
+
+-- Relleno inicial desde el historial
+INSERT INTO estadistica_runner (id_runner, capturas, zonas_nuevas, robos, defensas)
+SELECT id_runner,
+       COUNT(*),
+       COUNT(*) FILTER (WHERE tipo_captura = 'NUEVA'),
+       COUNT(*) FILTER (WHERE tipo_captura = 'ROBO'),
+       COUNT(*) FILTER (WHERE tipo_captura = 'DEFENSA')
+FROM captura_zona
+GROUP BY id_runner
+ON CONFLICT (id_runner) DO NOTHING;
+
+-- Rachas: días distintos con carrera agrupados en islas de días consecutivos
+WITH dias AS (
+    SELECT DISTINCT id_runner, fecha_hora_inicio::date AS dia FROM ruta
+), islas AS (
+    SELECT id_runner, dia, dia - (ROW_NUMBER() OVER (PARTITION BY id_runner ORDER BY dia))::int AS isla FROM dias
+), rachas AS (
+    SELECT id_runner, isla, COUNT(*) AS largo, MAX(dia) AS fin FROM islas GROUP BY id_runner, isla
+), por_runner AS (
+    SELECT r.id_runner,
+           COUNT(*) AS carreras,
+           COALESCE(SUM(r.distancia_metros), 0) AS distancia,
+           (SELECT MAX(largo) FROM rachas x WHERE x.id_runner = r.id_runner) AS mejor,
+           (SELECT largo FROM rachas x WHERE x.id_runner = r.id_runner ORDER BY fin DESC LIMIT 1) AS actual,
+           MAX(r.fecha_hora_inicio::date) AS ultimo
+    FROM ruta r
+    GROUP BY r.id_runner
+)
+INSERT INTO estadistica_runner (id_runner, carreras, distancia_metros, racha_dias, mejor_racha_dias, ultimo_dia)
+SELECT id_runner, carreras, distancia, COALESCE(actual, 0), COALESCE(mejor, 0), ultimo FROM por_runner
+ON CONFLICT (id_runner) DO UPDATE SET
+    carreras = EXCLUDED.carreras,
+    distancia_metros = EXCLUDED.distancia_metros,
+    racha_dias = EXCLUDED.racha_dias,
+    mejor_racha_dias = EXCLUDED.mejor_racha_dias,
+    ultimo_dia = EXCLUDED.ultimo_dia;
+
+-- Las tres medallas que antes estaban escritas a mano en el código (capturas 1 / 5 / 10)
+UPDATE logro SET categoria = 'CAPTURAS', criterio = '1'  WHERE id_logro = 1 AND criterio IS NULL;
+UPDATE logro SET categoria = 'CAPTURAS', criterio = '5'  WHERE id_logro = 2 AND criterio IS NULL;
+UPDATE logro SET categoria = 'CAPTURAS', criterio = '10' WHERE id_logro = 3 AND criterio IS NULL;
@@ -0,0 +1,8 @@
+-- Punto de control de las tareas largas de 'python -m src.cli': si una se corta,
+-- la siguiente ejecución sigue desde el último lote confirmado en vez de empezar de cero.
+
+CREATE TABLE IF NOT EXISTS tarea_checkpoint (
+    tarea TEXT PRIMARY KEY,
+    ultimo_id BIGINT NOT NULL,           -- Último id (p.ej. id_runner) ya procesado y confirmado
+    actualizado_en TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,58 @@
+-- Feed social por difusión en escritura (src/feed.py).
+-- 'actividad' guarda una fila por carrera guardada; 'feed_entrada' es el buzón de cada
+-- seguidor, ya ordenado por (fecha, id_actividad) para leer una página con un solo
+-- recorrido de índice. Las carreras de cuentas con muchos seguidores no se copian a los
+-- buzones (difundida = FALSE): el lector las trae al vuelo de 'actividad'.
+
+CREATE TABLE IF NOT EXISTS actividad (
+    id_actividad BIGSERIAL PRIMARY KEY,
+    id_runner INTEGER NOT NULL,
+    id_ruta INTEGER,
+    fecha TIMESTAMP NOT NULL,
+    distancia_metros DOUBLE PRECISION NOT NULL DEFAULT 0,
+    duracion_segundos INTEGER NOT NULL DEFAULT 0,
+    zonas_nuevas INTEGER NOT NULL DEFAULT 0,
+    zonas_robadas INTEGER NOT NULL DEFAULT 0,
+    zonas_defendidas INTEGER NOT NULL DEFAULT 0,
+    puntos INTEGER NOT NULL DEFAULT 0,
+    difundida BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS feed_entrada (
+    id_runner INTEGER NOT NULL,          -- Dueño del feed (el seguidor)
+    fecha TIMESTAMP NOT NULL,
+    id_actividad BIGINT NOT NULL,
+    PRIMARY KEY (id_runner, fecha, id_actividad)
+);
+
+-- Últimas carreras de un autor al empezar a seguirle
+CREATE INDEX IF NOT EXISTS idx_actividad_runner ON actividad (id_runner, fecha DESC, id_actividad DESC);
+-- Parte "pull": solo las actividades no difundidas (pocas cuentas, pocas filas)
+CREATE INDEX IF NOT EXISTS idx_actividad_sin_difundir ON actividad (id_runner, fecha DESC, id_actividad DESC)
+    WHERE NOT difundida;
+-- Seguidores de un autor (difusión y conteo)
+CREATE INDEX IF NOT EXISTS idx_seguidor_seguido ON seguidor (id_seguido);
+
+-- Relleno inicial desde el historial de carreras. 1000 = FEED_UMBRAL_DIFUSION por defecto.
+INSERT INTO actividad (id_runner, id_ruta, fecha, distancia_metros, duracion_segundos,
+                       zonas_nuevas, zonas_robadas, zonas_defendidas, puntos, difundida)
+SELECT r.id_runner, r.id_ruta, r.fecha_hora_inicio, COALESCE(r.distancia_metros, 0), COALESCE(r.duracion_segundos, 0),
+       COALESCE(c.nuevas, 0), COALESCE(c.robadas, 0), COALESCE(c.defendidas, 0), COALESCE(c.puntos, 0),
+       (SELECT COUNT(*) FROM seguidor s WHERE s.id_seguido = r.id_runner) <= 1000
+FROM ruta r
+LEFT JOIN (
+    SELECT id_ruta,
+           COUNT(*) FILTER (WHERE tipo_captura = 'NUEVA') AS nuevas,
+           COUNT(*) FILTER (WHERE tipo_captura = 'ROBO') AS robadas,
+           COUNT(*) FILTER (WHERE tipo_captura = 'DEFENSA') AS defendidas,
+           SUM(puntos_ganados) AS puntos
+    FROM captura_zona GROUP BY id_ruta
+) c ON c.id_ruta = r.id_ruta
+WHERE r.id_runner IS NOT NULL AND r.fecha_hora_inicio IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM actividad a WHERE a.id_ruta = r.id_ruta);
+
+INSERT INTO feed_entrada (id_runner, fecha, id_actividad)
+SELECT s.id_seguidor, a.fecha, a.id_actividad
+FROM actividad a JOIN seguidor s ON s.id_seguido = a.id_runner
+WHERE a.difundida
+ON CONFLICT DO NOTHING;
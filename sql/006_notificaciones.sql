@@ -0,0 +1,66 @@
+-- Notificaciones paginadas (src/notificaciones.py): índice para leer por (fecha_hora, id),
+-- contador de no leídas mantenido por trigger y tabla de archivo para las antiguas.
+
+UPDATE notificacion SET leida = FALSE WHERE leida IS NULL;
+UPDATE notificacion SET fecha_hora = TIMESTAMP '1970-01-01' WHERE fecha_hora IS NULL;
+ALTER TABLE notificacion
+    ALTER COLUMN leida SET DEFAULT FALSE,
+    ALTER COLUMN leida SET NOT NULL,
+    ALTER COLUMN fecha_hora SET DEFAULT NOW(),
+    ALTER COLUMN fecha_hora SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_notificacion_runner_fecha
+    ON notificacion (id_runner, fecha_hora DESC, id_notificacion DESC);
+-- Para el archivado: solo las leídas, por antigüedad
+CREATE INDEX IF NOT EXISTS idx_notificacion_leidas_fecha ON notificacion (fecha_hora) WHERE leida;
+
+CREATE TABLE IF NOT EXISTS notificacion_pendiente (
+    id_runner INTEGER PRIMARY KEY,
+    no_leidas INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO notificacion_pendiente (id_runner, no_leidas)
+SELECT id_runner, COUNT(*) FROM notificacion WHERE NOT leida AND id_runner IS NOT NULL GROUP BY id_runner
+ON CONFLICT (id_runner) DO UPDATE SET no_leidas = EXCLUDED.no_leidas;
+
+-- Cualquier sitio que inserte, marque o borre notificaciones mantiene el contador sin saberlo
+CREATE OR REPLACE FUNCTION contar_notificaciones_pendientes() RETURNS trigger AS $$
+DECLARE
+    delta INTEGER := 0;
+    runner INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        runner := NEW.id_runner;
+        IF NOT NEW.leida THEN delta := 1; END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        runner := OLD.id_runner;
+        IF NOT OLD.leida THEN delta := -1; END IF;
+    ELSE
+        runner := NEW.id_runner;
+        IF OLD.leida AND NOT NEW.leida THEN delta := 1;
+        ELSIF NOT OLD.leida AND NEW.leida THEN delta := -1;
+        END IF;
+    END IF;
+    IF delta <> 0 AND runner IS NOT NULL THEN
+        INSERT INTO notificacion_pendiente AS p (id_runner, no_leidas) VALUES (runner, GREATEST(delta, 0))
+        ON CONFLICT (id_runner) DO UPDATE SET no_leidas = GREATEST(p.no_leidas + delta, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notificacion_pendiente ON notificacion;
+CREATE TRIGGER trg_notificacion_pendiente
+    AFTER INSERT OR DELETE OR UPDATE OF leida ON notificacion
+    FOR EACH ROW EXECUTE FUNCTION contar_notificaciones_pendientes();
+
+CREATE TABLE IF NOT EXISTS notificacion_archivada (
+    id_notificacion INTEGER PRIMARY KEY,
+    id_runner INTEGER,
+    tipo TEXT,
+    titulo TEXT,
+    mensaje TEXT,
+    leida BOOLEAN NOT NULL,
+    fecha_hora TIMESTAMP NOT NULL,
+    archivada_en TIMESTAMP NOT NULL DEFAULT NOW()
+);
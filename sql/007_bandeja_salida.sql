@@ -0,0 +1,16 @@
+-- Bandeja de salida transaccional (src/bandeja_salida.py): la petición deja aquí, en su
+-- misma transacción, los efectos secundarios de una carrera o captura (rankings, logros,
+-- feed) y un trabajador en segundo plano los aplica con reintentos.
+
+CREATE TABLE IF NOT EXISTS bandeja_salida (
+    id_evento BIGSERIAL PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    datos JSONB NOT NULL,
+    creado_en TIMESTAMP NOT NULL DEFAULT NOW(),
+    disponible_en TIMESTAMP NOT NULL DEFAULT NOW(),   -- Para reintentar más tarde tras un fallo
+    intentos INTEGER NOT NULL DEFAULT 0,
+    ultimo_error TEXT,
+    muerto BOOLEAN NOT NULL DEFAULT FALSE               -- Agotó los reintentos: queda para revisarlo a mano
+);
+
+CREATE INDEX IF NOT EXISTS idx_bandeja_pendientes ON bandeja_salida (disponible_en, id_evento) WHERE NOT muerto;
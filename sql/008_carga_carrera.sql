@@ -0,0 +1,27 @@
+-- Subida de carreras por trozos (src/cargas.py). La app abre una sesión con una clave
+-- generada por ella, manda los puntos en trozos y al final pide calcular el territorio.
+-- Todo es idempotente por (id_runner, clave): reintentar un paso no duplica nada.
+
+CREATE TABLE IF NOT EXISTS carga_sesion (
+    id_runner INTEGER NOT NULL,
+    clave TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'ABIERTA',        -- ABIERTA / FINALIZADA
+    creada_en TIMESTAMP NOT NULL DEFAULT NOW(),
+    actualizada_en TIMESTAMP NOT NULL DEFAULT NOW(),
+    id_ruta INTEGER,
+    resultado JSONB,                               -- Respuesta de finalizar, para devolverla igual si se repite
+    PRIMARY KEY (id_runner, clave)
+);
+
+CREATE TABLE IF NOT EXISTS carga_punto (
+    id_runner INTEGER NOT NULL,
+    clave TEXT NOT NULL,
+    orden INTEGER NOT NULL,
+    latitud DOUBLE PRECISION NOT NULL,
+    longitud DOUBLE PRECISION NOT NULL,
+    instante TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (id_runner, clave, orden)
+);
+
+-- Limpieza de sesiones abandonadas / antiguas
+CREATE INDEX IF NOT EXISTS idx_carga_sesion_actualizada ON carga_sesion (actualizada_en);
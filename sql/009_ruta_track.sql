@@ -0,0 +1,15 @@
+-- Track compacto: un blob por ruta (src/formato_track.py) en vez de una fila por punto.
+-- Las rutas antiguas se pasan con 'python -m src.cli migrar-tracks'; mientras tanto se
+-- siguen leyendo de track_point.
+
+CREATE TABLE IF NOT EXISTS ruta_track (
+    id_ruta INTEGER PRIMARY KEY,
+    formato SMALLINT NOT NULL,                  -- Versión del formato del blob
+    puntos INTEGER NOT NULL,                    -- Puntos guardados (tras simplificar)
+    puntos_originales INTEGER NOT NULL,
+    tolerancia_m REAL NOT NULL DEFAULT 0,       -- 0 = sin simplificar
+    datos BYTEA NOT NULL
+);
+
+-- Para leer el track de una ruta aún no migrada y para la propia migración por lotes
+CREATE INDEX IF NOT EXISTS idx_track_point_ruta ON track_point (id_ruta, orden);
@@ -0,0 +1,31 @@
+-- Huellas de ruta para detectar carreras repetidas o copiadas (src/huellas.py).
+-- Una fila por ruta con su firma MinHash de celdas H3 y las claves LSH de sus bandas:
+-- buscar parecidas es un '&&' sobre el índice GIN, no comparar con todo el historial.
+-- Las rutas antiguas se indexan con 'python -m src.cli indexar-rutas'.
+
+CREATE TABLE IF NOT EXISTS ruta_huella (
+    id_ruta INTEGER PRIMARY KEY,
+    id_runner INTEGER NOT NULL,
+    celdas INTEGER NOT NULL,                    -- Celdas distintas que pisa la ruta
+    firma BIGINT[] NOT NULL,                    -- Mínimos MinHash (NUM_HASHES)
+    bandas BIGINT[] NOT NULL,                   -- Una clave por banda LSH
+    huella_track BIGINT,                        -- Hash de las coordenadas exactas (mismo fichero GPS)
+    creado_en TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ruta_huella_bandas ON ruta_huella USING GIN (bandas);
+CREATE INDEX IF NOT EXISTS idx_ruta_huella_track ON ruta_huella (huella_track);
+
+-- Parejas sospechosas, para revisarlas (correr el mismo circuito también se parece)
+CREATE TABLE IF NOT EXISTS ruta_sospecha (
+    id_ruta INTEGER NOT NULL,
+    id_ruta_parecida INTEGER NOT NULL,
+    id_runner_parecida INTEGER NOT NULL,
+    similitud REAL NOT NULL,                    -- Jaccard estimada de sus celdas
+    identica BOOLEAN NOT NULL,                  -- Mismas coordenadas exactas
+    revisada BOOLEAN NOT NULL DEFAULT FALSE,
+    creado_en TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id_ruta, id_ruta_parecida)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ruta_sospecha_pendiente ON ruta_sospecha (creado_en) WHERE NOT revisada;
@@ -0,0 +1,8 @@
+-- Fuerza de las zonas: 1 al conquistarlas o defenderlas, se reduce a la mitad cada
+-- ZONA_VIDA_MEDIA_DIAS y por debajo de ZONA_FUERZA_MINIMA la zona vuelve a ser neutral.
+-- La recalcula por lotes 'python -m src.cli decaer-zonas' (ver src/territorio.py).
+
+ALTER TABLE zona ADD COLUMN IF NOT EXISTS fuerza REAL NOT NULL DEFAULT 1;
+
+-- La tarea recorre solo las zonas con dueño, en orden de clave
+CREATE INDEX IF NOT EXISTS idx_zona_con_dueno ON zona (id_zona) WHERE id_runner IS NOT NULL;
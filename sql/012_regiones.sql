@@ -0,0 +1,84 @@
+-- Regiones (países y municipios) para los rankings regionales (src/regiones.py).
+-- Cada región se guarda como celdas H3 compactadas (de resolución variable) en celda_region;
+-- la API las carga en memoria al arrancar y resuelve la región de cada captura con máscaras
+-- de bits. Las capturas guardan id_region y los marcadores regionales van por id, no por texto.
+-- Se cargan con 'python -m src.cli cargar-regiones fichero.geojson' y las capturas antiguas
+-- se etiquetan con 'python -m src.cli asignar-regiones' (y luego reconstruir-clasificaciones).
+
+CREATE TABLE IF NOT EXISTS region (
+    id_region SERIAL PRIMARY KEY,
+    tipo TEXT NOT NULL CHECK (tipo IN ('PAIS', 'MUNICIPIO')),
+    nombre TEXT NOT NULL,
+    id_padre INTEGER REFERENCES region (id_region)     -- El país de un municipio
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_region_nombre ON region (tipo, COALESCE(id_padre, 0), nombre);
+
+CREATE TABLE IF NOT EXISTS celda_region (
+    celda BIGINT NOT NULL,                              -- Celda H3 de cualquier resolución
+    id_region INTEGER NOT NULL REFERENCES region (id_region),
+    PRIMARY KEY (celda, id_region)
+);
+CREATE INDEX IF NOT EXISTS idx_celda_region_region ON celda_region (id_region);
+
+ALTER TABLE zona ADD COLUMN IF NOT EXISTS id_region INTEGER;
+ALTER TABLE captura_zona ADD COLUMN IF NOT EXISTS id_region INTEGER;
+
+-- Marcador por región: sustituye a puntuacion_pais y puntuacion_municipio (por texto), cuyos
+-- puntos se copian aquí más abajo
+CREATE TABLE IF NOT EXISTS puntuacion_region (
+    id_region INTEGER NOT NULL,
+    id_runner INTEGER NOT NULL,
+    puntos BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_region, id_runner)
+);
+CREATE INDEX IF NOT EXISTS idx_puntuacion_region_puntos ON puntuacion_region (id_region, puntos DESC);
+
+-- Las zonas antiguas creadas a mano por /zonas traen país y municipio en texto y un id que no
+-- es H3: sus regiones salen de ahí y se quedan en zona.id_region
+INSERT INTO region (tipo, nombre)
+SELECT DISTINCT 'PAIS', pais FROM zona WHERE pais IS NOT NULL
+ON CONFLICT (tipo, COALESCE(id_padre, 0), nombre) DO NOTHING;
+
+INSERT INTO region (tipo, nombre, id_padre)
+SELECT DISTINCT 'MUNICIPIO', z.municipio, p.id_region
+FROM zona z JOIN region p ON p.tipo = 'PAIS' AND p.nombre = z.pais
+WHERE z.municipio IS NOT NULL
+ON CONFLICT (tipo, COALESCE(id_padre, 0), nombre) DO NOTHING;
+
+UPDATE zona z SET id_region = p.id_region
+FROM region p
+WHERE p.tipo = 'PAIS' AND p.nombre = z.pais AND z.id_region IS NULL;
+
+UPDATE zona z SET id_region = m.id_region
+FROM region m
+WHERE m.tipo = 'MUNICIPIO' AND m.id_padre = z.id_region AND m.nombre = z.municipio;
+
+-- Los marcadores por texto pasan a puntuacion_region tal cual (sin recalcular): cada país y
+-- municipio que no tenga ya su región la recibe sin padre, y un municipio cuyo nombre
+-- está en varios países (el marcador viejo los mezclaba) va a esa región sin padre
+INSERT INTO region (tipo, nombre)
+SELECT DISTINCT 'PAIS', pais FROM puntuacion_pais
+ON CONFLICT (tipo, COALESCE(id_padre, 0), nombre) DO NOTHING;
+
+INSERT INTO region (tipo, nombre)
+SELECT DISTINCT 'MUNICIPIO', pm.municipio FROM puntuacion_municipio pm
+WHERE (SELECT COUNT(*) FROM region m WHERE m.tipo = 'MUNICIPIO' AND m.nombre = pm.municipio) <> 1
+ON CONFLICT (tipo, COALESCE(id_padre, 0), nombre) DO NOTHING;
+
+INSERT INTO puntuacion_region (id_region, id_runner, puntos)
+SELECT p.id_region, pp.id_runner, pp.puntos
+FROM puntuacion_pais pp JOIN region p ON p.tipo = 'PAIS' AND p.nombre = pp.pais
+ON CONFLICT (id_region, id_runner) DO UPDATE SET puntos = puntuacion_region.puntos + EXCLUDED.puntos;
+
+INSERT INTO puntuacion_region (id_region, id_runner, puntos)
+SELECT m.id_region, pm.id_runner, pm.puntos
+FROM puntuacion_municipio pm
+CROSS JOIN LATERAL (
+    SELECT id_region FROM region
+    WHERE tipo = 'MUNICIPIO' AND nombre = pm.municipio
+    ORDER BY id_padre IS NOT NULL, id_region LIMIT 1
+) m
+ON CONFLICT (id_region, id_runner) DO UPDATE SET puntos = puntuacion_region.puntos + EXCLUDED.puntos;
+
+DROP TABLE IF EXISTS puntuacion_pais;
+DROP TABLE IF EXISTS puntuacion_municipio;
@@ -0,0 +1,15 @@
+-- La versión de una zona pasa a ser el id de la transacción que la cambió (xid8) en vez de un
+-- número de secuencia. /zonas/mapa/cambios solo devuelve versiones por debajo del xmin de su
+-- instantánea (todas esas transacciones ya terminaron y ninguna nueva puede quedar por debajo),
+-- así el lector no se salta cambios sin que los escritores se esperen entre sí con un candado.
+
+ALTER TABLE zona ALTER COLUMN version SET DEFAULT (pg_current_xact_id()::text)::bigint;
+
+-- Las versiones de la secuencia que queden por encima de los xid actuales taparían cambios nuevos
+UPDATE zona SET version = 1 WHERE version >= (pg_current_xact_id()::text)::bigint;
+
+DROP SEQUENCE IF EXISTS zona_version_seq;
+
+-- Una transacción cambia muchas zonas con la misma versión: se pagina por (version, id_zona)
+CREATE INDEX IF NOT EXISTS idx_zona_version_zona ON zona (version, id_zona);
+DROP INDEX IF EXISTS idx_zona_version;
@@ -0,0 +1,5 @@
+-- Eventos de la bandeja cuyos puntos ya están en los marcadores: los marca
+-- 'reconstruir-clasificaciones' (que cuenta sus capturas desde captura_zona) para que el
+-- trabajador aplique el resto de efectos sin volver a sumar los puntos.
+
+ALTER TABLE bandeja_salida ADD COLUMN IF NOT EXISTS clasificado BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,21 @@
+-- Análisis antitrampas de cada ruta (src/antitrampas.py): las medidas del track y los avisos
+-- (tramos en vehículo, acelerones, repeticiones) que no bastan para rechazar la carrera.
+-- Las rutas con avisos quedan para revisarlas, igual que ruta_sospecha.
+
+CREATE TABLE IF NOT EXISTS ruta_analisis (
+    id_ruta INTEGER PRIMARY KEY,
+    distancia_m REAL NOT NULL,                  -- Haversine de los puntos, sin los saltos
+    duracion_s REAL NOT NULL,
+    velocidad_max_kmh REAL NOT NULL,
+    velocidad_sostenida_kmh REAL NOT NULL,
+    aceleracion_max REAL NOT NULL,
+    saltos INTEGER NOT NULL,
+    acelerones INTEGER NOT NULL,
+    repetidas REAL NOT NULL,                    -- Fracción de puntos con coordenadas repetidas
+    avisos TEXT[] NOT NULL DEFAULT '{}',
+    revisada BOOLEAN NOT NULL DEFAULT FALSE,
+    creado_en TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ruta_analisis_avisos ON ruta_analisis (creado_en)
+    WHERE cardinality(avisos) > 0 AND NOT revisada;
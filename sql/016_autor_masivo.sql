@@ -0,0 +1,11 @@
+-- Autores con actividades sin difundir (más de FEED_UMBRAL_DIFUSION seguidores al publicar,
+-- src/feed.py). El feed solo busca al vuelo en 'actividad' las cuentas seguidas que están
+-- aquí, en vez de sondear una por una todas las que sigue el lector.
+
+CREATE TABLE IF NOT EXISTS autor_masivo (
+    id_runner INTEGER PRIMARY KEY
+);
+
+INSERT INTO autor_masivo (id_runner)
+SELECT DISTINCT id_runner FROM actividad WHERE NOT difundida
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,11 @@
+-- Revocación de tokens que sobrevive a reinicios y vale en todos los workers (src/dependencies.py).
+-- runner.token_valido_desde: los tokens con 'iat' anterior no valen (cambio de contraseña).
+-- token_revocado: tokens concretos cerrados con /auth/logout, hasta que caducan.
+
+ALTER TABLE runner ADD COLUMN IF NOT EXISTS token_valido_desde DOUBLE PRECISION;
+
+CREATE TABLE IF NOT EXISTS token_revocado (
+    huella BYTEA PRIMARY KEY,            -- sha256 del token
+    expira DOUBLE PRECISION NOT NULL     -- 'exp' del token (segundos Unix)
+);
+CREATE INDEX IF NOT EXISTS idx_token_revocado_expira ON token_revocado (expira);
@@ -0,0 +1,123 @@
+import numpy as np
+
+# --- ANTITRAMPAS SOBRE LOS PUNTOS GPS ---
+# El resumen de la carrera (distancia_km, tiempo_segundos) lo manda la app y se puede
+# inventar. Aquí se mira el track entero en una sola pasada vectorizada (unos pocos ms para
+# 10k puntos, ver benchmarks/bench_antitrampas.py), antes de tocar la base de datos:
+#   - distancia real (haversine por tramo, sin contar los saltos imposibles)
+#   - teletransportes: tramos a más de VELOCIDAD_SALTO_KMH y de más de SALTO_MIN_M
+#   - tramos en vehículo: más de VELOCIDAD_MAX_KMH de media durante VENTANA_SOSTENIDA_S
+#   - acelerones imposibles para una persona corriendo
+#   - tiempo que va hacia atrás
+#   - tracks repetidos o fabricados: las mismas coordenadas exactas otra vez (una vuelta
+#     reenviada en bucle) o pasos idénticos en distancia y tiempo (generados por programa)
+# Un pico suelto del GPS (ida y vuelta) son dos saltos: por eso se toleran MAX_SALTOS.
+# Solo el tiempo hacia atrás y los teletransportes son imposibles con un GPS de verdad y van a
+# 'rechazos'; el resto (vehículo, acelerones, repeticiones) también sale de un móvil con mala
+# señal, así que va a 'avisos': la carrera se guarda con su análisis para revisarla.
+
+RADIO_TIERRA_M = 6371000.0
+VELOCIDAD_MAX_KMH = 35.0          # La misma que el control de velocidad media
+VENTANA_SOSTENIDA_S = 60.0
+VELOCIDAD_SALTO_KMH = 200.0
+SALTO_MIN_M = 100.0
+MAX_SALTOS = 2
+ACELERACION_MAX = 10.0            # m/s²; un sprint de élite no pasa de ~5
+MAX_ACELERONES = 0.05             # Fracción de tramos
+MIN_TRAMOS_PATRON = 120           # Por debajo no hay muestra para hablar de repeticiones
+MAX_REPETIDAS = 0.2               # Fracción de puntos en movimiento que ya habían salido antes
+MIN_VARIACION = 0.02              # Coeficiente de variación mínimo de los pasos de un GPS real
+ESCALA_GRADOS = 1e6               # Rejilla para comparar coordenadas (la de formato_track)
+
+
+def distancias_tramos(lats, lons):
+    """Metros de cada tramo entre puntos consecutivos (haversine)."""
+    la, lo = np.radians(lats), np.radians(lons)
+    a = np.sin(np.diff(la) / 2) ** 2 + np.cos(la[:-1]) * np.cos(la[1:]) * np.sin(np.diff(lo) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _variacion(valores):
+    media = valores.mean()
+    return valores.std() / media if media > 0 else 0.0
+
+
+def _fraccion_repetidas(lats, lons, moviendose):
+    """Fracción de puntos (sin contar los del GPS parado) cuyas coordenadas exactas ya habían salido."""
+    # Latitud y longitud en punto fijo caben en 29 bits cada una: una sola clave int64
+    claves = (np.rint(lats * ESCALA_GRADOS).astype(np.int64) + (1 << 28)) << 32
+    claves |= np.rint(lons * ESCALA_GRADOS).astype(np.int64) + (1 << 28)
+    claves = np.sort(claves[np.concatenate(([True], moviendose))])
+    return np.count_nonzero(claves[1:] == claves[:-1]) / len(claves)
+
+
+def analizar(lats, lons, segundos):
+    """
+    Análisis de un track (arrays alineados, en orden de 'orden'; segundos desde el primer punto).
+    Devuelve un dict con la distancia real, las medidas, 'rechazos' (lo que hace imposible
+    la carrera) y 'avisos' (lo sospechoso); las dos listas vacías si parece legítima.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    t = np.asarray(segundos, dtype=np.float64)
+    resultado = {"puntos": len(lats), "distancia_m": 0.0, "duracion_s": 0.0, "velocidad_max_kmh": 0.0,
+                 "velocidad_sostenida_kmh": 0.0, "aceleracion_max": 0.0, "saltos": 0, "retrocesos": 0,
+                 "acelerones": 0, "repetidas": 0.0, "rechazos": [], "avisos": []}
+    if len(lats) < 2:
+        return resultado
+    rechazos, avisos = resultado["rechazos"], resultado["avisos"]
+
+    d = distancias_tramos(lats, lons)
+    dt = np.diff(t)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Tramos sin tiempo (dt <= 0) con movimiento salen a velocidad infinita
+        v = np.where(dt > 0, d / dt, np.where(d > 0, np.inf, 0.0))
+    saltos = (v * 3.6 > VELOCIDAD_SALTO_KMH) & (d > SALTO_MIN_M)
+    validos = ~saltos
+    d_validos = np.where(validos, d, 0.0)
+
+    resultado["distancia_m"] = float(d_validos.sum())
+    resultado["duracion_s"] = float(t[-1] - t[0])
+    resultado["saltos"] = int(saltos.sum())
+    resultado["retrocesos"] = int((dt < 0).sum())
+    if validos.any():
+        resultado["velocidad_max_kmh"] = float(np.nanmax(np.where(validos & np.isfinite(v), v, 0.0)) * 3.6)
+
+    if resultado["retrocesos"]:
+        rechazos.append(f"El tiempo va hacia atrás en {resultado['retrocesos']} puntos")
+    if resultado["saltos"] > MAX_SALTOS:
+        rechazos.append(f"{resultado['saltos']} saltos imposibles (teletransporte)")
+
+    # Velocidad media en ventanas de VENTANA_SOSTENIDA_S (solo con el tiempo en orden)
+    if not resultado["retrocesos"] and resultado["duracion_s"] >= VENTANA_SOSTENIDA_S:
+        acumulada = np.concatenate(([0.0], np.cumsum(d_validos)))
+        fin = np.searchsorted(t, t + VENTANA_SOSTENIDA_S)
+        dentro = fin < len(t)
+        ini, fin = np.flatnonzero(dentro), fin[dentro]
+        sostenida = (acumulada[fin] - acumulada[ini]) / (t[fin] - t[ini])
+        resultado["velocidad_sostenida_kmh"] = float(sostenida.max() * 3.6)
+        if resultado["velocidad_sostenida_kmh"] > VELOCIDAD_MAX_KMH:
+            avisos.append(f"Tramo de {VENTANA_SOSTENIDA_S:.0f} s a {resultado['velocidad_sostenida_kmh']:.0f} km/h (vehículo)")
+
+    # Aceleración entre tramos consecutivos; los saltos ya cuentan aparte
+    if len(d) >= 2:
+        v_validos = np.where(validos & np.isfinite(v), v, np.nan)
+        intervalo = np.maximum((dt[:-1] + dt[1:]) / 2, 1.0)   # Por debajo de 1 s manda el ruido del GPS
+        with np.errstate(invalid="ignore"):
+            aceleracion = np.abs(np.diff(v_validos)) / intervalo
+            acelerones = int((aceleracion > ACELERACION_MAX).sum())
+        if not np.isnan(aceleracion).all():
+            resultado["aceleracion_max"] = float(np.nanmax(aceleracion))
+        resultado["acelerones"] = acelerones
+        if acelerones > max(MAX_ACELERONES * len(d), 10):
+            avisos.append(f"{acelerones} cambios de velocidad imposibles")
+
+    # Tracks reenviados o fabricados
+    moviendose = d > 0
+    if moviendose.sum() >= MIN_TRAMOS_PATRON:
+        resultado["repetidas"] = float(_fraccion_repetidas(lats, lons, moviendose))
+        if resultado["repetidas"] > MAX_REPETIDAS:
+            avisos.append(f"El {resultado['repetidas']:.0%} de los puntos repite coordenadas exactas (track reenviado)")
+        elif _variacion(d[moviendose]) < MIN_VARIACION and _variacion(dt[moviendose]) < MIN_VARIACION:
+            avisos.append("Pasos idénticos en distancia y tiempo (track generado)")
+    return resultado
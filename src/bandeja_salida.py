@@ -0,0 +1,185 @@
+import os
+import json
+import asyncio
+import datetime
+from src.database_async import conexion_async
+from src import clasificaciones, motor_logros, feed, cache
+
+# --- BANDEJA DE SALIDA (EFECTOS SECUNDARIOS EN SEGUNDO PLANO) ---
+# Guardar una carrera solo escribe en la petición lo imprescindible: ruta, track, zonas,
+# historial de capturas y UNA fila en bandeja_salida, todo en la misma transacción.
+# Rankings, logros (con sus notificaciones y eventos) y el feed los aplica después un
+# trabajador que vacía la bandeja. Cada evento se aplica y se borra de la bandeja en la
+# misma transacción, así que se aplica exactamente una vez aunque el trabajador se caiga.
+# Si falla se reintenta con espera creciente; tras MAX_INTENTOS queda marcado como muerto.
+#
+# Los trabajadores corren dentro de la app (BANDEJA_TRABAJADORES, 0 = ninguno) o aparte
+# con 'python -m src.cli procesar-bandeja'. Varios a la vez no se pisan (SKIP LOCKED).
+# Tabla en sql/007_bandeja_salida.sql.
+
+NUM_TRABAJADORES = int(os.getenv("BANDEJA_TRABAJADORES", "2"))
+TAM_LOTE = int(os.getenv("BANDEJA_LOTE", "20"))
+ESPERA_VACIA = float(os.getenv("BANDEJA_ESPERA_MS", "500")) / 1000
+MAX_INTENTOS = 10
+MAX_ESPERA_REINTENTO = 600   # Segundos
+
+SQL_ENCOLAR = "INSERT INTO bandeja_salida (tipo, datos) VALUES (%s, %s::jsonb);"
+
+# Los trabajadores cogen en ROW EXCLUSIVE un marcador antes de reclamar: así
+# clasificaciones.reconstruir (que lo pide en EXCLUSIVE) espera a los lotes en curso y
+# frena los nuevos, sin bloquear a las carreras que encolan
+SQL_TURNO_MARCADORES = "LOCK TABLE puntuacion_runner IN ROW EXCLUSIVE MODE;"
+
+SQL_RECLAMAR = """
+    SELECT id_evento, tipo, datos, intentos, clasificado FROM bandeja_salida
+    WHERE NOT muerto AND disponible_en <= NOW()
+    ORDER BY disponible_en, id_evento
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED;
+"""
+
+SQL_FALLO = """
+    UPDATE bandeja_salida SET
+        intentos = intentos + 1,
+        ultimo_error = %s,
+        disponible_en = NOW() + make_interval(secs => %s),
+        muerto = intentos + 1 >= %s
+    WHERE id_evento = %s;
+"""
+
+SQL_ESTADO = """
+    SELECT COUNT(*) FILTER (WHERE NOT muerto),
+           COUNT(*) FILTER (WHERE NOT muerto AND intentos > 0),
+           COUNT(*) FILTER (WHERE muerto),
+           COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(creado_en) FILTER (WHERE NOT muerto)), 0)
+    FROM bandeja_salida;
+"""
+
+_tareas = []
+_stats = {"procesados": 0, "fallos": 0, "muertos": 0}
+
+
+async def encolar(cur, tipo, datos):
+    """Deja un evento en la bandeja dentro de la transacción de 'cur' (un cursor de database_async)."""
+    await cur.execute(SQL_ENCOLAR, (tipo, json.dumps(datos)))
+
+
+# --- EFECTOS DE CADA TIPO DE EVENTO ---
+async def _efectos_carrera(cur, d, con_puntos=True):
+    puntos = d["puntos"]
+    if con_puntos:
+        await clasificaciones.acumular_puntos(cur, d["id_runner"], d["celdas"], puntos, d["regiones"])
+    await motor_logros.registrar_actividad(
+        cur, d["id_runner"],
+        capturas=len(d["celdas"]), nuevas=d["nuevas"], robos=d["robadas"], defensas=d["defendidas"],
+        carreras=1, distancia_metros=d["distancia_metros"], dia=datetime.date.fromisoformat(d["dia"])
+    )
+    await feed.publicar_carrera(
+        cur, d["id_runner"], d["id_ruta"], d["distancia_metros"], d["duracion_segundos"],
+        d["nuevas"], d["robadas"], d["defendidas"], sum(puntos)
+    )
+
+
+async def _efectos_captura(cur, d, con_puntos=True):
+    if con_puntos:
+        await clasificaciones.acumular_puntos(cur, d["id_runner"], [d["id_zona"]], [d["puntos"]], [d["id_region"]])
+    tipo = d["tipo_captura"]
+    await motor_logros.registrar_actividad(
+        cur, d["id_runner"], capturas=1,
+        nuevas=int(tipo == "NUEVA"), robos=int(tipo == "ROBO"), defensas=int(tipo == "DEFENSA")
+    )
+
+
+MANEJADORES = {
+    "carrera": _efectos_carrera,
+    "captura": _efectos_captura,
+}
+
+
+# --- TRABAJADOR ---
+async def procesar_lote(tam_lote=TAM_LOTE):
+    """
+    Reclama hasta 'tam_lote' eventos y aplica cada uno en su propio SAVEPOINT: los que van
+    bien se borran, los que fallan se reprograman. Un commit por lote. Devuelve cuántos reclamó.
+    """
+    async with conexion_async() as conn:
+        cur = conn.cursor()
+        try:
+            await cur.execute(SQL_TURNO_MARCADORES)
+            await cur.execute(SQL_RECLAMAR, (tam_lote,))
+            eventos = await cur.fetchall()
+            aplicados = 0
+            for id_evento, tipo, datos, intentos, clasificado in eventos:
+                if isinstance(datos, str):
+                    datos = json.loads(datos)
+                await cur.execute("SAVEPOINT evento;")
+                try:
+                    manejador = MANEJADORES.get(tipo)
+                    if manejador is None:
+                        raise ValueError(f"Tipo de evento desconocido: {tipo}")
+                    # Los puntos de los eventos marcados ya los contó una reconstrucción
+                    await manejador(cur, datos, con_puntos=not clasificado)
+                    await cur.execute("DELETE FROM bandeja_salida WHERE id_evento = %s;", (id_evento,))
+                    await cur.execute("RELEASE SAVEPOINT evento;")
+                    aplicados += 1
+                except Exception as e:
+                    await cur.execute("ROLLBACK TO SAVEPOINT evento;")
+                    espera = min(2 ** intentos, MAX_ESPERA_REINTENTO)
+                    await cur.execute(SQL_FALLO, (str(e)[:500], espera, MAX_INTENTOS, id_evento))
+                    _stats["fallos"] += 1
+                    if intentos + 1 >= MAX_INTENTOS:
+                        _stats["muertos"] += 1
+                        print(f"❌ Evento {id_evento} ({tipo}) descartado tras {MAX_INTENTOS} intentos: {e}")
+            await conn.commit()
+            await cur.close()
+        except Exception:
+            await conn.rollback()
+            raise
+    _stats["procesados"] += aplicados
+    if aplicados:
+        cache.cache_global.invalidar("ranking:")
+    return len(eventos)
+
+
+async def trabajar(hasta_vaciar=False):
+    """Bucle de un trabajador. Con hasta_vaciar=True acaba cuando no queda nada disponible."""
+    while True:
+        try:
+            reclamados = await procesar_lote()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Error vaciando la bandeja de salida: {e}")
+            reclamados = 0
+        if reclamados == 0:
+            if hasta_vaciar:
+                return
+            await asyncio.sleep(ESPERA_VACIA)
+
+
+def iniciar():
+    """Arranca NUM_TRABAJADORES tareas en el bucle de la app (lo llama el ciclo de vida)."""
+    if _tareas:
+        return
+    for _ in range(NUM_TRABAJADORES):
+        _tareas.append(asyncio.get_running_loop().create_task(trabajar()))
+
+
+async def detener():
+    for tarea in _tareas:
+        tarea.cancel()
+    await asyncio.gather(*_tareas, return_exceptions=True)
+    _tareas.clear()
+
+
+async def estadisticas():
+    """Pendientes, reintentando, muertos y retraso (segundos desde el evento pendiente más antiguo)."""
+    async with conexion_async() as conn:
+        cur = conn.cursor()
+        await cur.execute(SQL_ESTADO)
+        pendientes, reintentando, muertos, retraso = await cur.fetchone()
+        await cur.close()
+    datos = dict(_stats)
+    datos.update({"pendientes": pendientes, "reintentando": reintentando, "muertos_en_tabla": muertos,
+                  "retraso_s": round(float(retraso), 3), "trabajadores_locales": len(_tareas)})
+    return datos
@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+from src.database import conexion
+from src.database_async import conexion_async
+from src import motor_h3
+
+# --- CACHÉ EN MEMORIA CON TTL ---
+# Para endpoints públicos que devuelven lo mismo a todo el mundo (rankings, catálogo,
+# temporada, mapa). Cada entrada vive 'ttl' segundos y, pasado ese tiempo, aún se sirve
+# 'obsoleto' segundos más mientras UN solo hilo la recalcula en segundo plano.
+# Si llegan muchos fallos a la vez para la misma clave, solo uno va a la base de datos
+# y el resto espera su resultado (single-flight).
+# Los endpoints 'async def' usan obtener_async()/consultar_async(): misma caché, pero se espera
+# sin bloquear el bucle de eventos. Una misma clave se usa siempre desde uno de los dos lados.
+
+MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "1000"))
+ESPERA_MAXIMA = float(os.getenv("CACHE_ESPERA_MAXIMA", "10"))  # Segundos que un hilo espera al que está calculando
+
+
+class _Entrada:
+    __slots__ = ("valor", "caduca", "obsoleto_hasta")
+
+    def __init__(self, valor, caduca, obsoleto_hasta):
+        self.valor = valor
+        self.caduca = caduca
+        self.obsoleto_hasta = obsoleto_hasta
+
+
+class _Vuelo:
+    """Cálculo en curso de una clave: los demás hilos (o tareas) esperan su resultado."""
+    __slots__ = ("evento", "valor", "error", "invalidado")
+
+    def __init__(self, asincrono=False):
+        self.evento = asyncio.Event() if asincrono else threading.Event()
+        self.valor = None
+        self.error = None
+        self.invalidado = None   # None, "suave" o "duro"
+
+
+class CacheTTL:
+    def __init__(self, max_entradas=MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()   # clave -> _Entrada (orden LRU: la última es la más reciente)
+        self._vuelos = {}             # clave -> _Vuelo
+        self._tareas = set()          # Recálculos async en segundo plano (referencia para que no los recoja el GC)
+        self._rangos = {}             # clave -> (los, his): rangos de ids de celda que cubre (ver registrar_rangos)
+        self._lock = threading.Lock()
+        self._stats = {"aciertos": 0, "aciertos_obsoletos": 0, "fallos": 0, "esperas": 0,
+                       "recalculos": 0, "errores": 0, "expulsiones": 0, "invalidaciones": 0}
+
+    def obtener(self, clave, cargador, ttl, obsoleto=0):
+        """Devuelve el valor de 'clave'; si no está (o ha caducado) lo calcula con cargador()."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and ahora < entrada.caduca:
+                self._datos.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada.valor
+
+            if entrada is not None and ahora < entrada.obsoleto_hasta:
+                # Servimos lo viejo y, si nadie lo está haciendo ya, recalculamos por detrás
+                self._datos.move_to_end(clave)
+                self._stats["aciertos_obsoletos"] += 1
+                if clave not in self._vuelos:
+                    vuelo = self._vuelos[clave] = _Vuelo()
+                    threading.Thread(target=self._calcular, args=(clave, cargador, ttl, obsoleto, vuelo),
+                                     daemon=True).start()
+                return entrada.valor
+
+            vuelo = self._vuelos.get(clave)
+            soy_lider = vuelo is None
+            if soy_lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self._stats["fallos"] += 1
+            else:
+                self._stats["esperas"] += 1
+
+        if soy_lider:
+            self._calcular(clave, cargador, ttl, obsoleto, vuelo)
+        elif not vuelo.evento.wait(ESPERA_MAXIMA):
+            # El que calculaba se ha atascado: no dejamos colgada la petición
+            return cargador()
+
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor
+
+    async def obtener_async(self, clave, cargador, ttl, obsoleto=0):
+        """Como obtener(), pero 'cargador' es una función async y las esperas no bloquean."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and ahora < entrada.caduca:
+                self._datos.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada.valor
+
+            if entrada is not None and ahora < entrada.obsoleto_hasta:
+                self._datos.move_to_end(clave)
+                self._stats["aciertos_obsoletos"] += 1
+                if clave not in self._vuelos:
+                    vuelo = self._vuelos[clave] = _Vuelo(asincrono=True)
+                    tarea = asyncio.create_task(self._calcular_async(clave, cargador, ttl, obsoleto, vuelo))
+                    self._tareas.add(tarea)
+                    tarea.add_done_callback(self._tareas.discard)
+                return entrada.valor
+
+            vuelo = self._vuelos.get(clave)
+            soy_lider = vuelo is None
+            if soy_lider:
+                vuelo = self._vuelos[clave] = _Vuelo(asincrono=True)
+                self._stats["fallos"] += 1
+            else:
+                self._stats["esperas"] += 1
+
+        if soy_lider:
+            await self._calcular_async(clave, cargador, ttl, obsoleto, vuelo)
+        else:
+            try:
+                await asyncio.wait_for(vuelo.evento.wait(), ESPERA_MAXIMA)
+            except asyncio.TimeoutError:
+                return await cargador()
+
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor
+
+    def _calcular(self, clave, cargador, ttl, obsoleto, vuelo):
+        try:
+            vuelo.valor = cargador()
+        except Exception as e:
+            vuelo.error = e
+        self._guardar(clave, ttl, obsoleto, vuelo)
+
+    async def _calcular_async(self, clave, cargador, ttl, obsoleto, vuelo):
+        try:
+            vuelo.valor = await cargador()
+        except Exception as e:
+            vuelo.error = e
+        self._guardar(clave, ttl, obsoleto, vuelo)
+
+    def _guardar(self, clave, ttl, obsoleto, vuelo):
+        """Apunta el resultado del vuelo (si sigue siendo válido) y despierta a los que esperan."""
+        with self._lock:
+            self._vuelos.pop(clave, None)
+            if vuelo.error is not None:
+                self._stats["errores"] += 1
+            else:
+                self._stats["recalculos"] += 1
+            if vuelo.error is None and vuelo.invalidado != "duro":
+                ahora = time.monotonic()
+                # Si invalidaron la clave mientras calculábamos, lo guardamos ya caducado
+                caduca = ahora if vuelo.invalidado else ahora + ttl
+                self._datos[clave] = _Entrada(vuelo.valor, caduca, caduca + obsoleto)
+                self._datos.move_to_end(clave)
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+                    self._stats["expulsiones"] += 1
+        vuelo.evento.set()
+
+    def invalidar(self, prefijo="", duro=False):
+        """
+        Invalida las claves que empiezan por 'prefijo'.
+        Normal: quedan caducadas pero se pueden servir como obsoletas mientras se recalculan.
+        duro=True: se borran y la siguiente lectura espera al dato nuevo.
+        """
+        with self._lock:
+            self._invalidar(lambda clave: clave.startswith(prefijo), duro)
+
+    def registrar_rangos(self, clave, rangos):
+        """Apunta qué rangos [lo, hi] de ids de celda cubre 'clave', para invalidar_celdas()."""
+        with self._lock:
+            self._rangos[clave] = (np.array([lo for lo, _ in rangos], dtype=np.int64),
+                                   np.array([hi for _, hi in rangos], dtype=np.int64))
+
+    def invalidar_celdas(self, prefijo, celdas, duro=False):
+        """
+        Como invalidar(prefijo), pero solo caen las claves cuyos rangos registrados contienen
+        alguna de 'celdas'. Las claves del prefijo sin rangos registrados caen siempre.
+        """
+        celdas = np.unique(np.fromiter(celdas, dtype=np.int64))
+        if not len(celdas):
+            return
+
+        def afectada(clave):
+            rangos = self._rangos.get(clave)
+            if rangos is None:
+                return True
+            los, his = rangos
+            # Primera celda >= lo de cada rango: el rango la contiene si además es <= hi
+            i = np.searchsorted(celdas, los)
+            dentro = i < len(celdas)
+            return bool(np.any(celdas[i[dentro]] <= his[dentro]))
+
+        with self._lock:
+            # De paso se olvidan los rangos de las claves que ya no están
+            for clave in [c for c in self._rangos if c not in self._datos and c not in self._vuelos]:
+                del self._rangos[clave]
+            self._invalidar(lambda clave: clave.startswith(prefijo) and afectada(clave), duro)
+
+    def _invalidar(self, condicion, duro):
+        # Con self._lock cogido
+        ahora = time.monotonic()
+        for clave in [c for c in self._datos if condicion(c)]:
+            entrada = self._datos[clave]
+            if duro:
+                del self._datos[clave]
+            elif entrada.caduca > ahora:
+                # Caduca ya, pero conserva su margen de "obsoleto" desde este momento
+                entrada.obsoleto_hasta = ahora + (entrada.obsoleto_hasta - entrada.caduca)
+                entrada.caduca = ahora
+        for clave, vuelo in self._vuelos.items():
+            if condicion(clave) and vuelo.invalidado != "duro":
+                vuelo.invalidado = "duro" if duro else "suave"
+        self._stats["invalidaciones"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos["entradas"] = len(self._datos)
+            datos["max_entradas"] = self.max_entradas
+            datos["calculando"] = len(self._vuelos)
+        consultas = datos["aciertos"] + datos["aciertos_obsoletos"] + datos["fallos"] + datos["esperas"]
+        datos["ratio_aciertos"] = round((datos["aciertos"] + datos["aciertos_obsoletos"]) / consultas, 4) if consultas else 0.0
+        return datos
+
+
+# --- CACHÉ GLOBAL DEL PROCESO ---
+cache_global = CacheTTL()
+
+
+def consultar(clave, funcion, ttl, obsoleto=0):
+    """Cachea funcion(conn); solo se pide conexión al pool cuando de verdad hay que ir a la base de datos."""
+    def cargador():
+        with conexion() as conn:
+            return funcion(conn)
+    return cache_global.obtener(clave, cargador, ttl, obsoleto)
+
+
+def clave_tesela(padre):
+    """Clave de caché de la tesela de una celda padre (con ':' final para que el prefijo sea exacto)."""
+    return f"tesela:{padre}:"
+
+
+async def consultar_async(clave, funcion, ttl, obsoleto=0, rangos=None):
+    """
+    consultar() para endpoints async: 'funcion' es async y recibe una ConexionAsync.
+    'rangos': los [lo, hi] de ids de celda que cubre la clave, si solo depende de esas zonas.
+    """
+    if rangos is not None:
+        cache_global.registrar_rangos(clave, rangos)
+    async def cargador():
+        async with conexion_async() as conn:
+            return await funcion(conn)
+    return await cache_global.obtener_async(clave, cargador, ttl, obsoleto)
+
+
+def invalidar_teselas(celdas_cambiadas):
+    """Invalida las teselas que contienen alguna de esas celdas (las que han cambiado de dueño)."""
+    celdas_cambiadas = list(celdas_cambiadas)
+    if celdas_cambiadas:
+        for padre in motor_h3.padres(celdas_cambiadas, motor_h3.RESOLUCION_TESELA):
+            cache_global.invalidar(clave_tesela(padre))
+
+
+def invalidar_tras_capturas(celdas, celdas_cambiadas=()):
+    """
+    Lo llaman guardar_carrera y registrar_captura tras el commit con las celdas capturadas.
+    Del mapa solo caen las vistas que cubren alguna de 'celdas' (y el mapa entero), y de las
+    teselas las que contienen alguna celda que ha cambiado de dueño; en el resto de workers (y
+    tras el decaimiento) las teselas las invalida el evento "zonas" (src/eventos.py).
+    Los rankings los invalida el trabajador de la bandeja de salida al sumar los puntos.
+    """
+    cache_global.invalidar_celdas("mapa:", celdas)
+    invalidar_teselas(celdas_cambiadas)
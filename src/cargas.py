@@ -0,0 +1,92 @@
+import numpy as np
+
+# --- SUBIDA DE CARRERAS POR TROZOS ---
+# Una maratón a 1 Hz son decenas de miles de PuntoGPS: en un solo JSON pesa megas, Pydantic
+# lo valida entero en memoria y si el móvil reintenta se crea otra ruta. Con sesiones:
+#   1. POST /carreras/cargas                      -> abre (o reabre) la sesión 'clave'
+#   2. POST /carreras/cargas/{clave}/puntos       -> cada trozo va directo a carga_punto
+#   3. POST /carreras/cargas/{clave}/finalizar    -> ruta + track + territorio, una sola vez
+# Los puntos se identifican por 'orden': reenviar un trozo no duplica nada, y finalizar dos
+# veces devuelve el mismo resultado guardado. Tablas en sql/008_carga_carrera.sql.
+
+MAX_PUNTOS_TROZO = 5000
+MAX_LARGO_CLAVE = 64
+
+SQL_ABRIR = """
+    INSERT INTO carga_sesion (id_runner, clave) VALUES (%s, %s)
+    ON CONFLICT (id_runner, clave) DO NOTHING;
+"""
+
+SQL_ESTADO = """
+    SELECT s.estado, s.id_ruta, s.resultado,
+           (SELECT COUNT(*) FROM carga_punto p WHERE p.id_runner = s.id_runner AND p.clave = s.clave),
+           (SELECT MAX(orden) FROM carga_punto p WHERE p.id_runner = s.id_runner AND p.clave = s.clave)
+    FROM carga_sesion s WHERE s.id_runner = %s AND s.clave = %s;
+"""
+
+# Bloquea la sesión hasta el commit del trozo: finalizar (FOR UPDATE) espera a los trozos en curso
+SQL_SESION_PARA_TROZO = """
+    UPDATE carga_sesion SET actualizada_en = NOW()
+    WHERE id_runner = %s AND clave = %s
+    RETURNING estado;
+"""
+
+SQL_INSERTAR_PUNTOS = """
+    INSERT INTO carga_punto (id_runner, clave, orden, latitud, longitud, instante) VALUES %s
+    ON CONFLICT (id_runner, clave, orden) DO NOTHING
+"""
+
+SQL_SESION_PARA_FINALIZAR = """
+    SELECT estado, resultado FROM carga_sesion WHERE id_runner = %s AND clave = %s FOR UPDATE;
+"""
+
+SQL_PUNTOS = """
+    SELECT latitud, longitud, EXTRACT(EPOCH FROM instante - MIN(instante) OVER ())::float8
+    FROM carga_punto WHERE id_runner = %s AND clave = %s ORDER BY orden;
+"""
+
+# Con TRACK_COMPACTO=0 el track se copia dentro del servidor, fila a fila
+SQL_COPIAR_TRACK = """
+    INSERT INTO track_point (id_ruta, latitud, longitud, orden, timestamp_relativo)
+    SELECT %s, latitud, longitud, orden, EXTRACT(EPOCH FROM instante - MIN(instante) OVER ())
+    FROM carga_punto WHERE id_runner = %s AND clave = %s
+    ORDER BY orden;
+"""
+
+SQL_CERRAR = """
+    UPDATE carga_sesion SET estado = 'FINALIZADA', id_ruta = %s, resultado = %s::jsonb, actualizada_en = NOW()
+    WHERE id_runner = %s AND clave = %s;
+"""
+
+SQL_BORRAR_PUNTOS = "DELETE FROM carga_punto WHERE id_runner = %s AND clave = %s;"
+
+# Limpieza: sesiones sin tocar desde hace 'horas' (abiertas abandonadas o ya finalizadas)
+SQL_LIMPIAR_PUNTOS = """
+    DELETE FROM carga_punto p USING carga_sesion s
+    WHERE p.id_runner = s.id_runner AND p.clave = s.clave AND s.actualizada_en < NOW() - make_interval(hours => %s);
+"""
+SQL_LIMPIAR_SESIONES = "DELETE FROM carga_sesion WHERE actualizada_en < NOW() - make_interval(hours => %s);"
+
+
+def filas_trozo(id_runner, clave, puntos):
+    """Filas de carga_punto para un trozo de PuntoGPS."""
+    for p in puntos:
+        yield (id_runner, clave, p.orden, p.latitud, p.longitud, p.timestamp)
+
+
+async def puntos(cur, id_runner, clave):
+    """(lats, lons, segundos desde el primero) de todos los puntos de la sesión, en orden, como arrays de NumPy."""
+    await cur.execute(SQL_PUNTOS, (id_runner, clave))
+    datos = np.array(await cur.fetchall(), dtype=np.float64).reshape(-1, 3)
+    return datos[:, 0], datos[:, 1], datos[:, 2]
+
+
+def limpiar(conn, horas):
+    """Borra sesiones (y sus puntos) sin actividad desde hace 'horas'. Devuelve cuántas sesiones."""
+    cur = conn.cursor()
+    cur.execute(SQL_LIMPIAR_PUNTOS, (horas,))
+    cur.execute(SQL_LIMPIAR_SESIONES, (horas,))
+    borradas = cur.rowcount
+    conn.commit()
+    cur.close()
+    return borradas
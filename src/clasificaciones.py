@@ -0,0 +1,143 @@
+from src import regiones
+
+# --- MARCADORES PRE-AGREGADOS (RANKINGS) ---
+# En vez de hacer SUM(puntos_ganados) sobre todo el historial de captura_zona en cada
+# llamada a /ranking/*, sumamos los puntos a unas tablas de marcador cada vez que se
+# guarda una captura. Leer el top N es entonces un recorrido de índice de N filas.
+# Tablas en sql/001_clasificaciones.sql (y puntuacion_region en sql/012_regiones.sql).
+
+SQL_SUMAR_RUNNER = """
+    INSERT INTO puntuacion_runner (id_runner, puntos) VALUES (%s::int, %s::bigint)
+    ON CONFLICT (id_runner) DO UPDATE SET puntos = puntuacion_runner.puntos + EXCLUDED.puntos;
+"""
+
+# Los puntos van a TODOS los equipos del runner (igual que el JOIN del ranking antiguo)
+SQL_SUMAR_EQUIPO = """
+    INSERT INTO puntuacion_equipo (id_equipo, puntos)
+    SELECT id_equipo, %s::bigint FROM runner_equipo WHERE id_runner = %s
+    ON CONFLICT (id_equipo) DO UPDATE SET puntos = puntuacion_equipo.puntos + EXCLUDED.puntos;
+"""
+
+SQL_SUMAR_TEMPORADA = """
+    INSERT INTO puntuacion_temporada (id_temporada, id_runner, puntos)
+    SELECT id_temporada, %s::int, %s::bigint FROM temporada WHERE NOW() BETWEEN fecha_inicio AND fecha_fin
+    ON CONFLICT (id_temporada, id_runner) DO UPDATE SET puntos = puntuacion_temporada.puntos + EXCLUDED.puntos;
+"""
+
+SQL_SUMAR_EQUIPO_TEMPORADA = """
+    INSERT INTO puntuacion_equipo_temporada (id_temporada, id_equipo, puntos)
+    SELECT t.id_temporada, re.id_equipo, %s::bigint
+    FROM temporada t, runner_equipo re
+    WHERE NOW() BETWEEN t.fecha_inicio AND t.fecha_fin AND re.id_runner = %s
+    ON CONFLICT (id_temporada, id_equipo) DO UPDATE SET puntos = puntuacion_equipo_temporada.puntos + EXCLUDED.puntos;
+"""
+
+# Regiones (src/regiones.py): la de cada captura y todas las que la contienen, ya sumadas
+SQL_SUMAR_REGION = """
+    INSERT INTO puntuacion_region (id_region, id_runner, puntos)
+    SELECT r.id_region, %s::int, r.puntos
+    FROM unnest(%s::int[], %s::bigint[]) AS r(id_region, puntos)
+    ON CONFLICT (id_region, id_runner) DO UPDATE SET puntos = puntuacion_region.puntos + EXCLUDED.puntos;
+"""
+
+
+def puntos_por_region(regiones_celdas, puntos_por_celda):
+    """{id_region: puntos} sumando cada captura a su región y a sus antepasados."""
+    totales = {}
+    for id_region, puntos in zip(regiones_celdas, puntos_por_celda):
+        for id_ancestro in regiones.ancestros(id_region):
+            totales[id_ancestro] = totales.get(id_ancestro, 0) + puntos
+    return totales
+
+
+async def acumular_puntos(cur, id_runner, celdas, puntos_por_celda, regiones_celdas):
+    """
+    Suma a los marcadores los puntos de unas capturas recién insertadas (misma transacción que 'cur',
+    un cursor de database_async).
+    'celdas', 'puntos_por_celda' y 'regiones_celdas' son listas alineadas: la zona capturada, los
+    puntos que dio y su región (src/regiones.py, None si no cae en ninguna).
+    """
+    if not celdas:
+        return
+    total = sum(puntos_por_celda)
+    await cur.execute(SQL_SUMAR_RUNNER, (id_runner, total))
+    await cur.execute(SQL_SUMAR_EQUIPO, (total, id_runner))
+    await cur.execute(SQL_SUMAR_TEMPORADA, (id_runner, total))
+    await cur.execute(SQL_SUMAR_EQUIPO_TEMPORADA, (total, id_runner))
+    totales = puntos_por_region(regiones_celdas, puntos_por_celda)
+    if totales:
+        ids = sorted(totales)
+        await cur.execute(SQL_SUMAR_REGION, (id_runner, ids, [totales[i] for i in ids]))
+
+
+# --- RECONSTRUCCIÓN COMPLETA (backfill) ---
+# Mismas agregaciones que hacían los endpoints antiguos, pero una sola vez.
+# DELETE en vez de TRUNCATE: así los rankings se pueden seguir leyendo mientras tanto
+SQL_RECONSTRUIR = [
+    "DELETE FROM puntuacion_runner;",
+    "DELETE FROM puntuacion_equipo;",
+    "DELETE FROM puntuacion_region;",
+    "DELETE FROM puntuacion_temporada;",
+    "DELETE FROM puntuacion_equipo_temporada;",
+    """
+    INSERT INTO puntuacion_runner (id_runner, puntos)
+    SELECT id_runner, SUM(puntos_ganados) FROM captura_zona GROUP BY id_runner;
+    """,
+    """
+    INSERT INTO puntuacion_equipo (id_equipo, puntos)
+    SELECT re.id_equipo, SUM(cz.puntos_ganados)
+    FROM runner_equipo re JOIN captura_zona cz ON re.id_runner = cz.id_runner
+    GROUP BY re.id_equipo;
+    """,
+    """
+    WITH RECURSIVE cadena (id_region, id_ancestro) AS (
+        SELECT id_region, id_region FROM region
+        UNION ALL
+        SELECT c.id_region, r.id_padre FROM cadena c JOIN region r ON r.id_region = c.id_ancestro
+        WHERE r.id_padre IS NOT NULL
+    )
+    INSERT INTO puntuacion_region (id_region, id_runner, puntos)
+    SELECT c.id_ancestro, cz.id_runner, SUM(cz.puntos_ganados)
+    FROM captura_zona cz JOIN cadena c ON c.id_region = cz.id_region
+    GROUP BY c.id_ancestro, cz.id_runner;
+    """,
+    """
+    INSERT INTO puntuacion_temporada (id_temporada, id_runner, puntos)
+    SELECT t.id_temporada, cz.id_runner, SUM(cz.puntos_ganados)
+    FROM temporada t JOIN captura_zona cz ON cz.fecha_hora BETWEEN t.fecha_inicio AND t.fecha_fin
+    GROUP BY t.id_temporada, cz.id_runner;
+    """,
+    """
+    INSERT INTO puntuacion_equipo_temporada (id_temporada, id_equipo, puntos)
+    SELECT t.id_temporada, re.id_equipo, SUM(cz.puntos_ganados)
+    FROM temporada t
+    JOIN captura_zona cz ON cz.fecha_hora BETWEEN t.fecha_inicio AND t.fecha_fin
+    JOIN runner_equipo re ON re.id_runner = cz.id_runner
+    GROUP BY t.id_temporada, re.id_equipo;
+    """,
+]
+
+
+SQL_MARCAR_CLASIFICADOS = "UPDATE bandeja_salida SET clasificado = TRUE WHERE NOT clasificado;"
+
+
+def reconstruir(conn):
+    """
+    Recalcula todos los marcadores desde captura_zona en una sola transacción.
+    Las capturas ya guardadas cuyos eventos siguen en la bandeja de salida (src/bandeja_salida.py)
+    se cuentan aquí, así que esos eventos se marcan como clasificados en la misma instantánea
+    para que el trabajador no vuelva a sumar sus puntos.
+    """
+    cur = conn.cursor()
+    # Una sola instantánea para leer captura_zona y marcar la bandeja; las carreras que se
+    # confirmen después no se ven aquí y sus eventos siguen sin marcar
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+    # Antes de la primera consulta (la instantánea se toma después): espera a los lotes de la
+    # bandeja en curso, frena los nuevos y bloquea las escrituras incrementales
+    cur.execute("LOCK TABLE puntuacion_runner, puntuacion_equipo, puntuacion_region, "
+                "puntuacion_temporada, puntuacion_equipo_temporada IN EXCLUSIVE MODE;")
+    cur.execute(SQL_MARCAR_CLASIFICADOS)
+    for sql in SQL_RECONSTRUIR:
+        cur.execute(sql)
+    conn.commit()
+    cur.close()
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import pathlib
+from src.database import abrir_conexion_directa, obtener_pool, cerrar_pool
+from src import clasificaciones, motor_logros, notificaciones, bandeja_salida, database_async, cargas, tracks, huellas, territorio, regiones
+
+# --- TAREAS DE MANTENIMIENTO (línea de comandos) ---
+# Uso: python -m src.cli <tarea> [opciones]
+#   migrar                       -> aplica los .sql pendientes de la carpeta sql/
+#   reconstruir-clasificaciones  -> recalcula los marcadores de /ranking/* desde captura_zona
+#   otorgar-logros               -> da con carácter retroactivo los logros ya merecidos (reanudable)
+#   archivar-notificaciones      -> pasa al archivo las notificaciones leídas antiguas, por lotes
+#   procesar-bandeja             -> aplica los efectos pendientes de carreras/capturas (trabajador aparte)
+#   limpiar-cargas               -> borra las subidas por trozos abandonadas o ya antiguas
+#   migrar-tracks                -> pasa los tracks de track_point al formato compacto (ruta_track)
+#   indexar-rutas                -> calcula la huella de las rutas antiguas y busca repetidas
+#   decaer-zonas                 -> recalcula la fuerza de las zonas y neutraliza las abandonadas
+#   cargar-regiones              -> importa países y municipios (GeoJSON) como celdas H3 compactadas
+#   asignar-regiones             -> pone la región a las zonas y capturas antiguas
+
+CARPETA_SQL = pathlib.Path(__file__).resolve().parent.parent / "sql"
+
+
+def migrar(args):
+    """Aplica en orden los ficheros sql/NNN_*.sql que aún no estén en la tabla migracion_aplicada."""
+    conn = abrir_conexion_directa()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migracion_aplicada (
+                nombre TEXT PRIMARY KEY,
+                aplicada_en TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+        cur.execute("SELECT nombre FROM migracion_aplicada")
+        aplicadas = {fila[0] for fila in cur.fetchall()}
+
+        pendientes = [f for f in sorted(CARPETA_SQL.glob("*.sql")) if f.name not in aplicadas]
+        if not pendientes:
+            print("✅ Base de datos al día, no hay migraciones pendientes.")
+        for fichero in pendientes:
+            print(f"➡️  Aplicando {fichero.name}...")
+            # Cada fichero en su propia transacción: si falla, no queda a medias
+            cur.execute(fichero.read_text(encoding="utf-8"))
+            cur.execute("INSERT INTO migracion_aplicada (nombre) VALUES (%s)", (fichero.name,))
+            conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def reconstruir_clasificaciones(args):
+    conn = abrir_conexion_directa()
+    try:
+        clasificaciones.reconstruir(conn)
+        print("✅ Marcadores de ranking reconstruidos.")
+    finally:
+        conn.close()
+
+
+def otorgar_logros(args):
+    # Dos conexiones: la de lectura mantiene abiertos los cursores de servidor mientras la
+    # de escritura confirma lote a lote (un commit en la misma conexión los cerraría)
+    lectura = abrir_conexion_directa()
+    escritura = abrir_conexion_directa()
+    try:
+        runners, otorgados, desde = motor_logros.otorgar_retroactivos(lectura, escritura, args.tam_lote, args.reiniciar)
+        if desde:
+            print(f"↪️  Reanudado desde el runner {desde}")
+        print(f"✅ {runners} runners revisados, {otorgados} logros otorgados.")
+    finally:
+        lectura.close()
+        escritura.close()
+
+
+def archivar_notificaciones(args):
+    conn = abrir_conexion_directa()
+    try:
+        total = notificaciones.archivar(conn, args.dias, args.tam_lote)
+        print(f"✅ {total} notificaciones archivadas.")
+    finally:
+        conn.close()
+
+
+def procesar_bandeja(args):
+    async def ejecutar():
+        obtener_pool()
+        regiones.iniciar()
+        await database_async.iniciar()
+        try:
+            await asyncio.gather(*(bandeja_salida.trabajar(args.una_vez) for _ in range(args.trabajadores)))
+        finally:
+            await database_async.cerrar()
+            cerrar_pool()
+    try:
+        asyncio.run(ejecutar())
+    except KeyboardInterrupt:
+        pass
+    print("✅ Trabajador de la bandeja detenido.")
+
+
+def limpiar_cargas(args):
+    conn = abrir_conexion_directa()
+    try:
+        borradas = cargas.limpiar(conn, args.horas)
+        print(f"✅ {borradas} sesiones de subida borradas.")
+    finally:
+        conn.close()
+
+
+def migrar_tracks(args):
+    conn = abrir_conexion_directa()
+    try:
+        rutas, puntos = tracks.migrar_a_compacto(conn, args.tam_lote, args.tolerancia, not args.conservar_filas)
+        print(f"✅ {rutas} rutas ({puntos} puntos) pasadas a formato compacto.")
+    finally:
+        conn.close()
+
+
+def indexar_rutas(args):
+    conn = abrir_conexion_directa()
+    try:
+        rutas, sospechas = huellas.indexar_rutas(conn, args.tam_lote)
+        print(f"✅ {rutas} rutas indexadas; {sospechas} parejas sospechosas guardadas en ruta_sospecha.")
+    finally:
+        conn.close()
+
+
+def decaer_zonas(args):
+    conn = abrir_conexion_directa()
+    try:
+        actualizadas, neutralizadas = territorio.decaer_zonas(conn, args.tam_lote)
+        print(f"✅ Fuerza recalculada: {actualizadas} zonas debilitadas, {neutralizadas} vuelven a ser neutrales.")
+    finally:
+        conn.close()
+
+
+def cargar_regiones(args):
+    conn = abrir_conexion_directa()
+    try:
+        num_regiones, celdas, omitidos = regiones.importar_geojson(conn, args.fichero, args.resolucion)
+        for nombre, pais in omitidos:
+            print(f"⚠️ {nombre}: país '{pais}' desconocido, se omite")
+        print(f"✅ {num_regiones} regiones importadas en {celdas} celdas; los workers de la API recargan el índice con el aviso.")
+    finally:
+        conn.close()
+
+
+def asignar_regiones(args):
+    conn = abrir_conexion_directa()
+    try:
+        regiones.cargar(conn)
+        zonas, capturas = regiones.asignar(conn, args.tam_lote)
+        print(f"✅ Regiones asignadas: {zonas} zonas y {capturas} capturas. "
+              "Falta 'reconstruir-clasificaciones' para los rankings regionales.")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Tareas de mantenimiento de BattleRun")
+    tareas = parser.add_subparsers(dest="tarea", required=True)
+
+    tareas.add_parser("migrar", help="Aplica las migraciones SQL pendientes").set_defaults(funcion=migrar)
+    tareas.add_parser("reconstruir-clasificaciones",
+                      help="Recalcula los marcadores de ranking desde el historial de capturas"
+                      ).set_defaults(funcion=reconstruir_clasificaciones)
+    logros = tareas.add_parser("otorgar-logros",
+                               help="Otorga los logros que los runners ya merecen según su historial")
+    logros.add_argument("--tam-lote", type=int, default=5000, help="Filas por lectura y runners por transacción")
+    logros.add_argument("--reiniciar", action="store_true", help="Ignora el punto de control y empieza de cero")
+    logros.set_defaults(funcion=otorgar_logros)
+    archivo = tareas.add_parser("archivar-notificaciones",
+                                help="Archiva las notificaciones leídas más antiguas que --dias")
+    archivo.add_argument("--dias", type=int, default=90)
+    archivo.add_argument("--tam-lote", type=int, default=5000, help="Filas por transacción")
+    archivo.set_defaults(funcion=archivar_notificaciones)
+    bandeja = tareas.add_parser("procesar-bandeja",
+                                help="Aplica los efectos pendientes de la bandeja de salida (rankings, logros, feed)")
+    bandeja.add_argument("--trabajadores", type=int, default=bandeja_salida.NUM_TRABAJADORES or 1)
+    bandeja.add_argument("--una-vez", action="store_true", help="Termina cuando la bandeja queda vacía")
+    bandeja.set_defaults(funcion=procesar_bandeja)
+    limpieza = tareas.add_parser("limpiar-cargas", help="Borra las subidas por trozos sin actividad desde hace --horas")
+    limpieza.add_argument("--horas", type=int, default=72)
+    limpieza.set_defaults(funcion=limpiar_cargas)
+    migracion = tareas.add_parser("migrar-tracks", help="Convierte los tracks de track_point a blobs compactos")
+    migracion.add_argument("--tam-lote", type=int, default=200, help="Rutas por transacción")
+    migracion.add_argument("--tolerancia", type=float, default=0.0, help="Douglas-Peucker en metros (0 = sin simplificar)")
+    migracion.add_argument("--conservar-filas", action="store_true", help="No borra las filas de track_point migradas")
+    migracion.set_defaults(funcion=migrar_tracks)
+    indexado = tareas.add_parser("indexar-rutas", help="Calcula las huellas de las rutas antiguas para detectar repetidas")
+    indexado.add_argument("--tam-lote", type=int, default=200, help="Rutas por transacción")
+    indexado.set_defaults(funcion=indexar_rutas)
+    decaimiento = tareas.add_parser("decaer-zonas",
+                                    help="Recalcula la fuerza de las zonas y neutraliza las abandonadas (p.ej. cada hora)")
+    decaimiento.add_argument("--tam-lote", type=int, default=5000, help="Zonas por transacción")
+    decaimiento.set_defaults(funcion=decaer_zonas)
+    carga_regiones = tareas.add_parser("cargar-regiones", help="Importa regiones desde un GeoJSON (nombre, tipo, pais)")
+    carga_regiones.add_argument("fichero")
+    carga_regiones.add_argument("--resolucion", type=int, default=regiones.RESOLUCION_REGION,
+                                help="Resolución H3 de las celdas del borde")
+    carga_regiones.set_defaults(funcion=cargar_regiones)
+    asignacion = tareas.add_parser("asignar-regiones", help="Pone la región a las zonas y capturas (tras cargar-regiones)")
+    asignacion.add_argument("--tam-lote", type=int, default=5000, help="Filas por transacción")
+    asignacion.set_defaults(funcion=asignar_regiones)
+
+    args = parser.parse_args(argv)
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
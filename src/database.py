@@ -1,5 +1,10 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions
+from fastapi import HTTPException
 
 # --- CONFIGURACIÓN LOCAL (Tus datos actuales) ---
 # Estos se usarán cuando trabajes en tu PC
@@ -8,25 +13,279 @@ DB_NAME_LOCAL = "running_db"
 DB_USER_LOCAL = "runner_user"  # <--- Tu usuario
 DB_PASS_LOCAL = "1234"         # <--- Tu contraseña
 
-def get_db_connection():
+# --- CONFIGURACIÓN DEL POOL (se puede ajustar con variables de entorno) ---
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))          # Segundos esperando una conexión libre
+POOL_MAX_USOS = int(os.getenv("DB_POOL_MAX_USOS", "5000"))      # Reciclar tras N préstamos
+POOL_MAX_EDAD = float(os.getenv("DB_POOL_MAX_EDAD", "1800"))     # Reciclar tras M segundos de vida
+POOL_PING_TRAS = float(os.getenv("DB_POOL_PING_TRAS", "30"))     # Hacer SELECT 1 si lleva X segundos parada
+
+
+def abrir_conexion_directa():
+    """Abre una conexión nueva a Postgres (sin pool). La usan el pool y los scripts."""
+    # 1. INTENTAMOS CONECTARNOS A LA NUBE (Render)
+    # Render nos dará esta dirección automáticamente cuando subamos el código
+    database_url = os.getenv("INTERNAL_DATABASE_URL")
+
+    if database_url:
+        # Estamos en la Nube ☁️
+        return psycopg2.connect(database_url)
+
+    # 2. SI NO HAY NUBE, NOS CONECTAMOS AL PC (Local) 💻
+    return psycopg2.connect(
+        host=DB_HOST_LOCAL,
+        database=DB_NAME_LOCAL,
+        user=DB_USER_LOCAL,
+        password=DB_PASS_LOCAL,
+        client_encoding="utf8"
+    )
+
+
+class PoolAgotado(Exception):
+    """No quedó ninguna conexión libre dentro del tiempo de espera."""
+
+
+class _Entrada:
+    """Conexión física del pool con sus datos de reciclaje."""
+    __slots__ = ("conn", "creada", "usos", "ultimo_uso")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.creada = time.monotonic()
+        self.usos = 0
+        self.ultimo_uso = self.creada
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones psycopg2 acotado y seguro entre hilos.
+    - Mantiene al menos 'minimo' conexiones abiertas y nunca más de 'maximo'.
+    - Si está lleno, espera hasta 'timeout' segundos y luego lanza PoolAgotado.
+    - Comprueba la conexión al prestarla y la recicla tras 'max_usos' préstamos o 'max_edad' segundos.
+    """
+
+    def __init__(self, fabrica=abrir_conexion_directa, minimo=POOL_MIN, maximo=POOL_MAX,
+                 timeout=POOL_TIMEOUT, max_usos=POOL_MAX_USOS, max_edad=POOL_MAX_EDAD,
+                 ping_tras=POOL_PING_TRAS):
+        self._fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = max(maximo, 1)
+        self.timeout = timeout
+        self.max_usos = max_usos
+        self.max_edad = max_edad
+        self.ping_tras = ping_tras
+
+        self._libres = []        # Pila LIFO: la más reciente está "caliente"
+        self._prestadas = {}     # id(conn) -> _Entrada
+        self._abiertas = 0       # libres + prestadas + las que se están abriendo
+        self._cerrado = False
+        self._cond = threading.Condition()
+
+        # Estadísticas
+        self._esperas = 0
+        self._tiempo_espera = 0.0
+        self._timeouts = 0
+        self._recicladas = 0
+        self._descartadas = 0
+
+        for _ in range(self.minimo):
+            try:
+                self._libres.append(_Entrada(self._fabrica()))
+                self._abiertas += 1
+            except Exception as e:
+                print(f"❌ Error al precalentar el pool: {e}")
+                break
+
+    # --- PRÉSTAMO ---
+    def prestar(self):
+        """Devuelve una conexión sana. Lanza PoolAgotado si no hay ninguna a tiempo."""
+        limite = time.monotonic() + self.timeout
+        ha_esperado = False
+        inicio_espera = None
+
+        while True:
+            crear = False
+            entrada = None
+            with self._cond:
+                if self._cerrado:
+                    raise PoolAgotado("El pool está cerrado")
+                while not self._libres and self._abiertas >= self.maximo:
+                    if not ha_esperado:
+                        ha_esperado = True
+                        inicio_espera = time.monotonic()
+                        self._esperas += 1
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        self._tiempo_espera += time.monotonic() - inicio_espera
+                        raise PoolAgotado(f"Sin conexiones libres tras {self.timeout}s")
+                    self._cond.wait(restante)
+                    if self._cerrado:
+                        raise PoolAgotado("El pool está cerrado")
+
+                if self._libres:
+                    entrada = self._libres.pop()
+                else:
+                    self._abiertas += 1
+                    crear = True
+
+            if crear:
+                # Abrimos fuera del candado para no bloquear al resto de hilos
+                try:
+                    entrada = _Entrada(self._fabrica())
+                except Exception:
+                    with self._cond:
+                        self._abiertas -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._sana(entrada):
+                self._descartar(entrada)
+                continue
+
+            entrada.usos += 1
+            with self._cond:
+                if ha_esperado:
+                    self._tiempo_espera += time.monotonic() - inicio_espera
+                self._prestadas[id(entrada.conn)] = entrada
+            return entrada.conn
+
+    def devolver(self, conn):
+        """Devuelve la conexión al pool. Deshace lo que no se haya confirmado."""
+        with self._cond:
+            entrada = self._prestadas.pop(id(conn), None)
+        if entrada is None:
+            # No es nuestra (o ya se devolvió): la cerramos sin más
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+
+        ahora = time.monotonic()
+        reciclar = (
+            self._cerrado
+            or conn.closed
+            or entrada.usos >= self.max_usos
+            or ahora - entrada.creada >= self.max_edad
+        )
+        if not reciclar:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                reciclar = True
+
+        if reciclar:
+            if not conn.closed and not self._cerrado:
+                with self._cond:
+                    self._recicladas += 1
+            self._descartar(entrada)
+            return
+
+        entrada.ultimo_uso = ahora
+        with self._cond:
+            self._libres.append(entrada)
+            self._cond.notify()
+
+    def _sana(self, entrada):
+        """Comprobación al prestar: conexión abierta, sin transacción colgada y viva si llevaba tiempo parada."""
+        conn = entrada.conn
+        if conn.closed:
+            return False
+        ahora = time.monotonic()
+        if entrada.usos >= self.max_usos or ahora - entrada.creada >= self.max_edad:
+            with self._cond:
+                self._recicladas += 1
+            return False
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                return False
+            if ahora - entrada.ultimo_uso >= self.ping_tras:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _descartar(self, entrada):
+        try:
+            entrada.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._abiertas -= 1
+            self._descartadas += 1
+            self._cond.notify()
+
+    # --- CICLO DE VIDA ---
+    def cerrar(self):
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+            self._cond.notify_all()
+        for entrada in libres:
+            self._descartar(entrada)
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "en_uso": len(self._prestadas),
+                "libres": len(self._libres),
+                "abiertas": self._abiertas,
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "esperas": self._esperas,
+                "tiempo_espera_total_s": round(self._tiempo_espera, 4),
+                "timeouts": self._timeouts,
+                "recicladas": self._recicladas,
+                "descartadas": self._descartadas,
+            }
+
+
+# --- POOL GLOBAL DEL PROCESO ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool():
+    """Crea el pool la primera vez que se pide (uno por proceso)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones()
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+
+@contextmanager
+def conexion():
+    """Con 'with conexion() as conn:' la conexión vuelve al pool pase lo que pase."""
     try:
-        # 1. INTENTAMOS CONECTARNOS A LA NUBE (Render)
-        # Render nos dará esta dirección automáticamente cuando subamos el código
-        database_url = os.getenv("INTERNAL_DATABASE_URL")
-        
-        if database_url:
-            # Estamos en la Nube ☁️
-            conn = psycopg2.connect(database_url)
-        else:
-            # 2. SI NO HAY NUBE, NOS CONECTAMOS AL PC (Local) 💻
-            conn = psycopg2.connect(
-                host=DB_HOST_LOCAL,
-                database=DB_NAME_LOCAL,
-                user=DB_USER_LOCAL,
-                password=DB_PASS_LOCAL,
-                client_encoding="utf8"
-            )
-        return conn
+        conn = obtener_pool().prestar()
+    except PoolAgotado:
+        raise HTTPException(status_code=503, detail="Servidor saturado, inténtalo de nuevo")
     except Exception as e:
         print(f"❌ Error al conectar a la base de datos: {e}")
-        return None
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Sin conexión DB")
+    try:
+        yield conn
+    finally:
+        obtener_pool().devolver(conn)
+
+
+def obtener_conexion():
+    """Dependencia de FastAPI: presta una conexión y la devuelve al terminar la petición (incluso con errores)."""
+    with conexion() as conn:
+        yield conn
@@ -0,0 +1,235 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from psycopg2.extras import execute_values
+from src import database
+from src.database import PoolAgotado
+
+# --- CAPA DE DATOS ASÍNCRONA ---
+# Los endpoints calientes (carreras, capturas, mapa, rankings, feed) son 'async def' y
+# hablan con la base de datos a través de esta capa, que tiene dos modos:
+#   DB_ASYNC=0 (por defecto) -> "hilos": el pool psycopg2 de siempre; cada sentencia se
+#                               ejecuta en el threadpool y el bucle de eventos queda libre.
+#   DB_ASYNC=1               -> "psycopg3": AsyncConnectionPool de psycopg 3, sin hilos.
+# En los dos modos el cursor tiene la misma interfaz (todo con await) y el SQL es el mismo:
+# psycopg 2 y 3 usan los mismos marcadores %s.
+#
+# Ojo con psycopg 3: los parámetros viajan aparte (no se pegan en el texto), así que un %s
+# sin tipo en un SELECT (p.ej. un None) no sabe qué es. Ponerle siempre su ::tipo.
+
+MODO = "psycopg3" if os.getenv("DB_ASYNC", "0") == "1" else "hilos"
+
+_pool_async = None
+_lock_pool = asyncio.Lock()
+MARCADOR_LOTES = "VALUES %s"
+
+
+# --- CURSORES ---
+class _CursorHilos:
+    """Cursor psycopg2 con métodos awaitables: la parte de red se hace en el threadpool."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    async def execute(self, sql, params=None):
+        await run_in_threadpool(self._cur.execute, sql, params)
+
+    # Los fetch de psycopg2 leen de memoria (el resultado ya llegó con el execute)
+    async def fetchone(self):
+        return self._cur.fetchone()
+
+    async def fetchall(self):
+        return self._cur.fetchall()
+
+    async def copiar(self, sql, buffer):
+        """COPY ... FROM STDIN desde un buffer de texto."""
+        await run_in_threadpool(self._cur.copy_expert, sql, buffer)
+
+    async def insertar_lotes(self, sql, filas, tam_pagina):
+        """INSERT multi-fila por páginas; 'sql' lleva un único 'VALUES %s'."""
+        await run_in_threadpool(execute_values, self._cur, sql, filas, None, tam_pagina)
+
+    async def close(self):
+        self._cur.close()
+
+
+class _CursorPsycopg3:
+    """Cursor asíncrono de psycopg 3 con los mismos métodos extra que _CursorHilos."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    async def execute(self, sql, params=None):
+        await self._cur.execute(sql, params)
+
+    async def fetchone(self):
+        return await self._cur.fetchone()
+
+    async def fetchall(self):
+        return await self._cur.fetchall()
+
+    async def copiar(self, sql, buffer):
+        async with self._cur.copy(sql) as copia:
+            await copia.write(buffer.getvalue())
+
+    async def insertar_lotes(self, sql, filas, tam_pagina):
+        # psycopg 3 no tiene execute_values: executemany con una fila por sentencia va en
+        # modo pipeline (un solo viaje de ida y vuelta por lote)
+        filas = list(filas)
+        if not filas:
+            return
+        sql_fila = _sql_por_fila(sql, len(filas[0]))
+        for i in range(0, len(filas), tam_pagina):
+            await self._cur.executemany(sql_fila, filas[i:i + tam_pagina])
+
+    async def close(self):
+        await self._cur.close()
+
+
+def _sql_por_fila(sql, columnas):
+    """
+    La sentencia de insertar_lotes ('... VALUES %s ...', el formato de execute_values) con
+    un marcador por columna, compuesta con psycopg.sql en vez de reemplazando texto.
+    """
+    from psycopg import sql as psql
+    antes, marcador, despues = sql.partition(MARCADOR_LOTES)
+    if not marcador or MARCADOR_LOTES in despues:
+        raise ValueError(f"insertar_lotes necesita exactamente un '{MARCADOR_LOTES}' en la sentencia")
+    valores = psql.SQL("VALUES ({})").format(psql.SQL(", ").join([psql.Placeholder()] * columnas))
+    return psql.Composed([psql.SQL(antes), valores, psql.SQL(despues)])
+
+
+# --- CONEXIONES ---
+class ConexionAsync:
+    """Conexión prestada con cursor(), commit() y rollback() awaitables en los dos modos."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        if MODO == "psycopg3":
+            return _CursorPsycopg3(self.conn.cursor())
+        return _CursorHilos(self.conn.cursor())
+
+    async def commit(self):
+        if MODO == "psycopg3":
+            await self.conn.commit()
+        else:
+            await run_in_threadpool(self.conn.commit)
+
+    async def rollback(self):
+        if MODO == "psycopg3":
+            await self.conn.rollback()
+        else:
+            await run_in_threadpool(self.conn.rollback)
+
+
+def _cadena_conexion():
+    url = os.getenv("INTERNAL_DATABASE_URL")
+    if url:
+        return url
+    return (f"host={database.DB_HOST_LOCAL} dbname={database.DB_NAME_LOCAL} "
+            f"user={database.DB_USER_LOCAL} password={database.DB_PASS_LOCAL} client_encoding=utf8")
+
+
+# --- CICLO DE VIDA ---
+async def iniciar():
+    """
+    Abre el pool asíncrono (solo en modo psycopg3; en modo hilos se usa el pool de database.py).
+    Lo llama el ciclo de vida de la app, o la primera petición si nadie lo ha hecho (tests, scripts).
+    """
+    global _pool_async
+    if MODO != "psycopg3" or _pool_async is not None:
+        return
+    async with _lock_pool:
+        if _pool_async is None:
+            _pool_async = await _abrir_pool()
+
+
+async def _abrir_pool():
+    # Import aquí: psycopg 3 solo hace falta si se activa DB_ASYNC=1
+    from psycopg_pool import AsyncConnectionPool
+    pool = AsyncConnectionPool(
+        _cadena_conexion(),
+        min_size=database.POOL_MIN,
+        max_size=database.POOL_MAX,
+        timeout=database.POOL_TIMEOUT,
+        max_lifetime=database.POOL_MAX_EDAD,
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def cerrar():
+    global _pool_async
+    if _pool_async is not None:
+        await _pool_async.close()
+        _pool_async = None
+
+
+async def _prestar():
+    if MODO == "psycopg3":
+        from psycopg_pool import PoolTimeout
+        if _pool_async is None:
+            await iniciar()
+        try:
+            return await _pool_async.getconn()
+        except PoolTimeout as e:
+            raise PoolAgotado(str(e))
+    return await run_in_threadpool(database.obtener_pool().prestar)
+
+
+async def _devolver(conn):
+    if MODO == "psycopg3":
+        # Las lecturas dejan la transacción abierta: la cerramos aquí (si no, el pool lo
+        # hace igual pero avisando en el log en cada petición)
+        from psycopg.pq import TransactionStatus
+        try:
+            if conn.info.transaction_status == TransactionStatus.INTRANS:
+                await conn.rollback()
+        except Exception:
+            pass
+        await _pool_async.putconn(conn)
+    else:
+        await run_in_threadpool(database.obtener_pool().devolver, conn)
+
+
+@asynccontextmanager
+async def conexion_async():
+    """Con 'async with conexion_async() as conn:' la conexión vuelve al pool pase lo que pase."""
+    try:
+        conn = await _prestar()
+    except PoolAgotado:
+        raise HTTPException(status_code=503, detail="Servidor saturado, inténtalo de nuevo")
+    except Exception as e:
+        print(f"❌ Error al conectar a la base de datos: {e}")
+        raise HTTPException(status_code=500, detail="Sin conexión DB")
+    try:
+        yield ConexionAsync(conn)
+    finally:
+        await _devolver(conn)
+
+
+async def obtener_conexion_async():
+    """Dependencia de FastAPI para endpoints 'async def' (equivalente a obtener_conexion)."""
+    async with conexion_async() as conn:
+        yield conn
+
+
+def estadisticas():
+    datos = {"modo": MODO}
+    if _pool_async is not None:
+        datos.update(_pool_async.get_stats())
+    return datos
@@ -1,41 +1,212 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
 import jwt
 import datetime
+from src import eventos
+from src.database import conexion
 
 # --- CONFIGURACIÓN DE SEGURIDAD ---
 SECRET_KEY = "super_secreto_clave_maestra_battlerun" 
 ALGORITHM = "HS256"
 
 security = HTTPBearer()
+DURACION_TOKEN = datetime.timedelta(days=7)
+
+# --- CACHÉ DE TOKENS YA VERIFICADOS ---
+# El cliente manda el mismo token de 7 días en cada petición: decodificarlo y comprobar
+# la firma una vez basta. Guardamos (huella sha256 del token) -> id_runner hasta su 'exp'.
+# Las revocaciones (logout, cambio de contraseña) se guardan en la base de datos
+# (runner.token_valido_desde y token_revocado, sql/017_revocacion_tokens.sql) y se avisan
+# con el evento interno "revocacion" (src/eventos.py) para que cada worker las apunte en
+# memoria. Un token se comprueba contra la base de datos al entrar en la caché de este
+# worker; en los aciertos basta con lo apuntado en memoria. Si se pierde la escucha de
+# eventos, la caché se vacía y cada token se vuelve a comprobar.
+CACHE_TOKENS_ACTIVA = os.getenv("AUTH_CACHE_ACTIVA", "1") == "1"
+CACHE_TOKENS_MAX = int(os.getenv("AUTH_CACHE_MAX", "10000"))
+
+_tokens = OrderedDict()          # huella -> (id_runner, exp, iat)
+_revocados = {}                  # huella -> exp (pasado el exp ya no hace falta recordarlo)
+_revocados_desde = {}            # id_runner -> instante: los tokens emitidos antes no valen
+_lock = threading.Lock()
+_stats = {"aciertos": 0, "fallos": 0, "revocados_rechazados": 0, "comprobaciones_bd": 0}
+
+SQL_COMPROBAR_REVOCACION = """
+    SELECT (SELECT token_valido_desde FROM runner WHERE id_runner = %s),
+           EXISTS (SELECT 1 FROM token_revocado WHERE huella = %s);
+"""
+SQL_REVOCAR_TOKEN = """
+    INSERT INTO token_revocado (huella, expira) VALUES (%s, %s) ON CONFLICT DO NOTHING;
+"""
+SQL_LIMPIAR_REVOCADOS = "DELETE FROM token_revocado WHERE expira <= %s;"
+SQL_REVOCAR_RUNNER = """
+    UPDATE runner SET token_valido_desde = GREATEST(COALESCE(token_valido_desde, 0), %s)
+    WHERE id_runner = %s;
+"""
+
+
+def _huella(token):
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def _revocado(huella, id_runner, iat):
+    return huella in _revocados or iat < _revocados_desde.get(id_runner, 0)
+
 
 def crear_token_acceso(data: dict):
     """Crea un token JWT que caduca en 7 días."""
     to_encode = data.copy()
-    expiracion = datetime.datetime.utcnow() + datetime.timedelta(days=7)
-    to_encode.update({"exp": expiracion})
+    expiracion = datetime.datetime.utcnow() + DURACION_TOKEN
+    # 'iat' con decimales: permite revocar "todo lo emitido antes de ahora" sin pisar el login siguiente
+    to_encode.update({"exp": expiracion, "iat": time.time()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def obtener_runner_actual(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Valida el token Bearer y devuelve el ID del usuario.
-    Si el token es inválido o ha expirado, lanza una excepción 401.
+    Si el token es inválido, ha expirado o se ha revocado, lanza una excepción 401.
     """
     token = credentials.credentials
-    
+    huella = _huella(token)
+
+    if CACHE_TOKENS_ACTIVA:
+        with _lock:
+            guardado = _tokens.get(huella)
+            if guardado is not None:
+                id_runner, exp, iat = guardado
+                if time.time() < exp:
+                    if _revocado(huella, id_runner, iat):
+                        _stats["revocados_rechazados"] += 1
+                        raise HTTPException(status_code=401, detail="La sesión se ha cerrado")
+                    _tokens.move_to_end(huella)
+                    _stats["aciertos"] += 1
+                    return id_runner
+                del _tokens[huella]
+            _stats["fallos"] += 1
+
     try:
         # Decodificamos el token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
+
         # Recuperamos el ID (viene como string, lo pasamos a int)
         sub_texto = payload.get("sub")
         if sub_texto is None:
             raise HTTPException(status_code=401, detail="Token inválido")
-            
-        return int(sub_texto)
+
+        id_runner = int(sub_texto)
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="El token ha caducado")
     except (jwt.PyJWTError, ValueError):
         # Capturamos cualquier otro error (firma mala, formato incorrecto, etc.)
-        raise HTTPException(status_code=401, detail="Credenciales inválidas")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+
+    # Tokens antiguos sin 'iat': cuentan como emitidos en el instante 0
+    iat = float(payload.get("iat", 0))
+    with _lock:
+        revocado = _revocado(huella, id_runner, iat)
+    if not revocado:
+        revocado = _revocado_en_bd(huella, id_runner, iat)
+    with _lock:
+        # Otra vez en memoria: la revocación ha podido llegar mientras se consultaba la base de datos
+        if revocado or _revocado(huella, id_runner, iat):
+            _stats["revocados_rechazados"] += 1
+            raise HTTPException(status_code=401, detail="La sesión se ha cerrado")
+        if CACHE_TOKENS_ACTIVA and "exp" in payload:
+            _tokens[huella] = (id_runner, float(payload["exp"]), iat)
+            while len(_tokens) > CACHE_TOKENS_MAX:
+                _tokens.popitem(last=False)
+    return id_runner
+
+
+def _revocado_en_bd(huella, id_runner, iat):
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_COMPROBAR_REVOCACION, (id_runner, huella))
+        valido_desde, revocado = cur.fetchone()
+        cur.close()
+        conn.rollback()
+    with _lock:
+        _stats["comprobaciones_bd"] += 1
+    return revocado or iat < (valido_desde or 0)
+
+
+# --- REVOCACIÓN ---
+def evento_revocacion(huella=None, exp=None, id_runner=None, desde=None):
+    """Aviso interno "revocacion": un token (huella en hex y exp) o los de un runner desde un instante."""
+    return {"tipo": "revocacion", "huella": huella.hex() if huella else None, "exp": exp,
+            "id_runner": id_runner, "desde": desde}
+
+
+def aplicar_revocacion(evento):
+    """
+    Apunta en memoria una revocación ya guardada en la base de datos (la llama este proceso
+    tras el commit y cada worker al recibir el aviso). Con None, tras perder avisos, vacía la
+    caché de tokens para que se vuelvan a comprobar contra la base de datos.
+    """
+    ahora = time.time()
+    with _lock:
+        if evento is None:
+            _tokens.clear()
+            return
+        if evento["huella"] is not None:
+            huella = bytes.fromhex(evento["huella"])
+            _revocados[huella] = evento["exp"]
+            _tokens.pop(huella, None)
+            # Limpieza de paso: los revocados ya caducados no pueden volver a usarse de todos modos
+            for h in [h for h, exp in _revocados.items() if exp <= ahora]:
+                del _revocados[h]
+        if evento["id_runner"] is not None:
+            id_runner = evento["id_runner"]
+            _revocados_desde[id_runner] = max(evento["desde"], _revocados_desde.get(id_runner, 0))
+            # Pasada la vida de un token, ya no queda ninguno anterior a la revocación
+            for id_r in [r for r, desde in _revocados_desde.items() if desde <= ahora - DURACION_TOKEN.total_seconds()]:
+                del _revocados_desde[id_r]
+            for huella in [h for h, (id_r, _, _) in _tokens.items() if id_r == id_runner]:
+                del _tokens[huella]
+
+
+eventos.al_recibir("revocacion", aplicar_revocacion)
+
+
+def revocar_token(token):
+    """Invalida un token concreto (logout). Devuelve False si el token ni siquiera es válido."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+    ahora = time.time()
+    evento = evento_revocacion(huella=_huella(token), exp=float(payload.get("exp", ahora)))
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_REVOCAR_TOKEN, (_huella(token), evento["exp"]))
+        cur.execute(SQL_LIMPIAR_REVOCADOS, (ahora,))
+        eventos.publicar(cur, evento)
+        conn.commit()
+        cur.close()
+    aplicar_revocacion(evento)
+    return True
+
+
+async def revocar_tokens_de_runner(cur, id_runner):
+    """
+    Invalida todos los tokens emitidos hasta ahora para un runner (p.ej. tras cambiar la
+    contraseña) dentro de la transacción de 'cur' (database_async). Devuelve el evento, que
+    hay que pasar a aplicar_revocacion() después del commit.
+    """
+    evento = evento_revocacion(id_runner=id_runner, desde=time.time())
+    await cur.execute(SQL_REVOCAR_RUNNER, (evento["desde"], id_runner))
+    await eventos.publicar_async(cur, evento)
+    return evento
+
+
+def estadisticas_tokens():
+    with _lock:
+        datos = dict(_stats)
+        datos.update({"activa": CACHE_TOKENS_ACTIVA, "entradas": len(_tokens), "max_entradas": CACHE_TOKENS_MAX,
+                      "revocados": len(_revocados), "runners_revocados": len(_revocados_desde)})
+    return datos
@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# --- POOL DE PROCESOS PARA CÁLCULO PESADO (H3, anti-cheat) ---
+# Los endpoints son 'def' y corren en el threadpool de Starlette con el GIL cogido:
+# unas pocas carreras muy largas a la vez frenan al resto de peticiones del worker.
+# Con CALCULO_EN_PROCESOS=1 los tracks grandes se calculan en otro proceso;
+# los pequeños se siguen calculando en línea (mandarlos fuera cuesta más que hacerlos).
+
+ACTIVADO = os.getenv("CALCULO_EN_PROCESOS", "0") == "1"
+NUM_PROCESOS = int(os.getenv("CALCULO_PROCESOS", str(os.cpu_count() or 1)))
+UMBRAL_PUNTOS = int(os.getenv("CALCULO_UMBRAL_PUNTOS", "5000"))
+MAX_EN_COLA = int(os.getenv("CALCULO_MAX_EN_COLA", str(NUM_PROCESOS * 4)))  # Trabajos en vuelo (ejecutando + esperando)
+
+_ejecutor = None
+_huecos = None
+_lock = threading.Lock()
+_lock_pool = threading.Lock()
+_stats = {"en_linea": 0, "en_procesos": 0, "rechazados": 0, "tiempo_en_procesos_s": 0.0,
+          "caidas_en_linea": 0, "pools_recreados": 0}
+
+
+def _nuevo_pool():
+    # 'spawn': no heredamos hilos ni sockets de Postgres del proceso padre
+    return ProcessPoolExecutor(max_workers=NUM_PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def iniciar():
+    """Arranca el pool de procesos (lo llama el ciclo de vida de la app)."""
+    global _ejecutor, _huecos
+    if not ACTIVADO or _ejecutor is not None:
+        return
+    _ejecutor = _nuevo_pool()
+    _huecos = threading.BoundedSemaphore(MAX_EN_COLA)
+
+
+def detener():
+    global _ejecutor
+    if _ejecutor is not None:
+        _ejecutor.shutdown(wait=True, cancel_futures=True)
+        _ejecutor = None
+
+
+def _pool_roto(roto, e):
+    """
+    Un proceso hijo murió (p.ej. por memoria) y el pool ya no acepta trabajos: se cambia por
+    uno nuevo, solo una vez aunque fallen varias peticiones a la vez con el mismo pool.
+    """
+    global _ejecutor
+    print(f"❌ Pool de procesos roto, calculando en línea: {e}")
+    with _lock:
+        _stats["caidas_en_linea"] += 1
+    with _lock_pool:
+        if _ejecutor is not roto:
+            return
+        _ejecutor = _nuevo_pool()
+    roto.shutdown(wait=False, cancel_futures=True)
+    with _lock:
+        _stats["pools_recreados"] += 1
+    print("🔁 Pool de procesos recreado")
+
+
+def ejecutar(funcion, *args, tamano=0):
+    """
+    Ejecuta funcion(*args): en línea si el pool está apagado o el trabajo es pequeño
+    (tamano < UMBRAL_PUNTOS), y en el pool de procesos si no.
+    Si ya hay MAX_EN_COLA trabajos en vuelo, responde 503 en vez de encolar sin límite.
+    'funcion' y sus argumentos tienen que poder serializarse (pickle).
+    """
+    if _ejecutor is None or tamano < UMBRAL_PUNTOS:
+        with _lock:
+            _stats["en_linea"] += 1
+        return funcion(*args)
+
+    if not _huecos.acquire(blocking=False):
+        with _lock:
+            _stats["rechazados"] += 1
+        raise HTTPException(status_code=503, detail="Servidor ocupado calculando carreras, inténtalo en unos segundos")
+    try:
+        inicio = time.perf_counter()
+        pool = _ejecutor
+        try:
+            resultado = pool.submit(funcion, *args).result()
+        except BrokenProcessPool as e:
+            # No tiramos la petición: calculamos aquí y el pool se recrea para las siguientes
+            _pool_roto(pool, e)
+            return funcion(*args)
+        with _lock:
+            _stats["en_procesos"] += 1
+            _stats["tiempo_en_procesos_s"] += time.perf_counter() - inicio
+        return resultado
+    finally:
+        _huecos.release()
+
+
+async def ejecutar_async(funcion, *args, tamano=0):
+    """
+    ejecutar() para endpoints async: el cálculo nunca corre en el bucle de eventos.
+    Los trabajos pequeños van al threadpool y los grandes al pool de procesos.
+    """
+    if _ejecutor is None or tamano < UMBRAL_PUNTOS:
+        with _lock:
+            _stats["en_linea"] += 1
+        return await run_in_threadpool(funcion, *args)
+
+    if not _huecos.acquire(blocking=False):
+        with _lock:
+            _stats["rechazados"] += 1
+        raise HTTPException(status_code=503, detail="Servidor ocupado calculando carreras, inténtalo en unos segundos")
+    try:
+        inicio = time.perf_counter()
+        pool = _ejecutor
+        try:
+            resultado = await asyncio.wrap_future(pool.submit(funcion, *args))
+        except BrokenProcessPool as e:
+            _pool_roto(pool, e)
+            return await run_in_threadpool(funcion, *args)
+        with _lock:
+            _stats["en_procesos"] += 1
+            _stats["tiempo_en_procesos_s"] += time.perf_counter() - inicio
+        return resultado
+    finally:
+        _huecos.release()
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+    datos["tiempo_en_procesos_s"] = round(datos["tiempo_en_procesos_s"], 4)
+    datos.update({
+        "activado": _ejecutor is not None,
+        "procesos": NUM_PROCESOS if _ejecutor is not None else 0,
+        "umbral_puntos": UMBRAL_PUNTOS,
+        "max_en_cola": MAX_EN_COLA,
+    })
+    return datos
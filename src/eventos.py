@@ -0,0 +1,276 @@
+import os
+import json
+import select
+import asyncio
+import threading
+from collections import defaultdict
+import psycopg2.extensions
+from src.database import abrir_conexion_directa
+from src import motor_h3, cache
+from src.motor_h3 import RESOLUCION_TESELA
+
+# --- EVENTOS EN TIEMPO REAL (SSE) ---
+# En vez de que la app pregunte cada pocos segundos por notificaciones, mapa y feed, se
+# suscribe a /eventos y le empujamos lo que le interesa:
+#   - "zonas":    celdas conquistadas (NUEVA/ROBO) o neutralizadas por decaimiento (NEUTRAL)
+#                 dentro de su vista del mapa, y las que él ha perdido aunque no las esté mirando
+#   - "logro":    logros que acaba de ganar
+#   - "seguidor": alguien ha empezado a seguirle
+# Por el mismo canal van avisos internos entre workers que no llegan a los clientes
+# (p.ej. "regiones": recargar el índice de src/regiones.py); se atienden con al_recibir().
+#
+# Quien genera el evento hace pg_notify dentro de su transacción: Postgres solo lo reparte
+# si hay commit. Cada worker de uvicorn tiene un hilo escuchando (LISTEN) ese canal y
+# reparte a SUS conexiones, así que no hace falta ningún servicio aparte. Con cada "zonas"
+# el worker invalida además sus teselas en caché que contienen esas celdas.
+#
+# Cada conexión tiene una cola acotada. Los eventos se envían en lotes (lo que llegue en
+# LOTE_ESPERA o hasta LOTE_MAX). Si un cliente lento llena su cola, se tira lo pendiente y
+# se le manda "resincronizar": que recargue con /zonas/mapa/cambios y /notificaciones.
+
+CANAL = "battlerun_eventos"
+COLA_MAX = int(os.getenv("TR_COLA_MAX", "256"))
+LOTE_MAX = int(os.getenv("TR_LOTE_MAX", "100"))
+LOTE_ESPERA = float(os.getenv("TR_LOTE_MS", "250")) / 1000
+LATIDO = 15.0                    # Segundos sin eventos antes de mandar un comentario (mantiene viva la conexión)
+# Cada conexión se cierra sola pasado este tiempo y el cliente reconecta (así se reparten
+# entre workers y un apagado no espera eternamente; usar también --timeout-graceful-shutdown)
+DURACION_MAX = float(os.getenv("TR_DURACION_MAX", "300"))
+MAX_BYTES_AVISO = 7000           # pg_notify admite 8000 bytes por mensaje: las carreras largas van en trozos
+
+RESINCRONIZAR = {"tipo": "resincronizar"}
+
+_por_runner = defaultdict(set)   # id_runner -> suscripciones de ese runner
+_por_padre = defaultdict(set)    # celda padre (RESOLUCION_TESELA) -> suscripciones que la están viendo
+_internos = {}                   # tipo de aviso interno -> función(evento)
+_bucle = None
+_hilo = None
+_parar = threading.Event()
+_stats = {"recibidos": 0, "entregados": 0, "descartados": 0, "resincronizaciones": 0, "reconexiones": 0}
+
+
+# --- PUBLICAR (desde las transacciones) ---
+SQL_PUBLICAR = "SELECT pg_notify(%s, %s);"
+
+
+def _mensajes(evento):
+    """
+    Texto(s) para pg_notify; los eventos de zonas grandes se parten en varios de como mucho
+    MAX_BYTES_AVISO bytes en UTF-8, midiendo lo que ocupa de verdad cada cambio.
+    """
+    if evento["tipo"] != "zonas":
+        return [json.dumps(evento)]
+    base = len(json.dumps(dict(evento, cambios=[])).encode())
+    trozos, trozo, tam = [], [], base
+    for cambio in evento["cambios"]:
+        bytes_cambio = len(json.dumps(cambio).encode()) + (2 if trozo else 0)   # ", " entre elementos
+        if trozo and tam + bytes_cambio > MAX_BYTES_AVISO:
+            trozos.append(trozo)
+            trozo, tam = [], base
+            bytes_cambio -= 2
+        trozo.append(cambio)
+        tam += bytes_cambio
+    if trozo or not trozos:
+        trozos.append(trozo)
+    return [json.dumps(dict(evento, cambios=t)) for t in trozos]
+
+
+def publicar(cur, evento):
+    """pg_notify del evento con un cursor psycopg2 normal (sale al hacer commit)."""
+    for mensaje in _mensajes(evento):
+        cur.execute(SQL_PUBLICAR, (CANAL, mensaje))
+
+
+async def publicar_async(cur, evento):
+    """Igual que publicar() para un cursor de database_async."""
+    for mensaje in _mensajes(evento):
+        await cur.execute(SQL_PUBLICAR, (CANAL, mensaje))
+
+
+def evento_zonas(id_runner, id_equipo, color_hex, cambios):
+    """'cambios': [(celda, tipo, id_runner_anterior)] de las celdas NUEVA/ROBO de una carrera (o NEUTRAL)."""
+    return {"tipo": "zonas", "id_runner": id_runner, "id_equipo": id_equipo, "color_hex": color_hex,
+            "cambios": [list(c) for c in cambios]}
+
+
+def evento_logro(id_runner, logros):
+    return {"tipo": "logro", "id_runner": id_runner, "logros": [{"id_logro": i, "nombre": n} for i, n in logros]}
+
+
+def evento_seguidor(id_seguido, id_seguidor):
+    return {"tipo": "seguidor", "id_runner": id_seguido, "id_seguidor": id_seguidor}
+
+
+def evento_regiones():
+    return {"tipo": "regiones"}
+
+
+def al_recibir(tipo, funcion):
+    """
+    Atiende en este worker los avisos internos de 'tipo' con 'funcion(evento)' (en el bucle de
+    eventos: lo que bloquee, a un hilo). Tras reconectar el LISTEN se llama con None, porque
+    se ha podido perder alguno.
+    """
+    _internos[tipo] = funcion
+
+
+# --- SUSCRIPCIONES ---
+class Suscripcion:
+    """Una conexión SSE: a quién pertenece, qué parte del mapa mira y su cola de eventos."""
+
+    def __init__(self, id_runner, padres):
+        self.id_runner = id_runner
+        self.padres = padres
+        self.cola = asyncio.Queue(COLA_MAX)
+
+    def entregar(self, evento):
+        try:
+            self.cola.put_nowait(evento)
+            _stats["entregados"] += 1
+        except asyncio.QueueFull:
+            # Cliente lento: lo pendiente ya no le sirve, mejor que recargue el estado
+            _stats["descartados"] += self.cola.qsize()
+            _stats["resincronizaciones"] += 1
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(RESINCRONIZAR)
+
+    async def lotes(self):
+        """Lotes de eventos; None cada LATIDO segundos sin nada que mandar. Acaba a los DURACION_MAX segundos."""
+        bucle = asyncio.get_running_loop()
+        cierre = bucle.time() + DURACION_MAX
+        while bucle.time() < cierre:
+            try:
+                lote = [await asyncio.wait_for(self.cola.get(), min(LATIDO, max(cierre - bucle.time(), 0.01)))]
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            fin = bucle.time() + LOTE_ESPERA
+            while len(lote) < LOTE_MAX and lote[-1] is not RESINCRONIZAR:
+                restante = fin - bucle.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self.cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            yield lote
+
+
+def suscribir(id_runner, padres=()):
+    """Da de alta una conexión ('padres': celdas RESOLUCION_TESELA de su vista). Desde el bucle de eventos."""
+    suscripcion = Suscripcion(id_runner, set(padres))
+    _por_runner[id_runner].add(suscripcion)
+    for padre in suscripcion.padres:
+        _por_padre[padre].add(suscripcion)
+    return suscripcion
+
+
+def cancelar(suscripcion):
+    for indice, claves in ((_por_runner, [suscripcion.id_runner]), (_por_padre, suscripcion.padres)):
+        for clave in claves:
+            conjunto = indice.get(clave)
+            if conjunto is not None:
+                conjunto.discard(suscripcion)
+                if not conjunto:
+                    del indice[clave]
+
+
+def padres_de_vista(min_lat, min_lon, max_lat, max_lon):
+    return motor_h3.cobertura_bbox(min_lat, min_lon, max_lat, max_lon, RESOLUCION_TESELA)
+
+
+# --- REPARTO (en el bucle de eventos) ---
+def _repartir(texto):
+    _stats["recibidos"] += 1
+    try:
+        evento = json.loads(texto)
+    except ValueError:
+        return
+    if evento.get("tipo") in _internos:
+        _internos[evento["tipo"]](evento)
+        return
+    if evento.get("tipo") != "zonas":
+        for suscripcion in list(_por_runner.get(evento.get("id_runner"), ())):
+            suscripcion.entregar(evento)
+        return
+
+    # Cada suscripción recibe un único evento con solo las celdas que le afectan
+    cambios = evento["cambios"]
+    cache.invalidar_teselas(cambio[0] for cambio in cambios)
+    por_suscripcion = defaultdict(dict)   # suscripción -> {celda: cambio}
+    if _por_padre:
+        y, o = motor_h3.mascaras_padre(RESOLUCION_TESELA)
+        for cambio in cambios:
+            for suscripcion in _por_padre.get((cambio[0] & y) | o, ()):
+                por_suscripcion[suscripcion][cambio[0]] = cambio
+    for cambio in cambios:
+        if cambio[1] in ("ROBO", "NEUTRAL"):
+            for suscripcion in _por_runner.get(cambio[2], ()):
+                por_suscripcion[suscripcion][cambio[0]] = cambio
+    for suscripcion, suyos in por_suscripcion.items():
+        suscripcion.entregar(dict(evento, cambios=list(suyos.values())))
+
+
+def _resincronizar_todos():
+    # Tras perder la conexión de LISTEN no sabemos qué nos hemos perdido
+    cache.cache_global.invalidar("tesela:")
+    for funcion in list(_internos.values()):
+        funcion(None)
+    for suscripciones in list(_por_runner.values()):
+        for suscripcion in list(suscripciones):
+            suscripcion.entregar(RESINCRONIZAR)
+
+
+# --- ESCUCHA (hilo propio con una conexión directa) ---
+def _escuchar():
+    primera = True
+    while not _parar.is_set():
+        conn = None
+        try:
+            conn = abrir_conexion_directa()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL};")
+            if not primera:
+                _stats["reconexiones"] += 1
+                _bucle.call_soon_threadsafe(_resincronizar_todos)
+            primera = False
+            while not _parar.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _bucle.call_soon_threadsafe(_repartir, conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"⚠️ Escucha de eventos caída, reintentando: {e}")
+            _parar.wait(2)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def iniciar():
+    """Arranca el hilo de LISTEN (lo llama el ciclo de vida de la app, dentro del bucle de eventos)."""
+    global _bucle, _hilo
+    if _hilo is not None:
+        return
+    _bucle = asyncio.get_running_loop()
+    _parar.clear()
+    _hilo = threading.Thread(target=_escuchar, name="eventos-listen", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    global _hilo
+    if _hilo is not None:
+        _parar.set()
+        _hilo.join(timeout=5)
+        _hilo = None
+
+
+def estadisticas():
+    datos = dict(_stats)
+    datos.update({"escuchando": _hilo is not None and _hilo.is_alive(),
+                  "suscripciones": sum(len(s) for s in _por_runner.values()),
+                  "celdas_vigiladas": len(_por_padre)})
+    return datos
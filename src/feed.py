@@ -0,0 +1,115 @@
+import os
+import datetime
+
+# --- FEED SOCIAL (DIFUSIÓN EN ESCRITURA) ---
+# Antes /social/feed buscaba en todo captura_zona las capturas de la gente a la que sigues
+# en cada petición. Ahora, al guardar una carrera, se escribe UNA actividad y se copia su
+# referencia al buzón (feed_entrada) de cada seguidor. Leer el feed es un recorrido de
+# índice sobre el buzón, paginado por (fecha, id_actividad).
+#
+# Modelo híbrido: si el autor tiene más de FEED_UMBRAL_DIFUSION seguidores no se copia a
+# nadie (sería escribir miles de filas por carrera); esas actividades quedan con
+# difundida = FALSE, su autor se apunta en autor_masivo y cada lector las trae al vuelo
+# solo de las cuentas que sigue y están en esa tabla (pocas).
+# Tablas en sql/005_feed.sql y sql/016_autor_masivo.sql.
+
+UMBRAL_DIFUSION = int(os.getenv("FEED_UMBRAL_DIFUSION", "1000"))
+COPIA_AL_SEGUIR = 20   # Actividades recientes que entran al feed al empezar a seguir a alguien
+
+SQL_CONTAR_SEGUIDORES = """
+    SELECT COUNT(*) FROM (SELECT 1 FROM seguidor WHERE id_seguido = %s LIMIT %s) s;
+"""
+
+SQL_INSERTAR_ACTIVIDAD = """
+    INSERT INTO actividad (id_runner, id_ruta, fecha, distancia_metros, duracion_segundos,
+                           zonas_nuevas, zonas_robadas, zonas_defendidas, puntos, difundida)
+    SELECT %s::int, %s::int, fecha_hora_inicio, %s::float8, %s::int, %s::int, %s::int, %s::int, %s::int, %s::bool
+    FROM ruta WHERE id_ruta = %s
+    RETURNING id_actividad, fecha;
+"""
+
+SQL_MARCAR_MASIVO = """
+    INSERT INTO autor_masivo (id_runner) VALUES (%s) ON CONFLICT DO NOTHING;
+"""
+
+SQL_DIFUNDIR = """
+    INSERT INTO feed_entrada (id_runner, fecha, id_actividad)
+    SELECT id_seguidor, %s::timestamp, %s::bigint FROM seguidor WHERE id_seguido = %s
+    ON CONFLICT DO NOTHING;
+"""
+
+# Para el endpoint de seguir (síncrono): las últimas actividades difundidas del nuevo seguido
+SQL_COPIAR_AL_SEGUIR = f"""
+    INSERT INTO feed_entrada (id_runner, fecha, id_actividad)
+    SELECT %s, fecha, id_actividad FROM actividad
+    WHERE id_runner = %s AND difundida
+    ORDER BY fecha DESC, id_actividad DESC LIMIT {COPIA_AL_SEGUIR}
+    ON CONFLICT DO NOTHING;
+"""
+
+# Una página: lo que hay en el buzón + lo no difundido de cada cuenta seguida que sea
+# autor_masivo (un LIMIT por cuenta sobre el índice parcial), mezclado y cortado por el
+# mismo (fecha, id)
+SQL_LEER_FEED = """
+    WITH pagina AS (
+        (SELECT f.fecha, f.id_actividad FROM feed_entrada f
+         WHERE f.id_runner = %(yo)s AND (f.fecha, f.id_actividad) < (%(fecha)s::timestamp, %(id)s::bigint)
+         ORDER BY f.fecha DESC, f.id_actividad DESC
+         LIMIT %(limite)s)
+        UNION ALL
+        (SELECT x.fecha, x.id_actividad FROM seguidor s
+         JOIN autor_masivo m ON m.id_runner = s.id_seguido
+         CROSS JOIN LATERAL (
+             SELECT a.fecha, a.id_actividad FROM actividad a
+             WHERE a.id_runner = s.id_seguido AND NOT a.difundida
+               AND (a.fecha, a.id_actividad) < (%(fecha)s::timestamp, %(id)s::bigint)
+             ORDER BY a.fecha DESC, a.id_actividad DESC
+             LIMIT %(limite)s
+         ) x
+         WHERE s.id_seguidor = %(yo)s)
+    )
+    SELECT a.id_actividad, a.fecha, r.username, a.id_ruta, a.distancia_metros, a.duracion_segundos,
+           a.zonas_nuevas, a.zonas_robadas, a.zonas_defendidas, a.puntos
+    FROM pagina p
+    JOIN actividad a ON a.id_actividad = p.id_actividad
+    JOIN runner r ON r.id_runner = a.id_runner
+    ORDER BY p.fecha DESC, p.id_actividad DESC
+    LIMIT %(limite)s;
+"""
+
+
+async def publicar_carrera(cur, id_runner, id_ruta, distancia_metros, duracion_segundos,
+                           nuevas, robadas, defendidas, puntos):
+    """
+    Crea la actividad de una carrera recién guardada y la reparte a los buzones de los
+    seguidores (si no son demasiados). Va en la transacción de 'cur'. Devuelve id_actividad.
+    """
+    await cur.execute(SQL_CONTAR_SEGUIDORES, (id_runner, UMBRAL_DIFUSION + 1))
+    difundida = (await cur.fetchone())[0] <= UMBRAL_DIFUSION
+    await cur.execute(SQL_INSERTAR_ACTIVIDAD, (id_runner, id_ruta, distancia_metros, duracion_segundos,
+                                               nuevas, robadas, defendidas, puntos, difundida, id_ruta))
+    id_actividad, fecha = await cur.fetchone()
+    if difundida:
+        await cur.execute(SQL_DIFUNDIR, (fecha, id_actividad, id_runner))
+    else:
+        await cur.execute(SQL_MARCAR_MASIVO, (id_runner,))
+    return id_actividad
+
+
+def codificar_cursor(fecha, id_actividad):
+    return f"{fecha.isoformat()}_{id_actividad}"
+
+
+def decodificar_cursor(cursor):
+    """'2026-05-01T10:00:00_1234' -> (datetime, 1234). ValueError si no tiene ese formato."""
+    fecha, _, id_actividad = cursor.rpartition("_")
+    return datetime.datetime.fromisoformat(fecha), int(id_actividad)
+
+
+async def leer_feed(cur, id_runner, limite, cursor=None):
+    """Página del feed más reciente que 'cursor'. Devuelve (filas, siguiente_cursor o None)."""
+    fecha, id_actividad = decodificar_cursor(cursor) if cursor else ("infinity", 2 ** 63 - 1)
+    await cur.execute(SQL_LEER_FEED, {"yo": id_runner, "fecha": fecha, "id": id_actividad, "limite": limite})
+    filas = await cur.fetchall()
+    siguiente = codificar_cursor(filas[-1][1], filas[-1][0]) if len(filas) == limite else None
+    return filas, siguiente
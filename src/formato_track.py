@@ -0,0 +1,81 @@
+import struct
+import zlib
+import numpy as np
+
+# --- FORMATO COMPACTO DE TRACKS ---
+# Un blob por ruta en vez de una fila de track_point por punto GPS:
+#   cabecera  "BRT" + versión (1 byte) + número de puntos (uint32)
+#   cuerpo    zlib( deltas int32 de latitud | deltas de longitud | deltas de tiempo )
+# Coordenadas en punto fijo de 1e-6 grados (~11 cm) y tiempo en milisegundos desde el
+# primer punto. Entre puntos seguidos los deltas son pequeños y zlib los deja en ~3-4 bytes
+# por punto (una fila de track_point ocupa más de 60 con su índice).
+# Opcionalmente se simplifica con Douglas-Peucker antes de codificar (tolerancia en metros).
+
+MAGIA = b"BRT"
+VERSION = 1
+_CABECERA = struct.Struct("<3sBI")
+ESCALA_GRADOS = 1e6
+ESCALA_TIEMPO = 1000.0
+RADIO_TIERRA_M = 6371000.0
+
+
+def simplificar(lats, lons, tolerancia_m):
+    """
+    Douglas-Peucker sin recursión: índices de los puntos que se quedan (siempre el primero
+    y el último). Distancias en una proyección equirectangular local, de sobra para un track.
+    """
+    n = len(lats)
+    if n < 3 or tolerancia_m <= 0:
+        return np.arange(n)
+    lat0 = np.radians(np.mean(lats))
+    x = np.radians(lons) * np.cos(lat0) * RADIO_TIERRA_M
+    y = np.radians(lats) * RADIO_TIERRA_M
+
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        ini, fin = pendientes.pop()
+        if fin - ini < 2:
+            continue
+        dx, dy = x[fin] - x[ini], y[fin] - y[ini]
+        px, py = x[ini + 1:fin] - x[ini], y[ini + 1:fin] - y[ini]
+        largo = np.hypot(dx, dy)
+        if largo == 0:
+            distancias = np.hypot(px, py)
+        else:
+            distancias = np.abs(px * dy - py * dx) / largo
+        peor = int(np.argmax(distancias))
+        if distancias[peor] > tolerancia_m:
+            medio = ini + 1 + peor
+            conservar[medio] = True
+            pendientes.append((ini, medio))
+            pendientes.append((medio, fin))
+    return np.flatnonzero(conservar)
+
+
+def codificar(lats, lons, segundos, tolerancia_m=0.0):
+    """Blob comprimido de un track (arrays alineados y en orden). Devuelve (blob, puntos guardados)."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    segundos = np.asarray(segundos, dtype=np.float64)
+    indices = simplificar(lats, lons, tolerancia_m)
+    columnas = (
+        np.rint(lats[indices] * ESCALA_GRADOS).astype(np.int64),
+        np.rint(lons[indices] * ESCALA_GRADOS).astype(np.int64),
+        np.rint((segundos[indices] - (segundos[0] if len(segundos) else 0)) * ESCALA_TIEMPO).astype(np.int64),
+    )
+    cuerpo = b"".join(np.diff(c, prepend=0).astype("<i4").tobytes() for c in columnas)
+    return _CABECERA.pack(MAGIA, VERSION, len(indices)) + zlib.compress(cuerpo, 6), len(indices)
+
+
+def decodificar(blob):
+    """(lats, lons, segundos) como arrays float64 a partir de un blob de codificar()."""
+    magia, version, n = _CABECERA.unpack_from(blob)
+    if magia != MAGIA or version != VERSION:
+        raise ValueError(f"Formato de track desconocido ({magia!r} v{version})")
+    datos = np.frombuffer(zlib.decompress(blob[_CABECERA.size:]), dtype="<i4").astype(np.int64)
+    if len(datos) != 3 * n:
+        raise ValueError("Track corrupto: tamaño inesperado")
+    lat, lon, t = (np.cumsum(datos[i * n:(i + 1) * n]) for i in range(3))
+    return lat / ESCALA_GRADOS, lon / ESCALA_GRADOS, t / ESCALA_TIEMPO
@@ -0,0 +1,110 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from fastapi import HTTPException
+
+# --- POOL DEDICADO PARA BCRYPT ---
+# bcrypt tarda decenas de milisegundos a propósito. Si se hace en el hilo de la petición,
+# una avalancha de logins (p.ej. al empezar temporada) se come el threadpool de Starlette
+# y se resiente toda la API. Aquí va a un pool de hilos propio y acotado (bcrypt suelta el
+# GIL, así que los hilos sí trabajan en paralelo) y, si se llena, respondemos 503 al momento.
+
+COSTE = int(os.getenv("BCRYPT_COSTE", "12"))
+NUM_HILOS = int(os.getenv("HASH_HILOS", str(os.cpu_count() or 1)))
+MAX_EN_COLA = int(os.getenv("HASH_MAX_EN_COLA", str(NUM_HILOS * 8)))  # Trabajos en vuelo (ejecutando + esperando)
+
+_ejecutor = None
+_huecos = threading.BoundedSemaphore(MAX_EN_COLA)
+_lock = threading.Lock()
+_stats = {"hashes": 0, "verificaciones": 0, "rehashes": 0, "rechazados": 0,
+          "en_vuelo": 0, "max_en_vuelo": 0, "tiempo_total_s": 0.0}
+
+
+def iniciar():
+    """Arranca el pool (lo llama el ciclo de vida de la app; si no, se crea al primer uso)."""
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=NUM_HILOS, thread_name_prefix="bcrypt")
+    return _ejecutor
+
+
+def detener():
+    global _ejecutor
+    with _lock:
+        ejecutor, _ejecutor = _ejecutor, None
+    if ejecutor is not None:
+        ejecutor.shutdown(wait=True, cancel_futures=True)
+
+
+async def _en_pool(funcion, *args):
+    if not _huecos.acquire(blocking=False):
+        with _lock:
+            _stats["rechazados"] += 1
+        raise HTTPException(status_code=503, detail="Demasiados inicios de sesión a la vez, inténtalo en unos segundos",
+                            headers={"Retry-After": "2"})
+    with _lock:
+        _stats["en_vuelo"] += 1
+        _stats["max_en_vuelo"] = max(_stats["max_en_vuelo"], _stats["en_vuelo"])
+    inicio = time.perf_counter()
+    try:
+        return await asyncio.wrap_future((_ejecutor or iniciar()).submit(funcion, *args))
+    finally:
+        _huecos.release()
+        with _lock:
+            _stats["en_vuelo"] -= 1
+            _stats["tiempo_total_s"] += time.perf_counter() - inicio
+
+
+def _hashear(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=COSTE)).decode("utf-8")
+
+
+def _comprobar(password, password_hash):
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+async def encriptar(password):
+    """Hash bcrypt con el coste configurado (BCRYPT_COSTE)."""
+    resultado = await _en_pool(_hashear, password)
+    with _lock:
+        _stats["hashes"] += 1
+    return resultado
+
+
+async def verificar(password, password_hash):
+    """True si la contraseña coincide con el hash guardado."""
+    resultado = await _en_pool(_comprobar, password, password_hash)
+    with _lock:
+        _stats["verificaciones"] += 1
+    return resultado
+
+
+def coste_de(password_hash):
+    """Coste con el que se generó un hash bcrypt ($2b$12$... -> 12)."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def necesita_rehash(password_hash):
+    """El hash se hizo con otro coste: hay que regenerarlo en el próximo login correcto."""
+    return coste_de(password_hash) != COSTE
+
+
+def anotar_rehash():
+    with _lock:
+        _stats["rehashes"] += 1
+
+
+def estadisticas():
+    with _lock:
+        datos = dict(_stats)
+    operaciones = datos["hashes"] + datos["verificaciones"]
+    datos["tiempo_medio_ms"] = round(datos.pop("tiempo_total_s") * 1000 / operaciones, 2) if operaciones else 0.0
+    datos.update({"coste": COSTE, "hilos": NUM_HILOS, "max_en_cola": MAX_EN_COLA})
+    return datos
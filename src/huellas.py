@@ -0,0 +1,189 @@
+import os
+import hashlib
+import numpy as np
+from psycopg2.extras import execute_values
+from src import motor_h3, formato_track, tracks
+from src.motor_h3 import RESOLUCION_H3
+
+# --- HUELLAS DE RUTA (MinHash + LSH) ---
+# Reenviar el mismo fichero GPS a /carreras/guardar vuelve a capturar las mismas zonas.
+# Comparar cada carrera nueva con todo el historial es inviable, así que cada ruta guarda:
+#   - firma:  NUM_HASHES mínimos MinHash sobre sus celdas H3; la fracción de posiciones
+#             iguales entre dos firmas estima la similitud de Jaccard de sus celdas
+#   - bandas: la firma en BANDAS trozos de FILAS_BANDA, cada trozo resumido en una clave;
+#             dos rutas parecidas coinciden casi seguro en alguna banda, y eso se busca con
+#             un '&&' sobre un índice GIN (sublineal: ni por runner ni por zona hace falta más)
+#   - huella_track: hash de las coordenadas exactas, para el mismo fichero reenviado
+# Las parejas con similitud >= UMBRAL_SIMILITUD (o idénticas) se guardan en ruta_sospecha
+# y salen en la respuesta de la carrera; no se rechaza nada, se revisa. Las rutas del propio
+# runner también se comparan (reenviar su fichero con las coordenadas movidas es la trampa
+# típica), pero con UMBRAL_MISMO_RUNNER: repetir su circuito de siempre se parece mucho sin serlo.
+# Tablas en sql/010_ruta_huella.sql.
+
+NUM_HASHES = 64
+FILAS_BANDA = 4
+BANDAS = NUM_HASHES // FILAS_BANDA     # Con 16x4 se empieza a coincidir hacia una similitud de ~0.5
+UMBRAL_SIMILITUD = float(os.getenv("HUELLA_UMBRAL", "0.9"))
+UMBRAL_MISMO_RUNNER = float(os.getenv("HUELLA_UMBRAL_MISMO_RUNNER", "0.97"))
+MIN_CELDAS = 8                         # Con menos celdas cualquier paseo corto "se parece"
+MAX_CANDIDATOS = 200
+MAX_EN_RESPUESTA = 10                  # Las más parecidas; el resto solo queda en ruta_sospecha
+TROZO_CELDAS = 8192                    # Celdas por bloque al calcular la firma (acota la memoria)
+
+_SEMILLAS = np.random.default_rng(20260517).integers(0, 2 ** 63, NUM_HASHES, dtype=np.uint64)
+_M1, _M2 = np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB)
+
+
+def _mezclar(x):
+    """Mezcla splitmix64 (uint64, vectorizada; la multiplicación se desborda a propósito)."""
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * _M1
+        x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def firma(celdas):
+    """Firma MinHash (NUM_HASHES uint64) de un conjunto de celdas H3."""
+    celdas = np.fromiter(celdas, dtype=np.uint64, count=len(celdas))
+    minimos = np.full(NUM_HASHES, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i in range(0, len(celdas), TROZO_CELDAS):
+        bloque = _mezclar(celdas[None, i:i + TROZO_CELDAS] ^ _SEMILLAS[:, None])
+        np.minimum(minimos, bloque.min(axis=1), out=minimos)
+    return minimos
+
+
+def claves_bandas(minimos):
+    """Una clave por banda; incluye el número de banda para que no se crucen entre sí."""
+    claves = np.arange(BANDAS, dtype=np.uint64)
+    for columna in minimos.reshape(BANDAS, FILAS_BANDA).T:
+        claves = _mezclar(claves ^ columna)
+    return claves
+
+
+def huella_track(lats, lons):
+    """Hash de 64 bits de las coordenadas en la rejilla de formato_track (BIGINT con signo)."""
+    datos = b"".join(np.rint(np.asarray(c, dtype=np.float64) * formato_track.ESCALA_GRADOS).astype("<i4").tobytes()
+                     for c in (lats, lons))
+    return int.from_bytes(hashlib.blake2b(datos, digest_size=8).digest(), "little", signed=True)
+
+
+def calcular(celdas, lats=None, lons=None):
+    """Huella de una ruta: dict listo para registrar(), o None si pisa muy pocas celdas."""
+    if len(celdas) < MIN_CELDAS:
+        return None
+    minimos = firma(celdas)
+    return {
+        "celdas": len(celdas),
+        "firma": minimos.view(np.int64).tolist(),
+        "bandas": claves_bandas(minimos).view(np.int64).tolist(),
+        "track": huella_track(lats, lons) if lats is not None and len(lats) else None,
+    }
+
+
+def sospechas(huella, candidatos, id_runner=None):
+    """
+    Compara con las rutas candidatas [(id_ruta, id_runner, firma, identica)] y se queda con las
+    sospechosas; las de 'id_runner' (el autor de la ruta nueva) necesitan UMBRAL_MISMO_RUNNER.
+    """
+    if not candidatos:
+        return []
+    propia = np.array(huella["firma"], dtype=np.int64)
+    firmas = np.array([c[2] for c in candidatos], dtype=np.int64)
+    similitudes = (firmas == propia).mean(axis=1)
+    resultado = [
+        {"id_ruta": id_ruta, "id_runner": runner, "similitud": round(float(similitud), 3), "identica": bool(identica),
+         "mismo_runner": runner == id_runner}
+        for (id_ruta, runner, _, identica), similitud in zip(candidatos, similitudes)
+        if identica or similitud >= (UMBRAL_MISMO_RUNNER if runner == id_runner else UMBRAL_SIMILITUD)
+    ]
+    return sorted(resultado, key=lambda s: (s["identica"], s["similitud"]), reverse=True)
+
+
+# --- CONSULTAS ---
+SQL_CANDIDATOS = f"""
+    SELECT id_ruta, id_runner, firma, COALESCE(huella_track = %(track)s::bigint, FALSE)
+    FROM ruta_huella
+    WHERE bandas && %(bandas)s::bigint[] OR huella_track = %(track)s::bigint
+    ORDER BY 4 DESC, id_ruta DESC
+    LIMIT {MAX_CANDIDATOS};
+"""
+
+SQL_GUARDAR_HUELLA = """
+    INSERT INTO ruta_huella (id_ruta, id_runner, celdas, firma, bandas, huella_track)
+    VALUES (%s, %s, %s, %s::bigint[], %s::bigint[], %s::bigint)
+    ON CONFLICT (id_ruta) DO NOTHING;
+"""
+
+SQL_GUARDAR_SOSPECHAS = """
+    INSERT INTO ruta_sospecha (id_ruta, id_ruta_parecida, id_runner_parecida, similitud, identica)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+"""
+
+
+def _filas_sospechas(id_ruta, encontradas):
+    return [(id_ruta, s["id_ruta"], s["id_runner"], s["similitud"], s["identica"]) for s in encontradas]
+
+
+async def registrar(cur, id_ruta, id_runner, huella):
+    """
+    Busca rutas parecidas a 'huella', guarda la huella y las sospechas en la transacción
+    de 'cur' (cursor de database_async). Devuelve la lista de sospechas.
+    """
+    if huella is None:
+        return []
+    parametros = {"bandas": huella["bandas"], "track": huella["track"]}
+    await cur.execute(SQL_CANDIDATOS, parametros)
+    encontradas = sospechas(huella, await cur.fetchall(), id_runner)
+    await cur.execute(SQL_GUARDAR_HUELLA, (id_ruta, id_runner, huella["celdas"], huella["firma"],
+                                           huella["bandas"], huella["track"]))
+    if encontradas:
+        await cur.insertar_lotes(SQL_GUARDAR_SOSPECHAS, _filas_sospechas(id_ruta, encontradas), len(encontradas))
+    return encontradas
+
+
+# --- INDEXAR RUTAS ANTIGUAS (tarea offline) ---
+SQL_RUTAS_SIN_HUELLA = """
+    SELECT r.id_ruta, r.id_runner, rt.datos FROM ruta r
+    LEFT JOIN ruta_track rt ON rt.id_ruta = r.id_ruta
+    WHERE r.id_ruta > %s
+      AND NOT EXISTS (SELECT 1 FROM ruta_huella h WHERE h.id_ruta = r.id_ruta)
+    ORDER BY r.id_ruta
+    LIMIT %s;
+"""
+
+
+def indexar_rutas(conn, tam_lote=200):
+    """
+    Calcula la huella de las rutas que no la tienen, en orden de id_ruta y con un commit por
+    lote; cada ruta se compara con las ya indexadas. Se puede cortar y relanzar.
+    Devuelve (rutas indexadas, sospechas encontradas).
+    """
+    cur = conn.cursor()
+    ultimo, rutas, total_sospechas = 0, 0, 0
+    while True:
+        cur.execute(SQL_RUTAS_SIN_HUELLA, (ultimo, tam_lote))
+        filas = cur.fetchall()
+        if not filas:
+            break
+        for id_ruta, id_runner, datos in filas:
+            if datos is not None:
+                lats, lons, _ = formato_track.decodificar(bytes(datos))
+            else:
+                cur.execute(tracks.SQL_LEER_FILAS, (id_ruta,))
+                puntos = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 3)
+                lats, lons = puntos[:, 0], puntos[:, 1]
+            huella = calcular(motor_h3.celdas_recorridas(lats, lons, RESOLUCION_H3), lats, lons)
+            if huella is None:
+                continue
+            cur.execute(SQL_CANDIDATOS, {"bandas": huella["bandas"], "track": huella["track"]})
+            encontradas = sospechas(huella, cur.fetchall(), id_runner)
+            cur.execute(SQL_GUARDAR_HUELLA, (id_ruta, id_runner, huella["celdas"], huella["firma"],
+                                             huella["bandas"], huella["track"]))
+            execute_values(cur, SQL_GUARDAR_SOSPECHAS, _filas_sospechas(id_ruta, encontradas))
+            rutas += 1
+            total_sospechas += len(encontradas)
+        conn.commit()
+        ultimo = filas[-1][0]
+    cur.close()
+    return rutas, total_sospechas
@@ -1,10 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from src.routers import auth, logros, mapas, ranking, capturas, social, usuario, temporadas, carreras 
+from fastapi.responses import JSONResponse
+from src.database import obtener_pool, cerrar_pool
+from src import ejecutor, cache, database_async, hasher, eventos, bandeja_salida, regiones
+from src.dependencies import estadisticas_tokens
+from src.routers import auth, logros, mapas, ranking, capturas, social, usuario, temporadas, carreras
+from src.routers import eventos as eventos_router
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    # Arrancamos el pool de conexiones (y el de procesos, si está activado) al iniciar
+    # y los cerramos al apagar
+    obtener_pool()
+    # Índice de regiones en memoria (los rankings regionales y las capturas lo usan)
+    regiones.iniciar()
+    await database_async.iniciar()
+    ejecutor.iniciar()
+    hasher.iniciar()
+    eventos.iniciar()
+    bandeja_salida.iniciar()
+    yield
+    await bandeja_salida.detener()
+    eventos.detener()
+    hasher.detener()
+    ejecutor.detener()
+    await database_async.cerrar()
+    cerrar_pool()
 
 app = FastAPI(
     title="RunnerApp API",
     description="Backend BattleRun - Lógica de Juego Activa ⚔️",
-    version="2.3.0"
+    version="2.3.0",
+    lifespan=ciclo_de_vida
 )
 
 # --- CONEXIÓN DE ROUTERS (Los módulos del juego) ---
@@ -17,8 +44,52 @@ app.include_router(social.router)     # Equipos, Amigos y Notificaciones
 app.include_router(usuario.router)    # Usuario
 app.include_router(temporadas.router) # Temporadas
 app.include_router(carreras.router)   # Carrera usuario
+app.include_router(eventos_router.router)  # Eventos en tiempo real (SSE)
 
 # --- ENDPOINT DE SALUD ---
 @app.get("/")
 def raiz():
-    return {"mensaje": "Servidor BattleRun Operativo y Listo ⚔️"}
\ No newline at end of file
+    return {"mensaje": "Servidor BattleRun Operativo y Listo ⚔️"}
+
+@app.get("/salud/pool")
+def estado_pool():
+    """Estadísticas del pool de conexiones (en uso, libres, esperas...)"""
+    datos = obtener_pool().estadisticas()
+    datos["async"] = database_async.estadisticas()
+    return datos
+
+@app.get("/salud/calculo")
+def estado_calculo():
+    """Estadísticas del pool de procesos de cálculo (en línea, en procesos, rechazados...)"""
+    return ejecutor.estadisticas()
+
+@app.get("/salud/cache")
+def estado_cache():
+    """Aciertos, fallos y tamaño de la caché de endpoints públicos"""
+    return cache.cache_global.estadisticas()
+
+@app.get("/salud/hash")
+def estado_hash():
+    """Pool de bcrypt: en vuelo, máximo observado, rechazados, tiempo medio y coste configurado"""
+    return hasher.estadisticas()
+
+@app.get("/salud/eventos")
+def estado_eventos():
+    """Canal en tiempo real: suscripciones, eventos recibidos/entregados y clientes lentos"""
+    return eventos.estadisticas()
+
+@app.get("/salud/bandeja")
+async def estado_bandeja():
+    """Bandeja de salida: eventos pendientes, en reintento, muertos y retraso del más antiguo"""
+    return await bandeja_salida.estadisticas()
+
+@app.get("/salud/regiones")
+def estado_regiones():
+    """Índice de regiones en memoria: regiones, celdas y resoluciones cargadas (503 si está vacío)"""
+    datos = regiones.estadisticas()
+    return JSONResponse(datos, status_code=200 if datos["sano"] else 503)
+
+@app.get("/salud/auth")
+def estado_auth():
+    """Caché de tokens verificados: aciertos, fallos, entradas y revocaciones"""
+    return estadisticas_tokens()
@@ -0,0 +1,157 @@
+import numpy as np
+import h3.api.basic_int as h3_int
+
+# --- MOTOR H3 VECTORIZADO ---
+# Trabajamos siempre con ids de celda enteros (int64), nunca con strings hex:
+# 1. Convertimos TODAS las coordenadas a celdas de una pasada.
+# 2. Quitamos las celdas repetidas consecutivas (a 1 Hz casi todos los puntos caen en la misma).
+# 3. Solo rellenamos camino (grid_path_cells) entre celdas vecinas del track que son distintas.
+
+RESOLUCION_H3 = 10
+RESOLUCION_TESELA = 6   # Las teselas binarias del mapa son celdas de esta resolución (~36 km², 2401 zonas)
+
+
+def celdas_de_coordenadas(lats, lons, resolucion=RESOLUCION_H3):
+    """Convierte arrays de latitud/longitud en un array int64 de celdas H3."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    a_celda = np.frompyfunc(lambda lat, lon: h3_int.latlng_to_cell(lat, lon, resolucion), 2, 1)
+    return a_celda(lats, lons).astype(np.int64)
+
+
+def colapsar_consecutivas(celdas):
+    """Quita las repeticiones seguidas: [a, a, b, b, a] -> [a, b, a]."""
+    if len(celdas) < 2:
+        return celdas
+    cambia = np.empty(len(celdas), dtype=bool)
+    cambia[0] = True
+    np.not_equal(celdas[1:], celdas[:-1], out=cambia[1:])
+    return celdas[cambia]
+
+
+def celdas_recorridas(lats, lons, resolucion=RESOLUCION_H3):
+    """
+    Conjunto de celdas (int) que pisa un track: las de cada punto más el camino
+    H3 entre cada par de puntos consecutivos que caen en celdas distintas.
+    """
+    if len(lats) == 0:
+        return set()
+
+    celdas = colapsar_consecutivas(celdas_de_coordenadas(lats, lons, resolucion))
+    resultado = set(celdas.tolist())
+    if len(celdas) < 2:
+        return resultado
+
+    # Pares (origen, destino) distintos; un track que va y vuelve repite muchos
+    pares = set(zip(celdas[:-1].tolist(), celdas[1:].tolist()))
+    for origen, destino in pares:
+        try:
+            resultado.update(h3_int.grid_path_cells(origen, destino))
+        except Exception:
+            # Sin camino posible (p.ej. cruzando un pentágono): nos quedamos con los extremos,
+            # que ya están en 'resultado'
+            pass
+    return resultado
+
+
+# --- JERARQUÍA H3 CON ARITMÉTICA DE BITS ---
+# Un índice H3 (64 bits) guarda la resolución en los bits 52-55 y luego 15 dígitos de 3 bits
+# (del más grueso al más fino). Los dígitos por debajo de la resolución de la celda valen 7.
+# Con eso, el padre de una celda y el rango de ids de sus descendientes se calculan con
+# máscaras, tanto en Python como dentro de SQL (y así usamos el índice de zona.id_zona).
+
+_MASCARA_RESOLUCION = 0xF << 52
+
+
+def _digitos_desde(resolucion):
+    """Máscara con los bits de los dígitos resolucion+1 .. 15 a uno."""
+    return (1 << (3 * (15 - resolucion))) - 1
+
+
+def padres(celdas, resolucion):
+    """Padres (sin repetir) de un iterable de celdas, todo con máscaras de bits en NumPy."""
+    celdas = np.fromiter(celdas, dtype=np.int64)
+    y, o = mascaras_padre(resolucion)
+    return set(np.unique((celdas & np.int64(y)) | np.int64(o)).tolist())
+
+
+def mascaras_padre(resolucion):
+    """
+    (y, o) tales que padre = (celda & y) | o para cualquier celda más fina que 'resolucion'.
+    Son enteros con signo de 64 bits, listos para pasarlos a SQL como bigint.
+    """
+    return ~_MASCARA_RESOLUCION, (resolucion << 52) | _digitos_desde(resolucion)
+
+
+def rango_descendientes(celda, resolucion=RESOLUCION_H3):
+    """
+    (min, max) de los ids de todos los descendientes de 'celda' a 'resolucion'.
+    Ninguna celda válida de esa resolución fuera del árbol cae en el rango.
+    """
+    res_celda = h3_int.get_resolution(celda)
+    base = (celda & ~_MASCARA_RESOLUCION & ~_digitos_desde(res_celda)) | (resolucion << 52) | _digitos_desde(resolucion)
+    # Dígitos intermedios al máximo válido (6 = 0b110)
+    maximos = 0
+    for digito in range(res_celda + 1, resolucion + 1):
+        maximos |= 6 << (3 * (15 - digito))
+    return base, base | maximos
+
+
+def cobertura_bbox(min_lat, min_lon, max_lat, max_lon, resolucion):
+    """
+    Celdas de 'resolucion' que cubren por completo la caja (puede sobrar algo por los bordes).
+    Si min_lon > max_lon la caja cruza el antimeridiano.
+    """
+    if min_lon > max_lon:
+        return (cobertura_bbox(min_lat, min_lon, max_lat, 180.0, resolucion)
+                | cobertura_bbox(min_lat, -180.0, max_lat, max_lon, resolucion))
+    if max_lon - min_lon > 90:
+        # H3 toma el camino corto entre vértices: con lados de más de 180º daría la vuelta al revés
+        mitad = (min_lon + max_lon) / 2
+        return (cobertura_bbox(min_lat, min_lon, max_lat, mitad, resolucion)
+                | cobertura_bbox(min_lat, mitad, max_lat, max_lon, resolucion))
+
+    poligono = h3_int.LatLngPoly([(min_lat, min_lon), (min_lat, max_lon), (max_lat, max_lon), (max_lat, min_lon)])
+    celdas = set(h3_int.h3shape_to_cells(poligono, resolucion))
+    # Esquinas y centro por si la caja es más pequeña que una celda
+    for lat, lon in [(min_lat, min_lon), (min_lat, max_lon), (max_lat, min_lon), (max_lat, max_lon),
+                     ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)]:
+        celdas.add(h3_int.latlng_to_cell(lat, lon, resolucion))
+    # Un anillo más: polygon_to_cells solo mete celdas con el centro dentro
+    cubiertas = set()
+    for celda in celdas:
+        cubiertas.update(h3_int.grid_disk(celda, 1))
+    return cubiertas
+
+
+def area_bbox_km2(min_lat, min_lon, max_lat, max_lon):
+    """Área aproximada de una caja lat/lon sobre la esfera."""
+    ancho = (max_lon - min_lon) % 360 or 360
+    return 6371.0 ** 2 * np.radians(ancho) * abs(np.sin(np.radians(max_lat)) - np.sin(np.radians(min_lat)))
+
+
+def fusionar_rangos(rangos):
+    """Ordena y junta rangos (min, max) solapados o contiguos."""
+    fusionados = []
+    for lo, hi in sorted(rangos):
+        if fusionados and lo <= fusionados[-1][1] + 1:
+            fusionados[-1][1] = max(fusionados[-1][1], hi)
+        else:
+            fusionados.append([lo, hi])
+    return [tuple(r) for r in fusionados]
+
+
+def rangos_bbox(min_lat, min_lon, max_lat, max_lon, resolucion_maxima, max_celdas=500):
+    """
+    Rangos de ids de celdas de RESOLUCION_H3 que cubren la caja. La cobertura se hace a la
+    resolución más fina (<= resolucion_maxima) que no pase de ~max_celdas celdas, para que
+    la consulta sea un puñado de BETWEEN sobre el índice de zona aunque la caja sea enorme.
+    """
+    area = area_bbox_km2(min_lat, min_lon, max_lat, max_lon)
+    resolucion = 0
+    for r in range(min(resolucion_maxima, RESOLUCION_H3), -1, -1):
+        if area / h3_int.average_hexagon_area(r, "km^2") <= max_celdas:
+            resolucion = r
+            break
+    celdas = cobertura_bbox(min_lat, min_lon, max_lat, max_lon, resolucion)
+    return fusionar_rangos(rango_descendientes(c) for c in celdas)
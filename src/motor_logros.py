@@ -0,0 +1,265 @@
+from src import eventos
+
+# --- MOTOR DE LOGROS INCREMENTAL ---
+# Cada logro de la tabla 'logro' dice qué contador mira (categoria) y a partir de qué
+# valor se gana (criterio, un número). Los contadores viven en estadistica_runner
+# (sql/003_estadistica_runner.sql) y se suman en la misma transacción que la carrera o
+# la captura. Después, una sola sentencia compara contra TODAS las reglas y otorga (con su
+# notificación) cada logro superado que el runner aún no tenga: si una carrera salta de
+# 3 a 12 capturas se ganan a la vez el de 5 y el de 10.
+
+# categoria del logro -> (columna de estadistica_runner, divisor)
+CATEGORIAS = {
+    "CAPTURAS": ("capturas", 1),
+    "ZONAS_NUEVAS": ("zonas_nuevas", 1),
+    "ROBOS": ("robos", 1),
+    "DEFENSAS": ("defensas", 1),
+    "CARRERAS": ("carreras", 1),
+    "DISTANCIA_KM": ("distancia_metros", 1000),
+    "RACHA_DIAS": ("mejor_racha_dias", 1),
+}
+
+_VALOR_REGLA = "CASE l.categoria " + " ".join(
+    f"WHEN '{categoria}' THEN e.{columna}::numeric / {divisor}" for categoria, (columna, divisor) in CATEGORIAS.items()
+) + " END"
+
+# Días seguidos: mismo día -> igual; día siguiente -> +1; hueco -> vuelve a 1.
+# Una carrera con fecha anterior a ultimo_dia (p.ej. subida tarde) no toca la racha.
+_NUEVA_RACHA = """
+    CASE
+        WHEN EXCLUDED.ultimo_dia IS NULL THEN e.racha_dias
+        WHEN e.ultimo_dia IS NULL THEN 1
+        WHEN EXCLUDED.ultimo_dia <= e.ultimo_dia THEN e.racha_dias
+        WHEN EXCLUDED.ultimo_dia = e.ultimo_dia + 1 THEN e.racha_dias + 1
+        ELSE 1
+    END
+"""
+
+SQL_SUMAR_ESTADISTICAS = f"""
+    INSERT INTO estadistica_runner AS e
+        (id_runner, capturas, zonas_nuevas, robos, defensas, carreras, distancia_metros,
+         racha_dias, mejor_racha_dias, ultimo_dia)
+    VALUES (%(id_runner)s::int, %(capturas)s::bigint, %(nuevas)s::bigint, %(robos)s::bigint,
+            %(defensas)s::bigint, %(carreras)s::bigint, %(distancia)s::float8,
+            %(racha)s::int, %(racha)s::int, %(dia)s::date)
+    ON CONFLICT (id_runner) DO UPDATE SET
+        capturas = e.capturas + EXCLUDED.capturas,
+        zonas_nuevas = e.zonas_nuevas + EXCLUDED.zonas_nuevas,
+        robos = e.robos + EXCLUDED.robos,
+        defensas = e.defensas + EXCLUDED.defensas,
+        carreras = e.carreras + EXCLUDED.carreras,
+        distancia_metros = e.distancia_metros + EXCLUDED.distancia_metros,
+        racha_dias = {_NUEVA_RACHA},
+        mejor_racha_dias = GREATEST(e.mejor_racha_dias, {_NUEVA_RACHA}),
+        ultimo_dia = GREATEST(e.ultimo_dia, EXCLUDED.ultimo_dia);
+"""
+
+# Sentencia aparte a propósito: empieza cuando ya tenemos bloqueada la fila de
+# estadistica_runner, así ve los logros que otra carrera simultánea del mismo runner
+# acaba de otorgar y no los repite
+SQL_OTORGAR_LOGROS = f"""
+    WITH ganados AS (
+        INSERT INTO runner_logro (id_runner, id_logro, fecha_obtenido)
+        SELECT e.id_runner, l.id_logro, NOW()
+        FROM estadistica_runner e
+        JOIN logro l ON l.criterio ~ '^[0-9]+(\\.[0-9]+)?$'
+        WHERE e.id_runner = %s::int
+          AND {_VALOR_REGLA} >= (CASE WHEN l.criterio ~ '^[0-9]+(\\.[0-9]+)?$' THEN l.criterio::numeric END)
+          AND NOT EXISTS (SELECT 1 FROM runner_logro rl WHERE rl.id_runner = e.id_runner AND rl.id_logro = l.id_logro)
+        RETURNING id_runner, id_logro
+    ), avisos AS (
+        INSERT INTO notificacion (id_runner, tipo, titulo, mensaje, leida, fecha_hora)
+        SELECT g.id_runner, 'LOGRO', '¡Nueva Medalla!', 'Has desbloqueado: ' || l.nombre, FALSE, NOW()
+        FROM ganados g JOIN logro l ON l.id_logro = g.id_logro
+        RETURNING 1
+    )
+    SELECT l.id_logro, l.nombre FROM ganados g JOIN logro l ON l.id_logro = g.id_logro
+    ORDER BY l.id_logro;
+"""
+
+
+async def registrar_actividad(cur, id_runner, capturas=0, nuevas=0, robos=0, defensas=0,
+                              carreras=0, distancia_metros=0.0, dia=None):
+    """
+    Suma la actividad de una carrera (o captura suelta) a los contadores del runner y otorga
+    los logros que haya superado. 'dia' es la fecha de la carrera (solo cuenta para rachas).
+    Devuelve [(id_logro, nombre)] de los logros nuevos. Va en la transacción de 'cur'.
+    """
+    await cur.execute(SQL_SUMAR_ESTADISTICAS, {
+        "id_runner": id_runner, "capturas": capturas, "nuevas": nuevas, "robos": robos,
+        "defensas": defensas, "carreras": carreras, "distancia": distancia_metros,
+        "racha": 1 if dia is not None else 0, "dia": dia,
+    })
+    await cur.execute(SQL_OTORGAR_LOGROS, (id_runner,))
+    ganados = await cur.fetchall()
+    if ganados:
+        await eventos.publicar_async(cur, eventos.evento_logro(id_runner, ganados))
+    return ganados
+
+
+# --- OTORGAR LOGROS CON CARÁCTER RETROACTIVO (tarea offline) ---
+# Cuando se añade un logro nuevo, nadie lo recibe hasta su próxima carrera. Esta tarea
+# recorre captura_zona y ruta con cursores de servidor (lotes de tam_lote filas, memoria
+# acotada), ordenadas por runner, reconstruye los contadores de cada uno y otorga de golpe
+# todos los logros que le falten. Es idempotente (NOT EXISTS) y reanudable: cada lote de
+# runners se confirma junto con su punto de control en tarea_checkpoint.
+
+TAREA_RETROACTIVOS = "otorgar-logros"
+
+SQL_CAPTURAS_POR_RUNNER = """
+    SELECT id_runner,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE tipo_captura = 'NUEVA'),
+           COUNT(*) FILTER (WHERE tipo_captura = 'ROBO'),
+           COUNT(*) FILTER (WHERE tipo_captura = 'DEFENSA')
+    FROM captura_zona
+    WHERE id_runner > %s
+    GROUP BY id_runner
+    ORDER BY id_runner;
+"""
+
+SQL_DIAS_POR_RUNNER = """
+    SELECT id_runner, fecha_hora_inicio::date, COUNT(*), COALESCE(SUM(distancia_metros), 0)
+    FROM ruta
+    WHERE id_runner > %s
+    GROUP BY id_runner, fecha_hora_inicio::date
+    ORDER BY id_runner, fecha_hora_inicio::date;
+"""
+
+# Misma lógica que SQL_OTORGAR_LOGROS pero para muchos (runner, logro) a la vez
+SQL_OTORGAR_PARES = """
+    WITH ganados AS (
+        INSERT INTO runner_logro (id_runner, id_logro, fecha_obtenido)
+        SELECT p.id_runner, p.id_logro, NOW()
+        FROM unnest(%s::int[], %s::int[]) AS p(id_runner, id_logro)
+        WHERE NOT EXISTS (SELECT 1 FROM runner_logro rl WHERE rl.id_runner = p.id_runner AND rl.id_logro = p.id_logro)
+        RETURNING id_runner, id_logro
+    )
+    INSERT INTO notificacion (id_runner, tipo, titulo, mensaje, leida, fecha_hora)
+    SELECT g.id_runner, 'LOGRO', '¡Nueva Medalla!', 'Has desbloqueado: ' || l.nombre, FALSE, NOW()
+    FROM ganados g JOIN logro l ON l.id_logro = g.id_logro;
+"""
+
+SQL_GUARDAR_CHECKPOINT = """
+    INSERT INTO tarea_checkpoint (tarea, ultimo_id, actualizado_en) VALUES (%s, %s, NOW())
+    ON CONFLICT (tarea) DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id, actualizado_en = NOW();
+"""
+
+
+def _leer_reglas(cur):
+    """[(id_logro, columna, divisor, umbral)] de los logros con criterio numérico y categoría conocida."""
+    cur.execute("SELECT id_logro, categoria, criterio FROM logro WHERE criterio ~ '^[0-9]+(\\.[0-9]+)?$'")
+    return [(id_logro, *CATEGORIAS[categoria], float(criterio))
+            for id_logro, categoria, criterio in cur.fetchall() if categoria in CATEGORIAS]
+
+
+def _por_runner(cursor_servidor, tam_lote):
+    """Agrupa las filas (ordenadas por id_runner) de un cursor de servidor: (id_runner, [filas])."""
+    actual, filas = None, []
+    while True:
+        bloque = cursor_servidor.fetchmany(tam_lote)
+        if not bloque:
+            break
+        for fila in bloque:
+            if fila[0] != actual and filas:
+                yield actual, filas
+                filas = []
+            actual = fila[0]
+            filas.append(fila)
+    if filas:
+        yield actual, filas
+
+
+def _contadores_runner(capturas, dias):
+    """Contadores de estadistica_runner a partir de la fila de capturas y los días con carrera."""
+    contadores = dict.fromkeys(("capturas", "zonas_nuevas", "robos", "defensas", "carreras",
+                                "distancia_metros", "mejor_racha_dias"), 0)
+    if capturas:
+        _, contadores["capturas"], contadores["zonas_nuevas"], contadores["robos"], contadores["defensas"] = capturas
+    racha, anterior = 0, None
+    for _, dia, carreras, distancia in dias:
+        contadores["carreras"] += carreras
+        contadores["distancia_metros"] += distancia
+        racha = racha + 1 if anterior is not None and (dia - anterior).days == 1 else 1
+        contadores["mejor_racha_dias"] = max(contadores["mejor_racha_dias"], racha)
+        anterior = dia
+    return contadores
+
+
+def _recorrer_runners(conn, desde, tam_lote):
+    """Cruza (como un merge join) los dos cursores de servidor: (id_runner, contadores) por runner."""
+    cur_capturas = conn.cursor(name="logros_capturas")
+    cur_dias = conn.cursor(name="logros_dias")
+    cur_capturas.itersize = cur_dias.itersize = tam_lote
+    cur_capturas.execute(SQL_CAPTURAS_POR_RUNNER, (desde,))
+    cur_dias.execute(SQL_DIAS_POR_RUNNER, (desde,))
+
+    capturas = _por_runner(cur_capturas, tam_lote)
+    dias = _por_runner(cur_dias, tam_lote)
+    siguiente_c, siguiente_d = next(capturas, None), next(dias, None)
+    while siguiente_c or siguiente_d:
+        id_runner = min(s[0] for s in (siguiente_c, siguiente_d) if s)
+        filas_c = filas_d = []
+        if siguiente_c and siguiente_c[0] == id_runner:
+            filas_c, siguiente_c = siguiente_c[1], next(capturas, None)
+        if siguiente_d and siguiente_d[0] == id_runner:
+            filas_d, siguiente_d = siguiente_d[1], next(dias, None)
+        yield id_runner, _contadores_runner(filas_c[0] if filas_c else None, filas_d)
+    cur_capturas.close()
+    cur_dias.close()
+
+
+def _confirmar_lote(conn, pares, ultimo_id):
+    """Inserta los logros del lote y mueve el punto de control, todo en una transacción corta."""
+    cur = conn.cursor()
+    otorgados = 0
+    if pares:
+        runners = sorted({id_runner for id_runner, _ in pares})
+        # Mismo candado que registrar_actividad: una carrera simultánea del runner espera a este
+        # lote (milisegundos) en vez de otorgar a la vez el mismo logro
+        cur.execute("SELECT 1 FROM estadistica_runner WHERE id_runner = ANY(%s) ORDER BY id_runner FOR UPDATE",
+                    (runners,))
+        cur.execute(SQL_OTORGAR_PARES, ([p[0] for p in pares], [p[1] for p in pares]))
+        otorgados = cur.rowcount
+    cur.execute(SQL_GUARDAR_CHECKPOINT, (TAREA_RETROACTIVOS, ultimo_id))
+    conn.commit()
+    cur.close()
+    return otorgados
+
+
+def otorgar_retroactivos(conn_lectura, conn_escritura, tam_lote=5000, reiniciar=False):
+    """
+    Otorga a todos los runners los logros que ya merecen según su historial.
+    Lee con 'conn_lectura' (una transacción de solo lectura, sin bloqueos) y escribe con
+    'conn_escritura' en transacciones de tam_lote runners. Devuelve (runners revisados, logros otorgados,
+    runner desde el que se ha reanudado o 0 si ha empezado por el principio).
+    """
+    cur = conn_escritura.cursor()
+    if reiniciar:
+        cur.execute("DELETE FROM tarea_checkpoint WHERE tarea = %s", (TAREA_RETROACTIVOS,))
+    cur.execute("SELECT ultimo_id FROM tarea_checkpoint WHERE tarea = %s", (TAREA_RETROACTIVOS,))
+    fila = cur.fetchone()
+    desde = fila[0] if fila else 0
+    reglas = _leer_reglas(cur)
+    conn_escritura.commit()
+
+    conn_lectura.set_session(readonly=True)
+    runners = otorgados = 0
+    pares, en_lote, ultimo_id = [], 0, desde
+    for id_runner, contadores in _recorrer_runners(conn_lectura, desde, tam_lote):
+        pares.extend((id_runner, id_logro) for id_logro, columna, divisor, umbral in reglas
+                     if contadores[columna] / divisor >= umbral)
+        runners += 1
+        en_lote += 1
+        ultimo_id = id_runner
+        if en_lote >= tam_lote:
+            otorgados += _confirmar_lote(conn_escritura, pares, ultimo_id)
+            pares, en_lote = [], 0
+    otorgados += _confirmar_lote(conn_escritura, pares, ultimo_id)
+    conn_lectura.rollback()
+
+    # Terminada: la próxima ejecución vuelve a empezar por el principio
+    cur.execute("DELETE FROM tarea_checkpoint WHERE tarea = %s", (TAREA_RETROACTIVOS,))
+    conn_escritura.commit()
+    cur.close()
+    return runners, otorgados, desde
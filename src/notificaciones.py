@@ -0,0 +1,88 @@
+from src import feed
+
+# --- NOTIFICACIONES PAGINADAS ---
+# Se leen por páginas con un cursor (fecha_hora, id_notificacion) sobre el índice
+# (id_runner, fecha_hora DESC, id_notificacion DESC): cada página es un recorrido corto
+# por mucho historial que tenga el runner. Al leer se marcan solo las filas devueltas.
+# El número de no leídas está en notificacion_pendiente, que mantiene un trigger.
+# Tablas en sql/006_notificaciones.sql.
+
+SQL_PAGINA = """
+    SELECT id_notificacion, tipo, titulo, mensaje, fecha_hora, leida
+    FROM notificacion
+    WHERE id_runner = %s AND (fecha_hora, id_notificacion) < (%s::timestamp, %s::int)
+    ORDER BY fecha_hora DESC, id_notificacion DESC
+    LIMIT %s;
+"""
+
+SQL_MARCAR_LEIDAS = """
+    UPDATE notificacion SET leida = TRUE
+    WHERE id_notificacion = ANY(%s::int[]) AND id_runner = %s AND NOT leida;
+"""
+
+SQL_NO_LEIDAS = "SELECT no_leidas FROM notificacion_pendiente WHERE id_runner = %s;"
+
+# Un lote: las leídas más antiguas que el corte pasan al archivo en la misma sentencia.
+# Si ya estaba archivada (un archivado anterior cortado a medias) se sobrescribe: ninguna
+# fila sale de notificacion sin quedar en el archivo. Devuelve las borradas, no las insertadas.
+SQL_ARCHIVAR_LOTE = """
+    WITH lote AS (
+        SELECT id_notificacion FROM notificacion
+        WHERE leida AND fecha_hora < NOW() - make_interval(days => %s)
+        ORDER BY fecha_hora
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ), movidas AS (
+        DELETE FROM notificacion n USING lote
+        WHERE n.id_notificacion = lote.id_notificacion
+        RETURNING n.id_notificacion, n.id_runner, n.tipo, n.titulo, n.mensaje, n.leida, n.fecha_hora
+    ), archivadas AS (
+        INSERT INTO notificacion_archivada (id_notificacion, id_runner, tipo, titulo, mensaje, leida, fecha_hora)
+        SELECT * FROM movidas
+        ON CONFLICT (id_notificacion) DO UPDATE SET
+            id_runner = EXCLUDED.id_runner, tipo = EXCLUDED.tipo, titulo = EXCLUDED.titulo,
+            mensaje = EXCLUDED.mensaje, leida = EXCLUDED.leida, fecha_hora = EXCLUDED.fecha_hora,
+            archivada_en = NOW()
+    )
+    SELECT count(*) FROM movidas;
+"""
+
+
+def leer_pagina(cur, id_runner, limite, cursor=None, marcar_leidas=True):
+    """
+    Página de notificaciones más antiguas que 'cursor' (mismo formato que el del feed).
+    Devuelve (filas, siguiente_cursor o None). No hace commit.
+    """
+    fecha, id_notificacion = feed.decodificar_cursor(cursor) if cursor else ("infinity", 2 ** 31 - 1)
+    cur.execute(SQL_PAGINA, (id_runner, fecha, id_notificacion, limite))
+    filas = cur.fetchall()
+    if marcar_leidas:
+        ids = [f[0] for f in filas if not f[5]]
+        if ids:
+            cur.execute(SQL_MARCAR_LEIDAS, (ids, id_runner))
+    siguiente = feed.codificar_cursor(filas[-1][4], filas[-1][0]) if len(filas) == limite else None
+    return filas, siguiente
+
+
+def contar_no_leidas(cur, id_runner):
+    cur.execute(SQL_NO_LEIDAS, (id_runner,))
+    fila = cur.fetchone()
+    return fila[0] if fila else 0
+
+
+def archivar(conn, dias, tam_lote=5000):
+    """
+    Mueve a notificacion_archivada las leídas de hace más de 'dias' días, en lotes de
+    'tam_lote' con un commit por lote (bloqueos cortos). Devuelve cuántas se archivaron.
+    """
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute(SQL_ARCHIVAR_LOTE, (dias, tam_lote))
+        movidas = cur.fetchone()[0]
+        conn.commit()
+        total += movidas
+        if movidas < tam_lote:
+            break
+    cur.close()
+    return total
@@ -0,0 +1,301 @@
+import json
+import time
+import threading
+import unicodedata
+import numpy as np
+import h3.api.basic_int as h3_int
+from psycopg2.extras import execute_values
+from src import motor_h3, eventos
+from src.database import conexion
+from src.motor_h3 import RESOLUCION_H3
+
+# --- REGIONES POR CELDAS PADRE ---
+# Cada región (país, municipio) es un conjunto de celdas H3 compactadas en celda_region: las
+# del interior a resolución gruesa y las del borde a RESOLUCION_REGION. La tabla entera se carga
+# en memoria al arrancar (cargar) y queda, por resolución, un array ordenado de celdas con su
+# región. La región de una celda de juego se saca calculando su padre en cada resolución con
+# máscaras de bits (motor_h3.mascaras_padre) y buscándolo con searchsorted: todo vectorizado,
+# sin tocar la base de datos. Si varias regiones contienen la celda gana la más profunda
+# (el municipio frente al país); los marcadores suman también a sus antepasados.
+# Cada worker recarga su índice con el aviso "regiones" (src/eventos.py) que manda
+# 'cargar-regiones', y si se ha quedado vacío lo reintenta solo.
+# Tablas en sql/012_regiones.sql.
+
+RESOLUCION_REGION = 8        # ~0,7 km² por celda de borde
+TIPOS = ("PAIS", "MUNICIPIO")
+
+REINTENTO_S = 30             # Espera entre cargas mientras el índice siga vacío
+
+_lock = threading.Lock()
+_lock_carga = threading.Lock()
+_indice = {"tablas": [], "regiones": {}, "nombres": {}, "celdas": 0}
+_estado = {"ultimo_intento": float("-inf"), "cargado_en": None, "fallos": 0}
+
+
+def normalizar(nombre):
+    """Nombre para buscar: sin tildes, sin mayúsculas y sin espacios sobrantes."""
+    sin_tildes = unicodedata.normalize("NFKD", nombre).encode("ascii", "ignore").decode()
+    return " ".join(sin_tildes.casefold().split())
+
+
+def construir(filas_regiones, filas_celdas):
+    """
+    Índice en memoria a partir de las filas de region (id, tipo, nombre, id_padre) y de
+    celda_region (celda, id_region).
+    """
+    regiones = {id_region: {"id_region": id_region, "tipo": tipo, "nombre": nombre, "id_padre": id_padre}
+                for id_region, tipo, nombre, id_padre in filas_regiones}
+    nombres = {}
+    for region in regiones.values():
+        profundidad, padre = 0, region["id_padre"]
+        while padre is not None and profundidad < len(regiones):
+            profundidad, padre = profundidad + 1, regiones[padre]["id_padre"]
+        region["profundidad"] = profundidad
+        nombres.setdefault((region["tipo"], normalizar(region["nombre"])), []).append(region["id_region"])
+
+    celdas = np.array([c for c, _ in filas_celdas], dtype=np.int64)
+    ids = np.array([r for _, r in filas_celdas], dtype=np.int64)
+    profundidades = np.array([regiones[r]["profundidad"] for r in ids.tolist()], dtype=np.int64)
+    resoluciones = (celdas >> 52) & 0xF
+    tablas = []
+    for res in np.unique(resoluciones).tolist():
+        if res > RESOLUCION_H3:
+            continue
+        en_res = resoluciones == res
+        # Por celda, primero la región más profunda: searchsorted cae en ella
+        orden = np.lexsort((-profundidades[en_res], celdas[en_res]))
+        c, r, p = celdas[en_res][orden], ids[en_res][orden], profundidades[en_res][orden]
+        primera = np.concatenate(([True], c[1:] != c[:-1]))
+        tablas.append((res, c[primera], r[primera], p[primera]))
+    return {"tablas": tablas, "regiones": regiones, "nombres": nombres, "celdas": len(celdas)}
+
+
+SQL_REGIONES = "SELECT id_region, tipo, nombre, id_padre FROM region;"
+SQL_CELDAS = "SELECT celda, id_region FROM celda_region;"
+
+
+def cargar(conn):
+    """Lee region y celda_region y sustituye el índice en memoria. Devuelve (regiones, celdas)."""
+    global _indice
+    cur = conn.cursor()
+    cur.execute(SQL_REGIONES)
+    filas_regiones = cur.fetchall()
+    cur.execute(SQL_CELDAS)
+    filas_celdas = cur.fetchall()
+    cur.close()
+    conn.rollback()
+    indice = construir(filas_regiones, filas_celdas)
+    with _lock:
+        _indice = indice
+    return len(indice["regiones"]), indice["celdas"]
+
+
+def recargar():
+    """Vuelve a leer el índice con una conexión del pool (bloquea: fuera del bucle de eventos)."""
+    with _lock_carga:
+        _estado["ultimo_intento"] = time.monotonic()
+        try:
+            with conexion() as conn:
+                regiones, celdas = cargar(conn)
+        except Exception as e:
+            _estado["fallos"] += 1
+            print(f"❌ No se han podido cargar las regiones: {e}")
+            return False
+        _estado["cargado_en"] = time.time()
+        print(f"🗺️ Regiones cargadas: {regiones} regiones en {celdas} celdas")
+        return True
+
+
+def _recargar_en_segundo_plano(_evento=None):
+    _estado["ultimo_intento"] = time.monotonic()
+    threading.Thread(target=recargar, name="regiones-carga", daemon=True).start()
+
+
+def _reintentar_si_vacio():
+    # Sin índice (p.ej. la base de datos no respondía al arrancar) no se puede etiquetar nada:
+    # se reintenta en un hilo como mucho cada REINTENTO_S mientras siga vacío
+    if (not _indice["regiones"] and not _lock_carga.locked()
+            and time.monotonic() - _estado["ultimo_intento"] >= REINTENTO_S):
+        _recargar_en_segundo_plano()
+
+
+def iniciar():
+    """
+    Carga el índice al arrancar y se apunta al aviso "regiones" de src/eventos.py, que manda
+    'cargar-regiones' al terminar: cada worker recarga el suyo. Si la carga falla se reintenta.
+    """
+    recargar()
+    eventos.al_recibir("regiones", _recargar_en_segundo_plano)
+
+
+def resolver(celdas):
+    """Región más profunda de cada celda (lista alineada con 'celdas'; None si no cae en ninguna)."""
+    _reintentar_si_vacio()
+    celdas = np.fromiter(celdas, dtype=np.int64)
+    mejor = np.full(len(celdas), -1, dtype=np.int64)
+    profundidad = np.full(len(celdas), -1, dtype=np.int64)
+    for res, claves, ids, profs in _indice["tablas"]:
+        y, o = motor_h3.mascaras_padre(res)
+        padres = (celdas & np.int64(y)) | np.int64(o)
+        pos = np.minimum(np.searchsorted(claves, padres), len(claves) - 1)
+        dentro = (claves[pos] == padres) & (profs[pos] > profundidad)
+        mejor[dentro] = ids[pos[dentro]]
+        profundidad[dentro] = profs[pos[dentro]]
+    return [r if r >= 0 else None for r in mejor.tolist()]
+
+
+def region(id_region):
+    """Datos de una región (id_region, tipo, nombre, id_padre, profundidad) o None."""
+    return _indice["regiones"].get(id_region)
+
+
+def ancestros(id_region):
+    """La región y todas las que la contienen, de la más pequeña a la más grande."""
+    regiones, cadena = _indice["regiones"], []
+    while id_region is not None and id_region in regiones and id_region not in cadena:
+        cadena.append(id_region)
+        id_region = regiones[id_region]["id_padre"]
+    return cadena
+
+
+def buscar(nombre, tipo, pais=None):
+    """Ids de las regiones de 'tipo' con ese nombre (y dentro de 'pais', si se da)."""
+    _reintentar_si_vacio()
+    ids = _indice["nombres"].get((tipo, normalizar(nombre)), [])
+    if pais is not None:
+        paises = set(buscar(pais, "PAIS"))
+        ids = [i for i in ids if paises.intersection(ancestros(i))]
+    return ids
+
+
+def estadisticas():
+    """Tamaño del índice, cuándo se cargó y fallos de carga; 'sano' es False si está vacío."""
+    indice = _indice
+    return {
+        "sano": bool(indice["regiones"]),
+        "regiones": len(indice["regiones"]),
+        "celdas": indice["celdas"],
+        "resoluciones": [t[0] for t in indice["tablas"]],
+        "cargado_en": _estado["cargado_en"],
+        "fallos_carga": _estado["fallos"],
+    }
+
+
+# --- IMPORTAR REGIONES DESDE GEOJSON (tarea offline) ---
+# FeatureCollection con una feature por región y las propiedades 'nombre', 'tipo' (PAIS o
+# MUNICIPIO) y, en los municipios, 'pais'. Cada geometría se cubre con celdas de 'resolucion'
+# y se compacta. Volver a importar una región sustituye sus celdas.
+
+SQL_UPSERT_REGION = """
+    INSERT INTO region (tipo, nombre, id_padre) VALUES (%s, %s, %s)
+    ON CONFLICT (tipo, COALESCE(id_padre, 0), nombre) DO UPDATE SET nombre = EXCLUDED.nombre
+    RETURNING id_region;
+"""
+
+SQL_PAIS_EXISTENTE = "SELECT id_region FROM region WHERE tipo = 'PAIS' AND nombre = %s;"
+SQL_BORRAR_CELDAS = "DELETE FROM celda_region WHERE id_region = %s;"
+SQL_INSERTAR_CELDAS = "INSERT INTO celda_region (celda, id_region) VALUES %s ON CONFLICT DO NOTHING"
+
+
+def celdas_region(geometria, resolucion=RESOLUCION_REGION):
+    """Celdas H3 compactadas que cubren una geometría GeoJSON (Polygon o MultiPolygon)."""
+    for res in range(resolucion, RESOLUCION_H3 + 1):
+        celdas = h3_int.geo_to_cells(geometria, res)
+        if celdas:
+            return sorted(h3_int.compact_cells(celdas))
+    # Más pequeña que una celda de juego: la celda de su primer vértice
+    anillo = geometria["coordinates"][0] if geometria["type"] == "Polygon" else geometria["coordinates"][0][0]
+    lon, lat = anillo[0][:2]
+    return [h3_int.latlng_to_cell(lat, lon, RESOLUCION_H3)]
+
+
+def importar_geojson(conn, ruta, resolucion=RESOLUCION_REGION):
+    """
+    Crea o actualiza las regiones del fichero y sus celdas, con un commit por región
+    (los países antes que sus municipios) y al final avisa a la API para que recargue el
+    índice. Devuelve (regiones, celdas, omitidos): 'omitidos' son los municipios cuyo
+    país no existe, como [(nombre, país)].
+    """
+    with open(ruta, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    features.sort(key=lambda f: TIPOS.index(f["properties"].get("tipo", "PAIS")))
+
+    cur = conn.cursor()
+    paises, regiones, total, omitidos = {}, 0, 0, []
+    for feature in features:
+        propiedades = feature["properties"]
+        tipo, nombre = propiedades.get("tipo", "PAIS"), propiedades["nombre"]
+        id_padre = None
+        if tipo == "MUNICIPIO":
+            id_padre = paises.get(propiedades.get("pais"))
+            if id_padre is None:
+                # País importado en una carga anterior
+                cur.execute(SQL_PAIS_EXISTENTE, (propiedades.get("pais"),))
+                fila = cur.fetchone()
+                id_padre = fila[0] if fila else None
+            if id_padre is None:
+                omitidos.append((nombre, propiedades.get("pais")))
+                continue
+        cur.execute(SQL_UPSERT_REGION, (tipo, nombre, id_padre))
+        id_region = cur.fetchone()[0]
+        if tipo == "PAIS":
+            paises[nombre] = id_region
+
+        celdas = celdas_region(feature["geometry"], resolucion)
+        cur.execute(SQL_BORRAR_CELDAS, (id_region,))
+        execute_values(cur, SQL_INSERTAR_CELDAS, [(c, id_region) for c in celdas], page_size=5000)
+        conn.commit()
+        regiones += 1
+        total += len(celdas)
+    eventos.publicar(cur, eventos.evento_regiones())
+    conn.commit()
+    cur.close()
+    return regiones, total, omitidos
+
+
+# --- ASIGNAR REGIÓN A ZONAS Y CAPTURAS ANTIGUAS (tarea offline) ---
+# Primero las zonas (región resuelta en memoria; las zonas antiguas que no son celdas H3
+# conservan la suya) y luego las capturas copian la de su zona, por rangos de id y con un
+# commit por lote. Se puede cortar y relanzar; después, reconstruir-clasificaciones.
+
+SQL_ZONAS_LOTE = "SELECT id_zona FROM zona WHERE id_zona > %s ORDER BY id_zona LIMIT %s;"
+
+SQL_ASIGNAR_ZONAS = """
+    UPDATE zona z SET id_region = c.id_region
+    FROM unnest(%s::bigint[], %s::int[]) AS c(id_zona, id_region)
+    WHERE z.id_zona = c.id_zona AND z.id_region IS DISTINCT FROM c.id_region;
+"""
+
+SQL_ASIGNAR_CAPTURAS = """
+    UPDATE captura_zona cz SET id_region = z.id_region
+    FROM zona z
+    WHERE z.id_zona = cz.id_zona AND cz.id_captura > %s AND cz.id_captura <= %s
+      AND z.id_region IS NOT NULL AND cz.id_region IS DISTINCT FROM z.id_region;
+"""
+
+
+def asignar(conn, tam_lote=5000):
+    """Rellena id_region de zona y captura_zona con el índice cargado. Devuelve (zonas, capturas)."""
+    cur = conn.cursor()
+    ultimo, zonas = 0, 0
+    while True:
+        cur.execute(SQL_ZONAS_LOTE, (ultimo, tam_lote))
+        ids = [f[0] for f in cur.fetchall()]
+        if not ids:
+            break
+        resueltas = [(c, r) for c, r in zip(ids, resolver(ids)) if r is not None]
+        if resueltas:
+            cur.execute(SQL_ASIGNAR_ZONAS, ([c for c, _ in resueltas], [r for _, r in resueltas]))
+            zonas += cur.rowcount
+        conn.commit()
+        ultimo = ids[-1]
+
+    cur.execute("SELECT COALESCE(MAX(id_captura), 0) FROM captura_zona;")
+    maximo = cur.fetchone()[0]
+    capturas = 0
+    for desde in range(0, maximo, tam_lote):
+        cur.execute(SQL_ASIGNAR_CAPTURAS, (desde, desde + tam_lote))
+        capturas += cur.rowcount
+        conn.commit()
+    cur.close()
+    return zonas, capturas
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from pydantic import BaseModel
-from src.database import get_db_connection
-from src.dependencies import crear_token_acceso
+from src.database import obtener_conexion
+from src.database_async import conexion_async
+from src.dependencies import crear_token_acceso, security, revocar_token, revocar_tokens_de_runner, aplicar_revocacion
+from fastapi.security import HTTPAuthorizationCredentials
+from src import hasher
 from fastapi.security import OAuth2PasswordRequestForm
-import bcrypt
 import datetime
 import random
 import string
@@ -20,51 +22,50 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
-# --- ÚTILES ---
-def encriptar_password(password: str):
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password_bytes, salt).decode('utf-8')
-
-def verificar_password(password_plana, password_encriptada):
-    return bcrypt.checkpw(password_plana.encode('utf-8'), password_encriptada.encode('utf-8'))
+# bcrypt ya no se hace en el hilo de la petición: va al pool acotado de src/hasher.py.
+# Registro, login y restablecimiento de contraseña piden la conexión solo para sus
+# consultas: no tienen una conexión del pool parada mientras bcrypt trabaja. El
+# restablecimiento comprueba el código antes del hash, para que adivinarlo no gaste bcrypt.
 
 # --- ENDPOINTS ---
 
 @router.post("/auth/registro", status_code=status.HTTP_201_CREATED)
-def registrar_usuario(nuevo_usuario: RunnerCreate):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    try:
-        cur = conn.cursor()
-        password_segura = encriptar_password(nuevo_usuario.password)
-        sql = "INSERT INTO runner (email, password_hash, username, estado_cuenta) VALUES (%s, %s, %s, 'ACTIVA') RETURNING id_runner;"
-        cur.execute(sql, (nuevo_usuario.email, password_segura, nuevo_usuario.username))
-        id_gen = cur.fetchone()[0]
-        conn.commit()
-        cur.close(); conn.close()
-        return {"mensaje": "Usuario registrado", "id": id_gen, "usuario": nuevo_usuario.username}
-    except Exception as e:
-        if conn: conn.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+async def registrar_usuario(nuevo_usuario: RunnerCreate):
+    password_segura = await hasher.encriptar(nuevo_usuario.password)
+    async with conexion_async() as conn:
+        try:
+            cur = conn.cursor()
+            sql = "INSERT INTO runner (email, password_hash, username, estado_cuenta) VALUES (%s, %s, %s, 'ACTIVA') RETURNING id_runner;"
+            await cur.execute(sql, (nuevo_usuario.email, password_segura, nuevo_usuario.username))
+            id_gen = (await cur.fetchone())[0]
+            await conn.commit()
+            await cur.close()
+            return {"mensaje": "Usuario registrado", "id": id_gen, "usuario": nuevo_usuario.username}
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/auth/login")
-def login(datos_login: LoginRequest):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+async def login(datos_login: LoginRequest):
     
     try:
-        cur = conn.cursor()
         # Buscamos por email
-        cur.execute("SELECT id_runner, username, password_hash FROM runner WHERE email = %s", (datos_login.email,))
-        user = cur.fetchone()
-        cur.close(); conn.close()
+        async with conexion_async() as conn:
+            cur = conn.cursor()
+            await cur.execute("SELECT id_runner, username, password_hash FROM runner WHERE email = %s", (datos_login.email,))
+            user = await cur.fetchone()
+            await cur.close()
         
         # Verificamos si existe el usuario y si la contraseña coincide
-        if not user or not verificar_password(datos_login.password, user[2]):
+        if not user or not await hasher.verificar(datos_login.password, user[2]):
             # Lanzamos error 401 (No autorizado)
             raise HTTPException(status_code=401, detail="Credenciales incorrectas")
         
+        # Si el hash se hizo con otro coste (BCRYPT_COSTE ha cambiado), lo rehacemos ahora que
+        # tenemos la contraseña en claro. Si falla no pasa nada: se intentará en el próximo login
+        if hasher.necesita_rehash(user[2]):
+            await _rehacer_hash(user[0], user[2], datos_login.password)
+        
         # Si todo ok, generamos token
         id_runner = user[0]
         access_token = crear_token_acceso(data={"sub":str(id_runner), "name": user[1]})
@@ -81,6 +82,27 @@ def login(datos_login: LoginRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) # Si es otro error, lanzamos 500
 
+async def _rehacer_hash(id_runner, hash_antiguo, password):
+    try:
+        nuevo_hash = await hasher.encriptar(password)
+        async with conexion_async() as conn:
+            cur = conn.cursor()
+            # Solo si nadie lo ha cambiado mientras tanto (p.ej. un restablecimiento de contraseña)
+            await cur.execute("UPDATE runner SET password_hash = %s WHERE id_runner = %s AND password_hash = %s",
+                              (nuevo_hash, id_runner, hash_antiguo))
+            await conn.commit()
+            await cur.close()
+        hasher.anotar_rehash()
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el hash del runner {id_runner}: {e}")
+
+@router.post("/auth/logout")
+def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Cierra la sesión: el token deja de valer aunque aún no haya caducado"""
+    if not revocar_token(credentials.credentials):
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    return {"mensaje": "Sesión cerrada"}
+
 # MODELOS PARA RECUPERACIÓN
 class SolicitarRecuperacion(BaseModel):
     email: str
@@ -92,9 +114,7 @@ class CambiarPassword(BaseModel):
 
 # ENDPOINTS DE RECUPERACIÓN
 @router.post("/auth/recuperar/solicitar")
-def solicitar_recuperacion(datos: SolicitarRecuperacion):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+def solicitar_recuperacion(datos: SolicitarRecuperacion, conn=Depends(obtener_conexion)):
     
     try:
         cur = conn.cursor()
@@ -108,52 +128,68 @@ def solicitar_recuperacion(datos: SolicitarRecuperacion):
         sql = "INSERT INTO recuperacion_cuenta (id_runner, token, fecha_creacion, usado) VALUES (%s, %s, NOW(), FALSE)"
         cur.execute(sql, (id_runner, token))
         conn.commit()
-        cur.close(); conn.close()
+        cur.close()
         
         return {"mensaje": "Token generado (Debug)", "token_debug": token}
         
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/auth/recuperar/validar")
-def restablecer_password(datos: CambiarPassword):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+async def restablecer_password(datos: CambiarPassword):
+    # 1) El código se comprueba antes de hacer bcrypt: un intento fallido no gasta hash
+    #    (si no, adivinar códigos llenaría la cola del hasher y los logins recibirían 503)
     try:
-        cur = conn.cursor()
-        sql = """
-            SELECT r.id_runner, rc.fecha_creacion, rc.id_recuperacion
-            FROM recuperacion_cuenta rc
-            JOIN runner r ON rc.id_runner = r.id_runner
-            WHERE r.email = %s AND rc.token = %s AND rc.usado = FALSE
-            ORDER BY rc.fecha_creacion DESC LIMIT 1;
-        """
-        cur.execute(sql, (datos.email, datos.token))
-        resultado = cur.fetchone()
-        
-        if not resultado: raise HTTPException(status_code=400, detail="Token inválido o email incorrecto")
-        
-        id_runner, fecha_creacion, id_recuperacion = resultado
-        
-        ahora = datetime.datetime.now()
-        if fecha_creacion.tzinfo is not None:
-             ahora = ahora.astimezone(fecha_creacion.tzinfo)
+        async with conexion_async() as conn:
+            cur = conn.cursor()
+            sql = """
+                SELECT r.id_runner, rc.fecha_creacion, rc.id_recuperacion
+                FROM recuperacion_cuenta rc
+                JOIN runner r ON rc.id_runner = r.id_runner
+                WHERE r.email = %s AND rc.token = %s AND rc.usado = FALSE
+                ORDER BY rc.fecha_creacion DESC LIMIT 1;
+            """
+            await cur.execute(sql, (datos.email, datos.token))
+            resultado = await cur.fetchone()
+            await cur.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if ahora > (fecha_creacion + datetime.timedelta(minutes=15)):
-             raise HTTPException(status_code=400, detail="El token ha caducado.")
+    if not resultado: raise HTTPException(status_code=400, detail="Token inválido o email incorrecto")
 
-        nueva_pass_hash = encriptar_password(datos.nueva_password)
-        cur.execute("UPDATE runner SET password_hash = %s WHERE id_runner = %s", (nueva_pass_hash, id_runner))
-        cur.execute("UPDATE recuperacion_cuenta SET usado = TRUE, fecha_uso = NOW() WHERE id_recuperacion = %s", (id_recuperacion,))
-        
-        conn.commit()
-        cur.close(); conn.close()
-        return {"mensaje": "¡Contraseña restablecida! Ya puedes hacer login."}
-        
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        if conn: conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    id_runner, fecha_creacion, id_recuperacion = resultado
+
+    ahora = datetime.datetime.now()
+    if fecha_creacion.tzinfo is not None:
+         ahora = ahora.astimezone(fecha_creacion.tzinfo)
+
+    if ahora > (fecha_creacion + datetime.timedelta(minutes=15)):
+         raise HTTPException(status_code=400, detail="El token ha caducado.")
+
+    # 2) bcrypt sin ninguna conexión del pool prestada
+    nueva_pass_hash = await hasher.encriptar(datos.nueva_password)
+
+    # 3) El código se gasta con condición: si otra petición lo ha usado mientras tanto, no cambia nada
+    async with conexion_async() as conn:
+        try:
+            cur = conn.cursor()
+            await cur.execute("UPDATE recuperacion_cuenta SET usado = TRUE, fecha_uso = NOW() WHERE id_recuperacion = %s AND usado = FALSE",
+                              (id_recuperacion,))
+            if cur.rowcount == 0:
+                raise HTTPException(status_code=400, detail="Token inválido o email incorrecto")
+            await cur.execute("UPDATE runner SET password_hash = %s WHERE id_runner = %s", (nueva_pass_hash, id_runner))
+            # Las sesiones abiertas con la contraseña antigua dejan de valer (en todos los workers)
+            revocacion = await revocar_tokens_de_runner(cur, id_runner)
+            
+            await conn.commit()
+            await cur.close()
+            aplicar_revocacion(revocacion)
+            return {"mensaje": "¡Contraseña restablecida! Ya puedes hacer login."}
+            
+        except HTTPException as e:
+            await conn.rollback()
+            raise e
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from src.database import get_db_connection
-from src.routers import logros
+from src.database_async import obtener_conexion_async
+from src import cache, bandeja_salida, regiones
 from src.dependencies import obtener_runner_actual
 import datetime
 
@@ -14,12 +14,11 @@ class CapturaCreate(BaseModel):
     puntos_ganados: int = 10
 
 @router.post("/capturas")
-def registrar_captura(
+async def registrar_captura(
     datos: CapturaCreate, 
-    id_runner_autenticado: int = Depends(obtener_runner_actual) # <--- AQUÍ OBTENEMOS EL ID DEL TOKEN
+    id_runner_autenticado: int = Depends(obtener_runner_actual), # <--- AQUÍ OBTENEMOS EL ID DEL TOKEN
+    conn=Depends(obtener_conexion_async)
 ):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
@@ -30,27 +29,34 @@ def registrar_captura(
             JOIN runner r ON cz.id_runner = r.id_runner
             WHERE cz.id_zona = %s ORDER BY cz.fecha_hora DESC LIMIT 1;
         """
-        cur.execute(sql_investigacion, (datos.id_zona,))
-        resultado_anterior = cur.fetchone()
+        await cur.execute(sql_investigacion, (datos.id_zona,))
+        resultado_anterior = await cur.fetchone()
         nombre_anterior_dueno = resultado_anterior[0] if resultado_anterior else None
             
         # 2. Registrar captura
         # ⚠️ IMPORTANTE: Usamos 'id_runner_autenticado' en lugar de 'datos.id_runner'
+        # Región: la de la celda H3 (índice en memoria) o, en zonas antiguas, la guardada en la zona
         sql_insertar = """
-            INSERT INTO captura_zona (id_runner, id_zona, fecha_hora, tipo_captura, puntos_ganados)
-            VALUES (%s, %s, %s, %s, %s) RETURNING id_captura;
+            INSERT INTO captura_zona (id_runner, id_zona, fecha_hora, tipo_captura, puntos_ganados, id_region)
+            VALUES (%s, %s, %s, %s, %s, COALESCE(%s::int, (SELECT id_region FROM zona WHERE id_zona = %s::bigint)))
+            RETURNING id_captura, id_region;
         """
         ahora = datetime.datetime.now()
-        cur.execute(sql_insertar, (id_runner_autenticado, datos.id_zona, ahora, datos.tipo_captura, datos.puntos_ganados))
-        id_captura = cur.fetchone()[0]
-        
-        conn.commit()
-        
-        # 3. Verificar Logros
+        id_region = regiones.resolver([datos.id_zona])[0]
+        await cur.execute(sql_insertar, (id_runner_autenticado, datos.id_zona, ahora, datos.tipo_captura,
+                                         datos.puntos_ganados, id_region, datos.id_zona))
+        id_captura, id_region = await cur.fetchone()
+
+        # 3. Rankings y logros: a la bandeja de salida (misma transacción), en segundo plano
         # ⚠️ IMPORTANTE: También aquí pasamos el ID autenticado
-        hubo_premio = logros.verificar_y_otorgar_logros(id_runner_autenticado, conn)
+        await bandeja_salida.encolar(cur, "captura", {
+            "id_runner": id_runner_autenticado, "id_zona": datos.id_zona,
+            "puntos": datos.puntos_ganados, "tipo_captura": datos.tipo_captura, "id_region": id_region,
+        })
         
-        cur.close(); conn.close()
+        await conn.commit()
+        await cur.close()
+        cache.invalidar_tras_capturas([datos.id_zona])
         
         # 4. Mensaje
         if nombre_anterior_dueno:
@@ -61,11 +67,8 @@ def registrar_captura(
         else:
             mensaje = "¡NUEVO TERRITORIO! 🚩 Has reclamado una zona neutral."
 
-        if hubo_premio:
-            mensaje += " ¡Y has desbloqueado un NUEVO LOGRO! 🏅"
-            
         return {"mensaje": mensaje, "puntos_ganados": datos.puntos_ganados, "id_captura": id_captura}
 
     except Exception as e:
-        if conn: conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,16 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel
 from typing import List
-from src.database import get_db_connection
+from src.database import obtener_conexion
+from src.database_async import obtener_conexion_async
 from src.dependencies import obtener_runner_actual
+from src import territorio, tracks, motor_h3, ejecutor, cache, eventos, bandeja_salida, cargas, formato_track, antitrampas, huellas
+from src.motor_h3 import RESOLUCION_H3
 import datetime
-import h3 
+import json
+import numpy as np
 
 router = APIRouter()
 
-# --- CONFIGURACIÓN H3 ---
-RESOLUCION_H3 = 10 
-
 # --- MODELOS ---
 class PuntoGPS(BaseModel):
     latitud: float
@@ -24,167 +25,340 @@ class CarreraCreate(BaseModel):
     ritmo_min_km: float
     puntos: List[PuntoGPS]
 
+class CargaInicio(BaseModel):
+    clave: str   # La genera la app (p.ej. un UUID): reintentar con la misma clave no duplica nada
+
+class TrozoPuntos(BaseModel):
+    puntos: List[PuntoGPS]
+
+class CargaFinal(BaseModel):
+    distancia_km: float
+    tiempo_segundos: int
+    ritmo_min_km: float
+
 # --- LÓGICA DE CÁLCULO DE TERRITORIO (H3) ---
-def calcular_hexagonos_conquistados(puntos: List[PuntoGPS]) -> set:
-    hexagonos_strings = set()
+def arrays_de_puntos(puntos: List[PuntoGPS]):
+    """(lats, lons, segundos desde el primero) de los puntos de la app, por 'orden', como arrays de NumPy."""
+    puntos = sorted(puntos, key=lambda p: p.orden)
+    n = len(puntos)
+    lats = np.fromiter((p.latitud for p in puntos), dtype=np.float64, count=n)
+    lons = np.fromiter((p.longitud for p in puntos), dtype=np.float64, count=n)
+    inicio = puntos[0].timestamp if n else None
+    segundos = np.fromiter(((p.timestamp - inicio).total_seconds() for p in puntos), dtype=np.float64, count=n)
+    return lats, lons, segundos
+
+async def calcular_hexagonos_conquistados(lats, lons) -> set:
+    # Trabajo al motor vectorizado (los tracks largos se calculan en el pool de procesos si está activado)
+    return await ejecutor.ejecutar_async(motor_h3.celdas_recorridas, lats, lons, RESOLUCION_H3, tamano=len(lats))
+
+async def calcular_huella(ids_hexagonos, lats, lons):
+    # Firma MinHash de las celdas para buscar carreras repetidas (src/huellas.py)
+    return await ejecutor.ejecutar_async(huellas.calcular, ids_hexagonos, lats, lons, tamano=len(ids_hexagonos))
+
+# --- PASOS COMUNES (carrera de una vez o subida por trozos) ---
+def validar_track(lats, lons, segundos):
+    """
+    ANTI-CHEAT sobre los puntos GPS (src/antitrampas.py). Rechaza solo lo imposible (tiempo hacia
+    atrás, teletransportes); los avisos se guardan con la ruta. Devuelve (distancia real en km, análisis).
+    """
+    analisis = antitrampas.analizar(lats, lons, segundos)
+    if analisis["rechazos"]:
+        raise HTTPException(status_code=400, detail="Carrera imposible: " + "; ".join(analisis["rechazos"]))
+    return analisis["distancia_m"] / 1000, analisis
+
+def validar_carrera(distancia_km, tiempo_segundos):
+    """ANTI-CHEAT básico sobre el resumen de la carrera."""
+    if tiempo_segundos <= 0:
+        raise HTTPException(status_code=400, detail="El tiempo no puede ser 0.")
+
+    velocidad_media_kmh = (distancia_km / tiempo_segundos) * 3600
+    if velocidad_media_kmh > 35.0:
+        raise HTTPException(status_code=400, detail="Velocidad sospechosa.")
+
+
+SQL_GUARDAR_ANALISIS = """
+    INSERT INTO ruta_analisis (id_ruta, distancia_m, duracion_s, velocidad_max_kmh, velocidad_sostenida_kmh,
+                               aceleracion_max, saltos, acelerones, repetidas, avisos)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[]);
+"""
+
+async def registrar_carrera(cur, id_runner, distancia_km, tiempo_segundos, ids_hexagonos, guardar_puntos,
+                            huella=None, analisis=None):
+    """
+    Ruta, track, análisis antitrampas, territorio, evento en vivo y bandeja de salida, todo en la
+    transacción de 'cur'. 'guardar_puntos(cur, id_ruta)' escribe el track. Devuelve (id_ruta, contadores);
+    las rutas parecidas a 'huella' van en contadores["sospechas"] y 'analisis' en contadores["analisis"].
+    No hace commit.
+    """
+    # A. Guardar Ruta
+    distancia_metros = distancia_km * 1000
+    sql_ruta = """
+        INSERT INTO ruta (id_runner, fecha_hora_inicio, distancia_metros, duracion_segundos) 
+        VALUES (%s, NOW(), %s, %s) 
+        RETURNING id_ruta;
+    """
+    await cur.execute(sql_ruta, (id_runner, distancia_metros, tiempo_segundos))
+    id_ruta = (await cur.fetchone())[0]
+
+    # B. Guardar Track y su análisis
+    await guardar_puntos(cur, id_ruta)
+    if analisis is not None:
+        await cur.execute(SQL_GUARDAR_ANALISIS, (
+            id_ruta, analisis["distancia_m"], analisis["duracion_s"], analisis["velocidad_max_kmh"],
+            analisis["velocidad_sostenida_kmh"], analisis["aceleracion_max"], analisis["saltos"],
+            analisis["acelerones"], analisis["repetidas"], analisis["avisos"]))
+
+    # C. Lógica de Guerra (Actualizada para detectar Robos)
+    await cur.execute("SELECT id_equipo FROM runner_equipo WHERE id_runner = %s", (id_runner,))
+    res_equipo = await cur.fetchone()
+    id_equipo = res_equipo[0] if res_equipo else None
+
+    color_zona = "#808080"
+    if id_equipo == 1: color_zona = "#FF0000"
+    elif id_equipo == 2: color_zona = "#0000FF"
+
+    # Resolvemos todas las celdas en bloque (3 consultas en total, no 3 por hexágono)
+    contadores = await territorio.resolver_territorio(
+        cur, id_runner, id_equipo, color_zona, id_ruta, ids_hexagonos
+    )
+    contadores["sospechas"] = await huellas.registrar(cur, id_ruta, id_runner, huella)
+    contadores["analisis"] = analisis
+    if contadores["detalle"]:
+        # Aviso en vivo a quien mira esa parte del mapa y a los que han perdido zonas
+        await eventos.publicar_async(cur, eventos.evento_zonas(
+            id_runner, id_equipo, color_zona, contadores["detalle"]))
+
+    # Rankings, logros y feed: a la bandeja de salida (misma transacción), los aplica
+    # un trabajador en segundo plano. Los logros le llegan al runner por notificación/evento.
+    await bandeja_salida.encolar(cur, "carrera", {
+        "id_runner": id_runner, "id_ruta": id_ruta, "celdas": sorted(ids_hexagonos),
+        "puntos": contadores["puntos"], "regiones": contadores["regiones"],
+        "nuevas": contadores["nuevas"], "robadas": contadores["robadas"], "defendidas": contadores["defendidas"],
+        "distancia_metros": distancia_metros, "duracion_segundos": tiempo_segundos,
+        "dia": datetime.date.today().isoformat(),
+    })
+    return id_ruta, contadores
+
+
+def respuesta_carrera(id_ruta, contadores):
+    """D. Generar Mensaje Inteligente para Flutter"""
+    zonas_nuevas = contadores["nuevas"]         # Antes no había nadie
+    zonas_robadas = contadores["robadas"]       # Antes era de otro
+    zonas_defendidas = contadores["defendidas"] # Ya era mía
+
+    mensaje_final = "Carrera finalizada."
+    titulo_batalla = "Entrenamiento completado"
     
-    if len(puntos) < 2:
-        if len(puntos) == 1:
-            h3_index = h3.latlng_to_cell(puntos[0].latitud, puntos[0].longitud, RESOLUCION_H3)
-            hexagonos_strings.add(h3_index)
-        return {int(h, 16) for h in hexagonos_strings}
-
-    for i in range(len(puntos) - 1):
-        p1 = puntos[i]
-        p2 = puntos[i+1]
-        h3_inicio = h3.latlng_to_cell(p1.latitud, p1.longitud, RESOLUCION_H3)
-        h3_fin = h3.latlng_to_cell(p2.latitud, p2.longitud, RESOLUCION_H3)
-        
-        try:
-            camino = h3.grid_path_cells(h3_inicio, h3_fin)
-            hexagonos_strings.update(camino)
-        except Exception:
-            hexagonos_strings.add(h3_inicio)
-            hexagonos_strings.add(h3_fin)
-            
-    return {int(h, 16) for h in hexagonos_strings}
+    if zonas_robadas > 0:
+        titulo_batalla = "¡ZONA CONQUISTADA! ⚔️"
+        mensaje_final = f"Has robado {zonas_robadas} zonas al enemigo y capturado {zonas_nuevas} nuevas."
+    elif zonas_nuevas > 0:
+        titulo_batalla = "¡TERRITORIO EXPANDIDO! 🚩"
+        mensaje_final = f"Has reclamado {zonas_nuevas} zonas nuevas para tu equipo."
+    elif zonas_defendidas > 0:
+        titulo_batalla = "DEFENSA EXITOSA 🛡️"
+        mensaje_final = f"Has reforzado {zonas_defendidas} de tus zonas."
+
+    return {
+        "mensaje": mensaje_final,
+        "titulo": titulo_batalla, # Para que Flutter lo ponga en negrita o grande
+        "id_ruta": id_ruta, 
+        "estadisticas": {
+            "nuevas": zonas_nuevas,
+            "robadas": zonas_robadas,
+            "defendidas": zonas_defendidas,
+            "total": zonas_nuevas + zonas_robadas + zonas_defendidas,
+            "puntos": sum(contadores["puntos"])
+        },
+        # Carreras anteriores casi iguales a esta (quedan guardadas para revisarlas)
+        "sospechas": [{"id_ruta": s["id_ruta"], "similitud": s["similitud"], "identica": s["identica"],
+                       "mismo_runner": s["mismo_runner"]}
+                      for s in contadores.get("sospechas", [])[:huellas.MAX_EN_RESPUESTA]],
+        # Análisis antitrampas del track: con 'avisos' la carrera queda guardada para revisarla
+        "analisis": resumen_analisis(contadores.get("analisis"))
+    }
+
+def resumen_analisis(analisis):
+    if analisis is None:
+        return None
+    return {
+        "distancia_km": round(analisis["distancia_m"] / 1000, 3),
+        "velocidad_max_kmh": round(analisis["velocidad_max_kmh"], 1),
+        "velocidad_sostenida_kmh": round(analisis["velocidad_sostenida_kmh"], 1),
+        "aceleracion_max": round(analisis["aceleracion_max"], 2),
+        "saltos": analisis["saltos"],
+        "acelerones": analisis["acelerones"],
+        "repetidas": round(analisis["repetidas"], 3),
+        "avisos": analisis["avisos"],
+    }
 
 # --- ENDPOINTS ---
 
 @router.post("/carreras/guardar")
-def guardar_carrera(
+async def guardar_carrera(
     carrera: CarreraCreate,
-    id_runner_autenticado: int = Depends(obtener_runner_actual)
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
 ):
     """Guarda ruta y calcula resultados de batalla detallados"""
     
     # --- 1. ANTI-CHEAT ---
-    if carrera.tiempo_segundos <= 0:
-        raise HTTPException(status_code=400, detail="El tiempo no puede ser 0.")
-
-    velocidad_media_kmh = (carrera.distancia_km / carrera.tiempo_segundos) * 3600
-    if velocidad_media_kmh > 35.0:
-        raise HTTPException(status_code=400, detail="Velocidad sospechosa.")
+    # La distancia que se guarda es la de los puntos, no la que dice la app
+    lats, lons, segundos = arrays_de_puntos(carrera.puntos)
+    distancia_km, analisis = validar_track(lats, lons, segundos)
+    validar_carrera(distancia_km, carrera.tiempo_segundos)
     
     # --- 2. CÁLCULO H3 ---
-    ids_hexagonos = calcular_hexagonos_conquistados(carrera.puntos)
+    ids_hexagonos = await calcular_hexagonos_conquistados(lats, lons)
+    huella = await calcular_huella(ids_hexagonos, lats, lons)
 
     # --- 3. BASE DE DATOS ---
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
-        
-        # A. Guardar Ruta
-        distancia_metros = carrera.distancia_km * 1000
-        sql_ruta = """
-            INSERT INTO ruta (id_runner, fecha_hora_inicio, distancia_metros, duracion_segundos) 
-            VALUES (%s, NOW(), %s, %s) 
-            RETURNING id_ruta;
-        """
-        cur.execute(sql_ruta, (id_runner_autenticado, distancia_metros, carrera.tiempo_segundos))
-        id_ruta = cur.fetchone()[0]
-        
-        # B. Guardar Track
-        start_time = carrera.puntos[0].timestamp if carrera.puntos else datetime.datetime.now()
-        sql_puntos = """
-            INSERT INTO track_point (id_ruta, latitud, longitud, orden, timestamp_relativo)
-            VALUES (%s, %s, %s, %s, %s)
-        """
-        datos_puntos = []
-        for p in carrera.puntos:
-            delta_seconds = (p.timestamp - start_time).total_seconds()
-            datos_puntos.append((id_ruta, p.latitud, p.longitud, p.orden, delta_seconds))
-        cur.executemany(sql_puntos, datos_puntos)
-        
-        # C. Lógica de Guerra (Actualizada para detectar Robos)
-        cur.execute("SELECT id_equipo FROM runner_equipo WHERE id_runner = %s", (id_runner_autenticado,))
-        res_equipo = cur.fetchone()
-        id_equipo = res_equipo[0] if res_equipo else None
-        
-        color_zona = "#808080"
-        if id_equipo == 1: color_zona = "#FF0000"
-        elif id_equipo == 2: color_zona = "#0000FF"
-        
-        # Contadores para el mensaje final
-        zonas_nuevas = 0    # Antes no había nadie
-        zonas_robadas = 0   # Antes era de otro
-        zonas_defendidas = 0 # Ya era mía
-        
-        for h3_index_int in ids_hexagonos:
-            # 1. Miramos de quién es la zona AHORA MISMO
-            cur.execute("SELECT id_runner FROM zona WHERE id_zona = %s", (h3_index_int,))
-            res_zona = cur.fetchone()
-            
-            tipo_accion = "CONQUISTA" # Por defecto
-            
-            if res_zona is None:
-                zonas_nuevas += 1
-                tipo_accion = "NUEVA"
-            elif res_zona[0] == id_runner_autenticado:
-                zonas_defendidas += 1
-                tipo_accion = "DEFENSA"
-            else:
-                zonas_robadas += 1
-                tipo_accion = "ROBO"
-
-            # 2. Aplicamos el cambio (UPSERT)
-            sql_upsert = """
-                INSERT INTO zona (id_zona, id_runner, id_equipo, color_hex, fecha_conquista)
-                VALUES (%s, %s, %s, %s, NOW())
-                ON CONFLICT (id_zona) DO UPDATE SET 
-                    id_runner = EXCLUDED.id_runner,
-                    id_equipo = EXCLUDED.id_equipo,
-                    color_hex = EXCLUDED.color_hex,
-                    fecha_conquista = NOW();
-            """
-            cur.execute(sql_upsert, (h3_index_int, id_runner_autenticado, id_equipo, color_zona))
-            
-            # 3. Guardamos en historial con el tipo correcto
-            cur.execute("""
-                INSERT INTO captura_zona (id_zona, id_runner, id_ruta, tipo_captura, puntos_ganados)
-                VALUES (%s, %s, %s, %s, 10)
-            """, (h3_index_int, id_runner_autenticado, id_ruta, tipo_accion))
-            
-        conn.commit()
-        cur.close(); conn.close()
-        
-        # D. Generar Mensaje Inteligente para Flutter
-        mensaje_final = "Carrera finalizada."
-        titulo_batalla = "Entrenamiento completado"
-        
-        if zonas_robadas > 0:
-            titulo_batalla = "¡ZONA CONQUISTADA! ⚔️"
-            mensaje_final = f"Has robado {zonas_robadas} zonas al enemigo y capturado {zonas_nuevas} nuevas."
-        elif zonas_nuevas > 0:
-            titulo_batalla = "¡TERRITORIO EXPANDIDO! 🚩"
-            mensaje_final = f"Has reclamado {zonas_nuevas} zonas nuevas para tu equipo."
-        elif zonas_defendidas > 0:
-            titulo_batalla = "DEFENSA EXITOSA 🛡️"
-            mensaje_final = f"Has reforzado {zonas_defendidas} de tus zonas."
-
-        return {
-            "mensaje": mensaje_final,
-            "titulo": titulo_batalla, # Para que Flutter lo ponga en negrita o grande
-            "id_ruta": id_ruta, 
-            "estadisticas": {
-                "nuevas": zonas_nuevas,
-                "robadas": zonas_robadas,
-                "defendidas": zonas_defendidas,
-                "total": len(ids_hexagonos)
-            }
-        }
+        # Track con un único COPY en vez de un INSERT por punto
+        id_ruta, contadores = await registrar_carrera(
+            cur, id_runner_autenticado, distancia_km, carrera.tiempo_segundos, ids_hexagonos,
+            lambda cur, id_ruta: tracks.guardar_track(cur, id_ruta, carrera.puntos), huella, analisis
+        )
+        await conn.commit()
+        await cur.close()
+        cache.invalidar_tras_capturas(ids_hexagonos, contadores["cambiadas"])
+        return respuesta_carrera(id_ruta, contadores)
+
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- SUBIDA POR TROZOS (carreras muy largas) ---
+async def _estado_carga(cur, id_runner, clave):
+    await cur.execute(cargas.SQL_ESTADO, (id_runner, clave))
+    fila = await cur.fetchone()
+    if not fila:
+        raise HTTPException(status_code=404, detail="No existe esa carga")
+    estado, id_ruta, resultado, recibidos, ultimo_orden = fila
+    return {"clave": clave, "estado": estado, "puntos_recibidos": recibidos, "ultimo_orden": ultimo_orden,
+            "id_ruta": id_ruta, "resultado": resultado}
+
+
+@router.post("/carreras/cargas")
+async def abrir_carga(
+    datos: CargaInicio,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
+):
+    """Abre una subida por trozos. Si ya existía, devuelve su estado (para reanudarla)."""
+    if not 0 < len(datos.clave) <= cargas.MAX_LARGO_CLAVE:
+        raise HTTPException(status_code=400, detail=f"La clave debe tener entre 1 y {cargas.MAX_LARGO_CLAVE} caracteres")
+    try:
+        cur = conn.cursor()
+        await cur.execute(cargas.SQL_ABRIR, (id_runner_autenticado, datos.clave))
+        await conn.commit()
+        estado = await _estado_carga(cur, id_runner_autenticado, datos.clave)
+        await cur.close()
+        return estado
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/carreras/cargas/{clave}")
+async def ver_carga(
+    clave: str,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
+):
+    """Puntos recibidos y último 'orden' guardado: la app reenvía a partir de ahí."""
+    cur = conn.cursor()
+    estado = await _estado_carga(cur, id_runner_autenticado, clave)
+    await cur.close()
+    return estado
+
+
+@router.post("/carreras/cargas/{clave}/puntos")
+async def subir_trozo(
+    clave: str,
+    trozo: TrozoPuntos,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
+):
+    """Añade un trozo de puntos. Los 'orden' ya recibidos se ignoran (reintento seguro)."""
+    if len(trozo.puntos) > cargas.MAX_PUNTOS_TROZO:
+        raise HTTPException(status_code=413, detail=f"Máximo {cargas.MAX_PUNTOS_TROZO} puntos por trozo")
+    try:
+        cur = conn.cursor()
+        await cur.execute(cargas.SQL_SESION_PARA_TROZO, (id_runner_autenticado, clave))
+        fila = await cur.fetchone()
+        if not fila:
+            raise HTTPException(status_code=404, detail="No existe esa carga")
+        if fila[0] != "ABIERTA":
+            raise HTTPException(status_code=409, detail="La carga ya está finalizada")
+        await cur.insertar_lotes(cargas.SQL_INSERTAR_PUNTOS, cargas.filas_trozo(id_runner_autenticado, clave, trozo.puntos),
+                                 tracks.TAM_PAGINA_INSERT)
+        await conn.commit()
+        await cur.close()
+        return {"clave": clave, "aceptados": len(trozo.puntos)}
+    except HTTPException:
+        await conn.rollback()
+        raise
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
 
+
+@router.post("/carreras/cargas/{clave}/finalizar")
+async def finalizar_carga(
+    clave: str,
+    datos: CargaFinal,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
+):
+    """Crea la ruta y calcula el territorio con los puntos subidos. Repetirlo devuelve el mismo resultado."""
+    try:
+        cur = conn.cursor()
+        # FOR UPDATE: dos 'finalizar' a la vez de la misma carga se ponen en fila
+        await cur.execute(cargas.SQL_SESION_PARA_FINALIZAR, (id_runner_autenticado, clave))
+        fila = await cur.fetchone()
+        if not fila:
+            raise HTTPException(status_code=404, detail="No existe esa carga")
+        if fila[0] == "FINALIZADA":
+            await conn.rollback()
+            return fila[1]
+
+        lats, lons, segundos = await cargas.puntos(cur, id_runner_autenticado, clave)
+        if len(lats) == 0:
+            raise HTTPException(status_code=400, detail="La carga no tiene puntos")
+        distancia_km, analisis = validar_track(lats, lons, segundos)
+        validar_carrera(distancia_km, datos.tiempo_segundos)
+        ids_hexagonos = await ejecutor.ejecutar_async(motor_h3.celdas_recorridas, lats, lons, RESOLUCION_H3,
+                                                      tamano=len(lats))
+        huella = await calcular_huella(ids_hexagonos, lats, lons)
+
+        if tracks.COMPACTO:
+            guardar_puntos = lambda cur, id_ruta: tracks.guardar_compacto(cur, id_ruta, lats, lons, segundos)
+        else:
+            guardar_puntos = lambda cur, id_ruta: cur.execute(cargas.SQL_COPIAR_TRACK, (id_ruta, id_runner_autenticado, clave))
+        id_ruta, contadores = await registrar_carrera(
+            cur, id_runner_autenticado, distancia_km, datos.tiempo_segundos, ids_hexagonos, guardar_puntos,
+            huella, analisis
+        )
+        resultado = respuesta_carrera(id_ruta, contadores)
+        await cur.execute(cargas.SQL_CERRAR, (id_ruta, json.dumps(resultado), id_runner_autenticado, clave))
+        await cur.execute(cargas.SQL_BORRAR_PUNTOS, (id_runner_autenticado, clave))
+        await conn.commit()
+        await cur.close()
+        cache.invalidar_tras_capturas(ids_hexagonos, contadores["cambiadas"])
+        return resultado
+    except HTTPException:
+        await conn.rollback()
+        raise
     except Exception as e:
-        if conn: conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/carreras/historial/{id_runner}")
-def ver_mis_carreras(id_runner: int):
+def ver_mis_carreras(id_runner: int, conn=Depends(obtener_conexion)):
     # (El código del historial sigue igual, no hace falta cambiarlo)
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
         sql = """
@@ -195,7 +369,7 @@ def ver_mis_carreras(id_runner: int):
         """
         cur.execute(sql, (id_runner,))
         filas = cur.fetchall()
-        cur.close(); conn.close()
+        cur.close()
         lista = []
         for f in filas:
             dist_km = f[2] / 1000 if f[2] else 0
@@ -207,5 +381,43 @@ def ver_mis_carreras(id_runner: int):
             })
         return {"historial": lista}
     except Exception as e:
-        conn.close()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Sin fila de preferencias las rutas son públicas (mismo valor por defecto que /usuario/preferencias)
+SQL_PERMISO_TRACK = """
+    SELECT r.id_runner, COALESCE(p.rutas_publicas, TRUE)
+    FROM ruta r LEFT JOIN preferencia_privacidad p ON p.id_runner = r.id_runner
+    WHERE r.id_ruta = %s;
+"""
+
+@router.get("/carreras/{id_ruta}/track")
+async def reproducir_track(
+    id_ruta: int,
+    binario: bool = False,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
+):
+    """
+    Puntos de una ruta para reproducirla: [[lat, lon, segundos], ...].
+    Con ?binario=true devuelve el blob compacto tal cual (ver src/formato_track.py).
+    Solo para su dueño o si el dueño tiene las rutas públicas (el track revela casa y trabajo).
+    """
+    try:
+        cur = conn.cursor()
+        await cur.execute(SQL_PERMISO_TRACK, (id_ruta,))
+        permiso = await cur.fetchone()
+        visible = permiso is not None and (permiso[0] == id_runner_autenticado or permiso[1])
+        blob = await tracks.leer_blob(cur, id_ruta) if visible else None
+        await cur.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not visible:
+        # Mismo 404 para las privadas y las que no existen: así no se pueden ir probando ids
+        raise HTTPException(status_code=404, detail="Ruta no encontrada")
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Esta ruta no tiene track")
+    if binario:
+        return Response(content=blob, media_type="application/octet-stream")
+    lats, lons, segundos = formato_track.decodificar(blob)
+    return {"id_ruta": id_ruta, "total": len(lats),
+            "puntos": np.column_stack((lats, lons, segundos)).round(6).tolist()}
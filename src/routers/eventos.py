@@ -0,0 +1,55 @@
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from src.dependencies import obtener_runner_actual
+from src import eventos, motor_h3
+
+router = APIRouter()
+
+MAX_AREA_VISTA_KM2 = 20000   # Vistas más grandes: que se suscriban con menos zoom o sin caja
+
+
+def _sse(lote):
+    if lote is None:
+        return ": latido\n\n"
+    return "event: lote\ndata: " + json.dumps(lote, ensure_ascii=False) + "\n\n"
+
+
+@router.get("/eventos")
+async def suscribirse_eventos(
+    request: Request,
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    id_runner_autenticado: int = Depends(obtener_runner_actual)
+):
+    """
+    Server-Sent Events: cada mensaje 'lote' es una lista JSON de eventos (zonas, logro,
+    seguidor, resincronizar). Con una caja se reciben además las conquistas dentro de ella.
+    Para cambiar de vista, se cierra la conexión y se abre otra.
+    """
+    caja = (min_lat, min_lon, max_lat, max_lon)
+    padres = ()
+    if any(v is not None for v in caja):
+        if None in caja or not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise HTTPException(status_code=400, detail="Caja de coordenadas no válida")
+        if motor_h3.area_bbox_km2(*caja) > MAX_AREA_VISTA_KM2:
+            raise HTTPException(status_code=400, detail="La vista es demasiado grande para seguirla en vivo")
+        padres = eventos.padres_de_vista(*caja)
+
+    suscripcion = eventos.suscribir(id_runner_autenticado, padres)
+
+    async def flujo():
+        try:
+            yield "retry: 3000\n\n"
+            async for lote in suscripcion.lotes():
+                if await request.is_disconnected():
+                    break
+                yield _sse(lote)
+        finally:
+            eventos.cancelar(suscripcion)
+
+    return StreamingResponse(flujo(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,6 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends # <--- Importamos Depends
+import bisect
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Response # <--- Importamos Depends
 from pydantic import BaseModel
-from src.database import get_db_connection
+import numpy as np
+import h3.api.basic_int as h3_int
+from src.database_async import obtener_conexion_async
+from src import cache, motor_h3, regiones
+from src.motor_h3 import RESOLUCION_H3, RESOLUCION_TESELA
 from src.dependencies import obtener_runner_actual # <--- Importamos seguridad
 
 router = APIRouter()
@@ -15,32 +22,37 @@ class ZonaCreate(BaseModel):
 
 # --- PROTEGEMOS LA CREACIÓN DE ZONAS ---
 @router.post("/zonas")
-def crear_zona(
+async def crear_zona(
     nueva_zona: ZonaCreate,
     # Al pedir el token, nos aseguramos de que al menos es un usuario registrado.
     # (En el futuro, aquí verificaríamos si id_runner_autenticado es ADMIN)
-    id_runner_autenticado: int = Depends(obtener_runner_actual) 
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion_async)
 ):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
-        sql = "INSERT INTO zona (sistema_grid, codigo_celda, geometria, pais, provincia, municipio) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id_zona;"
-        cur.execute(sql, (nueva_zona.sistema_grid, nueva_zona.codigo_celda, nueva_zona.geometria, nueva_zona.pais, nueva_zona.provincia, nueva_zona.municipio))
-        id_gen = cur.fetchone()[0]
-        conn.commit()
-        cur.close(); conn.close()
+        # Región por nombre (el id de estas zonas no es una celda H3): el municipio o, si no se conoce, el país
+        id_region = next(iter(regiones.buscar(nueva_zona.municipio, "MUNICIPIO", nueva_zona.pais)
+                              or regiones.buscar(nueva_zona.pais, "PAIS")), None)
+        sql = "INSERT INTO zona (sistema_grid, codigo_celda, geometria, pais, provincia, municipio, id_region) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id_zona;"
+        await cur.execute(sql, (nueva_zona.sistema_grid, nueva_zona.codigo_celda, nueva_zona.geometria, nueva_zona.pais, nueva_zona.provincia, nueva_zona.municipio, id_region))
+        id_gen = (await cur.fetchone())[0]
+        await conn.commit()
+        await cur.close()
+        cache.cache_global.invalidar("mapa:")
         return {"mensaje": "Zona registrada", "id_zona": id_gen}
     except Exception as e:
-        if conn: conn.rollback()
+        await conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 # --- LOS GET LOS DEJAMOS PÚBLICOS ---
-@router.get("/zonas/mapa/estado")
-def obtener_estado_mapa():
-    conn = get_db_connection()
-    # ... (El resto del código de lectura se queda igual, sin Depends) ...
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+@router.get("/zonas/mapa/estado", deprecated=True)
+async def obtener_estado_mapa():
+    """Mapa ENTERO de golpe. Obsoleto: crece sin límite, usar /zonas/mapa/vista."""
+    # Todo el mundo ve el mismo mapa: lo cacheamos unos segundos (se invalida al capturar)
+    return await cache.consultar_async("mapa:estado", _calcular_estado_mapa, ttl=15, obsoleto=60)
+
+async def _calcular_estado_mapa(conn):
     try:
         cur = conn.cursor()
         sql = """
@@ -50,9 +62,9 @@ def obtener_estado_mapa():
             LEFT JOIN runner r ON cz.id_runner = r.id_runner
             ORDER BY z.id_zona, cz.fecha_hora DESC;
         """
-        cur.execute(sql)
-        zonas = cur.fetchall()
-        cur.close(); conn.close()
+        await cur.execute(sql)
+        zonas = await cur.fetchall()
+        await cur.close()
         
         lista_mapa = []
         for z in zonas:
@@ -60,14 +72,227 @@ def obtener_estado_mapa():
             lista_mapa.append({"id_zona": z[0], "municipio": z[1], "propietario": dueno, "conquistada_el": z[3]})
         return {"total_zonas": len(lista_mapa), "mapa": lista_mapa}
     except Exception as e:
-        conn.close()
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- MAPA POR VISTA (bbox o celda padre + zoom) ---
+# Solo devolvemos lo que el cliente tiene en pantalla. Las zonas conquistadas son celdas H3
+# de RESOLUCION_H3 y los descendientes de una celda forman un rango contiguo de ids, así que
+# "zonas dentro de la vista" son unos pocos BETWEEN sobre la clave primaria de zona.
+# Con poco zoom agrupamos por celda padre y pintamos el equipo con más zonas dentro: ese
+# GROUP BY recorre todas las zonas de la vista sea cual sea la página, así que se calcula
+# entero una vez (en la primera página) y las siguientes se cortan de la caché.
+
+# Resolución H3 que se pinta en cada nivel de zoom del mapa (0 = mundo entero, 20 = calle)
+RESOLUCION_POR_ZOOM = [0, 0, 1, 1, 2, 2, 3, 4, 4, 5, 5, 6, 6, 7, 8, 8, 9, 10, 10, 10, 10]
+MAX_CELDAS_COBERTURA = 500   # Rangos como mucho en la consulta de una vista
+LIMITE_MAXIMO = 5000
+
+SQL_VISTA_CELDAS = """
+    SELECT z.id_zona, z.id_equipo, z.color_hex, z.id_runner, z.fuerza
+    FROM unnest(%s::bigint[], %s::bigint[]) AS r(lo, hi)
+    JOIN zona z ON z.id_zona BETWEEN r.lo AND r.hi
+    WHERE z.id_runner IS NOT NULL AND z.id_zona > %s
+    ORDER BY z.id_zona
+    LIMIT %s;
+"""
+
+# padre = (id & y) | o  (ver motor_h3.mascaras_padre)
+SQL_VISTA_AGREGADA = """
+    WITH por_equipo AS (
+        SELECT (z.id_zona & %s::bigint) | %s::bigint AS padre, z.id_equipo, z.color_hex, COUNT(*) AS zonas
+        FROM unnest(%s::bigint[], %s::bigint[]) AS r(lo, hi)
+        JOIN zona z ON z.id_zona BETWEEN r.lo AND r.hi
+        WHERE z.id_runner IS NOT NULL
+        GROUP BY 1, 2, 3
+    ), dominante AS (
+        SELECT padre, id_equipo, color_hex,
+               SUM(zonas) OVER (PARTITION BY padre) AS total,
+               ROW_NUMBER() OVER (PARTITION BY padre ORDER BY zonas DESC, id_equipo NULLS LAST) AS puesto
+        FROM por_equipo
+    )
+    SELECT padre, id_equipo, color_hex, total FROM dominante
+    WHERE puesto = 1
+    ORDER BY padre;
+"""
+
+
+def _leer_celda(texto):
+    """Acepta el id de la celda en decimal o en hexadecimal (el formato habitual de H3)."""
+    try:
+        celda = int(texto) if texto.isdigit() else int(texto, 16)
+    except ValueError:
+        celda = None
+    if celda is None or not h3_int.is_valid_cell(celda):
+        raise HTTPException(status_code=400, detail="Celda H3 no válida")
+    return celda
+
+
+@router.get("/zonas/mapa/vista")
+async def obtener_vista_mapa(
+    zoom: int,
+    min_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    celda: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limite: int = 500
+):
+    """
+    Zonas conquistadas dentro de una caja (min/max lat/lon) o bajo una celda H3 padre.
+    Si la caja cruza el antimeridiano, min_lon > max_lon. Se pagina con 'siguiente_cursor'.
+    """
+    if not 0 <= zoom < len(RESOLUCION_POR_ZOOM):
+        raise HTTPException(status_code=400, detail=f"zoom debe estar entre 0 y {len(RESOLUCION_POR_ZOOM) - 1}")
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"limite debe estar entre 1 y {LIMITE_MAXIMO}")
+    resolucion = RESOLUCION_POR_ZOOM[zoom]
+
+    caja = (min_lat, min_lon, max_lat, max_lon)
+    if celda is not None:
+        padre = _leer_celda(celda)
+        res_padre = h3_int.get_resolution(padre)
+        if res_padre > RESOLUCION_H3:
+            raise HTTPException(status_code=400, detail=f"La celda no puede ser más fina que la resolución {RESOLUCION_H3}")
+        resolucion = max(resolucion, res_padre)
+        rangos = [motor_h3.rango_descendientes(padre)]
+        clave_vista = f"celda={padre}"
+    elif None not in caja:
+        if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180) or min_lon == max_lon:
+            raise HTTPException(status_code=400, detail="Caja de coordenadas no válida")
+        # Redondeamos (~10 m) para que vistas casi iguales compartan entrada de caché
+        caja = tuple(round(v, 4) for v in caja)
+        rangos = motor_h3.rangos_bbox(*caja, resolucion_maxima=resolucion, max_celdas=MAX_CELDAS_COBERTURA)
+        clave_vista = "caja=" + ",".join(map(str, caja))
+    else:
+        raise HTTPException(status_code=400, detail="Indica una caja (min_lat, min_lon, max_lat, max_lon) o una celda")
+
+    # El cursor es la última celda de la página anterior: una celda H3 de la resolución pintada
+    if cursor is not None and not (0 < cursor < 2 ** 63 and h3_int.is_valid_cell(cursor)
+                                   and h3_int.get_resolution(cursor) == resolucion):
+        raise HTTPException(status_code=400, detail="cursor no válido para esta vista")
+
+    if resolucion >= RESOLUCION_H3:
+        clave = f"mapa:vista:{clave_vista}:r{resolucion}:c{cursor}:l{limite}"
+        celdas = await cache.consultar_async(clave, lambda conn: _calcular_vista(conn, rangos, cursor, limite),
+                                             ttl=15, obsoleto=60, rangos=rangos)
+    else:
+        clave = f"mapa:vista:{clave_vista}:r{resolucion}"
+        agregada = await cache.consultar_async(clave, lambda conn: _calcular_agregada(conn, rangos, resolucion),
+                                               ttl=15, obsoleto=60, rangos=rangos)
+        inicio = bisect.bisect_right(agregada, cursor, key=lambda c: c["id_celda"]) if cursor else 0
+        celdas = agregada[inicio:inicio + limite]
+
+    siguiente = celdas[-1]["id_celda"] if len(celdas) == limite else None
+    return {"resolucion": resolucion, "total": len(celdas), "celdas": celdas, "siguiente_cursor": siguiente}
+
+async def _calcular_vista(conn, rangos, cursor, limite):
+    try:
+        cur = conn.cursor()
+        await cur.execute(SQL_VISTA_CELDAS, ([lo for lo, _ in rangos], [hi for _, hi in rangos], cursor or 0, limite))
+        filas = await cur.fetchall()
+        await cur.close()
+        return [{"id_celda": f[0], "id_equipo": f[1], "color_hex": f[2], "id_runner": f[3], "fuerza": f[4], "zonas": 1}
+                for f in filas]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _calcular_agregada(conn, rangos, resolucion):
+    """Todas las celdas padre con zonas de la vista, ordenadas por id (para cortar páginas)."""
+    try:
+        y, o = motor_h3.mascaras_padre(resolucion)
+        cur = conn.cursor()
+        await cur.execute(SQL_VISTA_AGREGADA, (y, o, [lo for lo, _ in rangos], [hi for _, hi in rangos]))
+        filas = await cur.fetchall()
+        await cur.close()
+        return [{"id_celda": f[0], "id_equipo": f[1], "color_hex": f[2], "zonas": f[3]} for f in filas]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- TESELAS BINARIAS POR CELDA PADRE ---
+# Una tesela es una celda H3 de RESOLUCION_TESELA con todas sus zonas conquistadas,
+# empaquetadas como registros little-endian de 12 bytes: id de celda (int64) + id de
+# equipo (int32, 0 si el runner no tiene equipo). Llevan ETag con el hash del contenido:
+# el cliente (o el proxy) manda If-None-Match y si nada ha cambiado recibe un 304 vacío.
+# En caché cada tesela solo se invalida cuando una carrera o el decaimiento cambian el dueño de
+# una celda suya: todos los workers lo ven por el evento "zonas" (src/eventos.py).
+FORMATO_TESELA = np.dtype([("celda", "<i8"), ("equipo", "<i4")])
+
+SQL_TESELA = """
+    SELECT id_zona, COALESCE(id_equipo, 0) FROM zona
+    WHERE id_zona BETWEEN %s AND %s AND id_runner IS NOT NULL
+    ORDER BY id_zona;
+"""
+
+@router.get("/zonas/teselas/{celda}")
+async def obtener_tesela(celda: str, if_none_match: Optional[str] = Header(None)):
+    """Tesela binaria de una celda H3 de resolución RESOLUCION_TESELA (id en decimal o hex)."""
+    padre = _leer_celda(celda)
+    if h3_int.get_resolution(padre) != RESOLUCION_TESELA:
+        raise HTTPException(status_code=400, detail=f"Las teselas son celdas de resolución {RESOLUCION_TESELA}")
+
+    contenido, etag = await cache.consultar_async(cache.clave_tesela(padre), lambda conn: _calcular_tesela(conn, padre),
+                                                  ttl=300, obsoleto=0)
+    cabeceras = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    # If-None-Match puede traer varias etiquetas y con prefijo débil (W/)
+    if if_none_match and (if_none_match.strip() == "*" or
+                          etag in [e.strip().removeprefix("W/") for e in if_none_match.split(",")]):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=contenido, media_type="application/octet-stream", headers=cabeceras)
+
+async def _calcular_tesela(conn, padre):
+    try:
+        cur = conn.cursor()
+        await cur.execute(SQL_TESELA, motor_h3.rango_descendientes(padre))
+        filas = await cur.fetchall()
+        await cur.close()
+        contenido = np.array(filas, dtype=FORMATO_TESELA).tobytes()
+        etag = '"' + hashlib.blake2b(contenido, digest_size=12).hexdigest() + '"'
+        return contenido, etag
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- CAMBIOS DEL MAPA DESDE UNA VERSIÓN ---
+# El cliente guarda la 'version' (y 'id_zona') de la respuesta y los manda como 'desde' (y
+# 'desde_zona') en el siguiente refresco: solo viajan las celdas que cambiaron de dueño,
+# equipo o color. La versión es el id de la transacción que cambió la zona y solo se leen
+# las de transacciones anteriores al xmin de la instantánea: esas ya terminaron todas y
+# ninguna transacción nueva puede escribir por debajo, así que el cursor nunca se salta un
+# cambio que aún no se había confirmado. Una transacción larga retrasa los cambios, no los pierde.
+LIMITE_CAMBIOS_MAXIMO = 10000
+
+SQL_CAMBIOS = """
+    SELECT id_zona, id_runner, id_equipo, color_hex, version
+    FROM zona
+    WHERE (version, id_zona) > (%s::bigint, %s::bigint)
+      AND version < (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint
+    ORDER BY version, id_zona
+    LIMIT %s;
+"""
+
+@router.get("/zonas/mapa/cambios")
+async def obtener_cambios_mapa(desde: int = 0, desde_zona: Optional[int] = None, limite: int = 2000,
+                               conn=Depends(obtener_conexion_async)):
+    """Celdas cambiadas desde la versión 'desde'. Si 'hay_mas', volver a pedir con la nueva versión e id_zona."""
+    if desde < 0 or not 1 <= limite <= LIMITE_CAMBIOS_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"desde >= 0 y limite entre 1 y {LIMITE_CAMBIOS_MAXIMO}")
+    try:
+        cur = conn.cursor()
+        # Sin 'desde_zona' se empieza después de todas las zonas de la versión 'desde'
+        zona_inicial = desde_zona if desde_zona is not None else int(np.iinfo(np.int64).max)
+        await cur.execute(SQL_CAMBIOS, (desde, zona_inicial, limite))
+        filas = await cur.fetchall()
+        await cur.close()
+
+        cambios = [{"id_celda": f[0], "id_runner": f[1], "id_equipo": f[2], "color_hex": f[3]} for f in filas]
+        version, id_zona = (filas[-1][4], filas[-1][0]) if filas else (desde, desde_zona)
+        return {"version": version, "id_zona": id_zona, "total": len(cambios), "hay_mas": len(filas) == limite,
+                "cambios": cambios}
+    except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/zonas/{id_zona}/info")
-def info_zona_detalle(id_zona: int):
-    conn = get_db_connection()
-    # ... (Este también público) ...
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+async def info_zona_detalle(id_zona: int, conn=Depends(obtener_conexion_async)):
     try:
         cur = conn.cursor()
         sql = """
@@ -75,13 +300,12 @@ def info_zona_detalle(id_zona: int):
             JOIN runner r ON cz.id_runner = r.id_runner
             WHERE cz.id_zona = %s ORDER BY cz.fecha_hora DESC LIMIT 1;
         """
-        cur.execute(sql, (id_zona,))
-        resultado = cur.fetchone()
-        cur.close(); conn.close()
+        await cur.execute(sql, (id_zona,))
+        resultado = await cur.fetchone()
+        await cur.close()
         if resultado:
             return {"estado": "OCUPADA", "propietario": resultado[0], "fecha": resultado[1]}
         else:
             return {"estado": "LIBRE", "mensaje": "Esta zona es neutral. ¡Corre a por ella!"}
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,29 +1,35 @@
-from fastapi import APIRouter, HTTPException
-from src.database import get_db_connection
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends
+from src.database_async import obtener_conexion_async
+from src import cache, regiones
 import datetime 
 
 router = APIRouter()
 
+# --- CACHÉ (mismo resultado para todos, cambia en segundos) ---
+TTL_RANKING = 30        # Segundos que el dato se da por bueno
+OBSOLETO_RANKING = 120  # Segundos extra sirviendo el dato viejo mientras se recalcula
+
 # --- 1. RANKING GLOBAL ---
 @router.get("/ranking/global")
-def ranking_global():
+async def ranking_global():
     """Top 10 jugadores con más puntos en todo el juego"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+    return await cache.consultar_async("ranking:global", _calcular_ranking_global, ttl=TTL_RANKING, obsoleto=OBSOLETO_RANKING)
+
+async def _calcular_ranking_global(conn):
     try:
         cur = conn.cursor()
+        # Marcador pre-agregado (src/clasificaciones.py): leemos solo el top 10 por índice
         sql = """
-            SELECT r.username, SUM(cz.puntos_ganados) as total
-            FROM captura_zona cz
-            JOIN runner r ON cz.id_runner = r.id_runner
-            GROUP BY r.username
-            ORDER BY total DESC
+            SELECT r.username, p.puntos
+            FROM puntuacion_runner p
+            JOIN runner r ON p.id_runner = r.id_runner
+            ORDER BY p.puntos DESC
             LIMIT 10;
         """
-        cur.execute(sql)
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
+        await cur.execute(sql)
+        resultados = await cur.fetchall()
+        await cur.close()
         
         # Formateamos la respuesta como le gusta a tu Front
         return {
@@ -31,139 +37,141 @@ def ranking_global():
             "ranking": [{"pos": i+1, "user": r[0], "pts": r[1]} for i, r in enumerate(resultados)]
         }
     except Exception as e:
-        if conn: conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- RANKINGS REGIONALES ---
+# Marcador por región (puntuacion_region): el top 10 es un recorrido del índice
+# (id_region, puntos DESC). El nombre se traduce a id con el índice en memoria de src/regiones.py.
+async def _top_region(conn, id_region):
+    cur = conn.cursor()
+    sql = """
+        SELECT r.username, p.puntos
+        FROM puntuacion_region p
+        JOIN runner r ON p.id_runner = r.id_runner
+        WHERE p.id_region = %s
+        ORDER BY p.puntos DESC
+        LIMIT 10;
+    """
+    await cur.execute(sql, (id_region,))
+    resultados = await cur.fetchall()
+    await cur.close()
+    return [{"pos": i+1, "user": r[0], "pts": r[1]} for i, r in enumerate(resultados)]
+
+
+def _id_unico(ids, descripcion):
+    """El único id encontrado; 404 si no hay ninguno y 409 (con las opciones) si hay varios."""
+    if not ids:
+        raise HTTPException(status_code=404, detail=f"{descripcion} desconocido")
+    if len(ids) > 1:
+        opciones = [regiones.region(regiones.ancestros(i)[-1])["nombre"] for i in ids]
+        raise HTTPException(status_code=409, detail={"mensaje": f"{descripcion} ambiguo, indica ?pais=",
+                                                     "paises": opciones})
+    return ids[0]
+
+
 # --- 2. RANKING POR PAÍS ---
 @router.get("/ranking/pais/{pais}")
-def ranking_pais(pais: str):
+async def ranking_pais(pais: str, conn=Depends(obtener_conexion_async)):
     """Top 10 jugadores con más puntos en un país concreto (ej: España)"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+    id_region = _id_unico(regiones.buscar(pais, "PAIS"), "País")
     try:
-        cur = conn.cursor()
-        # JOIN con ZONA para filtrar por país
-        sql = """
-            SELECT r.username, SUM(cz.puntos_ganados) as total
-            FROM captura_zona cz
-            JOIN runner r ON cz.id_runner = r.id_runner
-            JOIN zona z ON cz.id_zona = z.id_zona
-            WHERE z.pais = %s
-            GROUP BY r.username
-            ORDER BY total DESC
-            LIMIT 10;
-        """
-        cur.execute(sql, (pais,))
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
-        
         return {
-            "titulo": f"🇪🇸 TOP {pais.upper()}", 
-            "ranking": [{"pos": i+1, "user": r[0], "pts": r[1]} for i, r in enumerate(resultados)]
+            "titulo": f"🇪🇸 TOP {regiones.region(id_region)['nombre'].upper()}",
+            "ranking": await _top_region(conn, id_region)
         }
     except Exception as e:
-        if conn: conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- 3. RANKING POR CIUDAD ---
 @router.get("/ranking/ciudad/{municipio}")
-def ranking_ciudad(municipio: str):
-    """Top 10 jugadores en una ciudad concreta (ej: Madrid)"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+async def ranking_ciudad(municipio: str, pais: Optional[str] = None, conn=Depends(obtener_conexion_async)):
+    """Top 10 jugadores en una ciudad concreta (ej: Madrid; ?pais=... si el nombre se repite)"""
+    id_region = _id_unico(regiones.buscar(municipio, "MUNICIPIO", pais), "Municipio")
     try:
-        cur = conn.cursor()
-        # JOIN con ZONA para filtrar por municipio
-        sql = """
-            SELECT r.username, SUM(cz.puntos_ganados) as total
-            FROM captura_zona cz
-            JOIN runner r ON cz.id_runner = r.id_runner
-            JOIN zona z ON cz.id_zona = z.id_zona
-            WHERE z.municipio = %s
-            GROUP BY r.username
-            ORDER BY total DESC
-            LIMIT 10;
-        """
-        cur.execute(sql, (municipio,))
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
-        
         return {
-            "titulo": f"🏙️ TOP {municipio.upper()}", 
-            "ranking": [{"pos": i+1, "user": r[0], "pts": r[1]} for i, r in enumerate(resultados)]
+            "titulo": f"🏙️ TOP {regiones.region(id_region)['nombre'].upper()}",
+            "ranking": await _top_region(conn, id_region)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- 4. RANKING POR REGIÓN (por id) ---
+@router.get("/ranking/region/{id_region}")
+async def ranking_region(id_region: int, conn=Depends(obtener_conexion_async)):
+    """Top 10 jugadores de una región cualquiera (país o municipio) por su id"""
+    datos = regiones.region(id_region)
+    if datos is None:
+        raise HTTPException(status_code=404, detail="Región desconocida")
+    try:
+        return {
+            "titulo": f"📍 TOP {datos['nombre'].upper()}",
+            "region": {"id_region": id_region, "tipo": datos["tipo"], "nombre": datos["nombre"],
+                       "id_padre": datos["id_padre"]},
+            "ranking": await _top_region(conn, id_region)
         }
     except Exception as e:
-        if conn: conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # --- RANKING POR TEMPORADA ---
 @router.get("/ranking/temporada")
-def ranking_temporada_actual():
+async def ranking_temporada_actual(conn=Depends(obtener_conexion_async)):
     """Top jugadores SOLO contando los puntos de la temporada actual"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
         
-        # 1. Sacamos las fechas de la temporada actual
+        # 1. Sacamos la temporada actual
         ahora = datetime.datetime.now()
-        cur.execute("SELECT fecha_inicio, fecha_fin FROM temporada WHERE %s BETWEEN fecha_inicio AND fecha_fin LIMIT 1", (ahora,))
-        temp = cur.fetchone()
+        await cur.execute("SELECT id_temporada FROM temporada WHERE %s BETWEEN fecha_inicio AND fecha_fin LIMIT 1", (ahora,))
+        temp = await cur.fetchone()
         
         if not temp:
             return {"mensaje": "No hay temporada activa, no hay ranking estacional."}
             
-        inicio, fin = temp
+        id_temporada = temp[0]
         
-        # 2. Calculamos puntos filtrando por fecha
+        # 2. Leemos el marcador de esa temporada
         sql = """
-            SELECT r.username, SUM(cz.puntos_ganados) as total
-            FROM captura_zona cz
-            JOIN runner r ON cz.id_runner = r.id_runner
-            WHERE cz.fecha_hora BETWEEN %s AND %s
-            GROUP BY r.username
-            ORDER BY total DESC
+            SELECT r.username, p.puntos
+            FROM puntuacion_temporada p
+            JOIN runner r ON p.id_runner = r.id_runner
+            WHERE p.id_temporada = %s
+            ORDER BY p.puntos DESC
             LIMIT 10;
         """
-        cur.execute(sql, (inicio, fin))
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
+        await cur.execute(sql, (id_temporada,))
+        resultados = await cur.fetchall()
+        await cur.close()
         
         return {
             "titulo": "📅 RANKING DE TEMPORADA", 
             "ranking": [{"pos": i+1, "user": r[0], "pts": r[1]} for i, r in enumerate(resultados)]
         }
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- RANKING DE EQUIPOS ---
 @router.get("/ranking/equipos")
-def ranking_equipos():
+async def ranking_equipos():
     """Top Equipos (Suma de los puntos de todos sus miembros)"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+    return await cache.consultar_async("ranking:equipos", _calcular_ranking_equipos, ttl=TTL_RANKING, obsoleto=OBSOLETO_RANKING)
+
+async def _calcular_ranking_equipos(conn):
     try:
         cur = conn.cursor()
         
-        # JOIN Múltiple: Equipo -> Miembros -> Capturas
+        # Marcador de equipos (suma de sus miembros, mantenida al capturar)
         sql = """
-            SELECT e.nombre, SUM(cz.puntos_ganados) as total_equipo
-            FROM equipo e
-            JOIN runner_equipo re ON e.id_equipo = re.id_equipo
-            JOIN captura_zona cz ON re.id_runner = cz.id_runner
-            GROUP BY e.nombre
-            ORDER BY total_equipo DESC
+            SELECT e.nombre, p.puntos
+            FROM puntuacion_equipo p
+            JOIN equipo e ON p.id_equipo = e.id_equipo
+            ORDER BY p.puntos DESC
             LIMIT 10;
         """
-        cur.execute(sql)
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
+        await cur.execute(sql)
+        resultados = await cur.fetchall()
+        await cur.close()
         
         lista = []
         for i, r in enumerate(resultados):
@@ -173,43 +181,38 @@ def ranking_equipos():
         return {"titulo": "🛡️ MEJORES CLANES", "ranking": lista}
         
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
     
 
 @router.get("/ranking/equipos/temporada")
-def ranking_equipos_temporada():
+async def ranking_equipos_temporada(conn=Depends(obtener_conexion_async)):
     """Top Equipos SOLO sumando los puntos conseguidos en la TEMPORADA ACTUAL"""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
         
-        # 1. Sacamos fechas de la temporada actual
+        # 1. Sacamos la temporada actual
         ahora = datetime.datetime.now()
-        cur.execute("SELECT fecha_inicio, fecha_fin, nombre FROM temporada WHERE %s BETWEEN fecha_inicio AND fecha_fin LIMIT 1", (ahora,))
-        temp = cur.fetchone()
+        await cur.execute("SELECT id_temporada, nombre FROM temporada WHERE %s BETWEEN fecha_inicio AND fecha_fin LIMIT 1", (ahora,))
+        temp = await cur.fetchone()
         
         if not temp:
             return {"mensaje": "No hay temporada activa, no hay ranking de equipos estacional."}
             
-        inicio, fin, nombre_temp = temp
+        id_temporada, nombre_temp = temp
         
-        # 2. SQL Mágico: Equipos + Miembros + Capturas (Filtradas por fecha)
+        # 2. Marcador de equipos de esa temporada
         sql = """
-            SELECT e.nombre, SUM(cz.puntos_ganados) as total_equipo
-            FROM equipo e
-            JOIN runner_equipo re ON e.id_equipo = re.id_equipo
-            JOIN captura_zona cz ON re.id_runner = cz.id_runner
-            WHERE cz.fecha_hora BETWEEN %s AND %s  -- <--- AQUÍ ESTÁ LA CLAVE
-            GROUP BY e.nombre
-            ORDER BY total_equipo DESC
+            SELECT e.nombre, p.puntos
+            FROM puntuacion_equipo_temporada p
+            JOIN equipo e ON p.id_equipo = e.id_equipo
+            WHERE p.id_temporada = %s
+            ORDER BY p.puntos DESC
             LIMIT 10;
         """
-        cur.execute(sql, (inicio, fin))
-        resultados = cur.fetchall()
-        cur.close(); conn.close()
+        await cur.execute(sql, (id_temporada,))
+        resultados = await cur.fetchall()
+        await cur.close()
         
         lista = []
         for i, r in enumerate(resultados):
@@ -222,5 +225,4 @@ def ranking_equipos_temporada():
         }
         
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
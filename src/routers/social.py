@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
-from src.database import get_db_connection
+from src.database import obtener_conexion
+from src.database_async import obtener_conexion_async
 from src.dependencies import obtener_runner_actual # <--- IMPORT SEGURIDAD
+from src import feed, notificaciones, eventos
+from typing import Optional
 import datetime
 
 router = APIRouter()
@@ -22,47 +25,42 @@ class SeguirRequest(BaseModel):
 
 # --- ENDPOINTS EQUIPOS ---
 @router.post("/equipos")
-def crear_equipo(equipo: EquipoCreate):
+def crear_equipo(equipo: EquipoCreate, conn=Depends(obtener_conexion)):
     # OJO: Aquí también podríamos protegerlo para saber quién es el fundador/admin.
     # De momento lo dejo abierto, pero idealmente debería llevar token.
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
         sql = "INSERT INTO equipo (nombre, descripcion, ciudad_base) VALUES (%s, %s, %s) RETURNING id_equipo;"
         cur.execute(sql, (equipo.nombre, equipo.descripcion, equipo.ciudad_base))
         id_equipo = cur.fetchone()[0]
         conn.commit()
-        cur.close(); conn.close()
+        cur.close()
         return {"mensaje": "¡Equipo Fundado! 🛡️", "id_equipo": id_equipo, "nombre": equipo.nombre}
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/equipos/unirse")
 def unirse_equipo(
     datos: UnirseEquipoRequest,
-    id_runner_autenticado: int = Depends(obtener_runner_actual) # <--- CANDADO
+    id_runner_autenticado: int = Depends(obtener_runner_actual), # <--- CANDADO
+    conn=Depends(obtener_conexion)
 ):
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
         sql = "INSERT INTO runner_equipo (id_runner, id_equipo, rol, fecha_union) VALUES (%s, %s, 'Miembro', NOW()) RETURNING fecha_union;"
         # Usamos id_runner_autenticado
         cur.execute(sql, (id_runner_autenticado, datos.id_equipo))
         conn.commit()
-        cur.close(); conn.close()
+        cur.close()
         return {"mensaje": "¡Te has unido al equipo! 🤝", "equipo_id": datos.id_equipo}
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al unirse: {str(e)}")
 
 @router.get("/equipos/{id_equipo}/miembros")
-def ver_miembros_equipo(id_equipo: int):
+def ver_miembros_equipo(id_equipo: int, conn=Depends(obtener_conexion)):
     # PÚBLICO
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
         sql = """
@@ -71,79 +69,109 @@ def ver_miembros_equipo(id_equipo: int):
         """
         cur.execute(sql, (id_equipo,))
         miembros = cur.fetchall()
-        cur.close(); conn.close()
+        cur.close()
         lista = [{"usuario": m[0], "rol": m[1], "desde": m[2]} for m in miembros]
         return {"id_equipo": id_equipo, "total_miembros": len(lista), "miembros": lista}
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- ENDPOINTS SOCIALES ---
 @router.post("/social/seguir")
 def seguir_usuario(
     datos: SeguirRequest,
-    id_runner_autenticado: int = Depends(obtener_runner_actual) # <--- CANDADO
+    id_runner_autenticado: int = Depends(obtener_runner_actual), # <--- CANDADO
+    conn=Depends(obtener_conexion)
 ):
     if id_runner_autenticado == datos.id_seguido: 
         raise HTTPException(status_code=400, detail="No puedes seguirte a ti mismo")
     
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     try:
         cur = conn.cursor()
         # id_seguidor es el token, id_seguido es el JSON
         cur.execute("INSERT INTO seguidor (id_seguidor, id_seguido, fecha_desde) VALUES (%s, %s, NOW())", (id_runner_autenticado, datos.id_seguido))
         cur.execute("INSERT INTO notificacion (id_runner, tipo, titulo, mensaje, leida, fecha_hora) VALUES (%s, 'SOCIAL', 'Nuevo Seguidor', '¡Alguien te sigue!', FALSE, NOW())", (datos.id_seguido,))
+        # Para no empezar con el feed vacío: sus últimas carreras entran ya en mi buzón
+        cur.execute(feed.SQL_COPIAR_AL_SEGUIR, (id_runner_autenticado, datos.id_seguido))
+        eventos.publicar(cur, eventos.evento_seguidor(datos.id_seguido, id_runner_autenticado))
         conn.commit()
-        cur.close(); conn.close()
+        cur.close()
         return {"mensaje": "¡Ahora sigues a este usuario! 👀"}
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/social/feed/{id_mi_usuario}")
-def obtener_feed_amigos(id_mi_usuario: int):
+async def obtener_feed_amigos(
+    id_mi_usuario: int,
+    cursor: Optional[str] = None,
+    limite: int = Query(20, ge=1, le=100),
+    conn=Depends(obtener_conexion_async)
+):
     # PÚBLICO (o podrías protegerlo también si quieres que sea TU feed)
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+    # Una entrada por carrera; la página siguiente se pide con ?cursor=<siguiente_cursor>
     try:
         cur = conn.cursor()
-        sql = """
-            SELECT r.username, z.municipio, cz.puntos_ganados, cz.fecha_hora, cz.tipo_captura
-            FROM captura_zona cz
-            JOIN runner r ON cz.id_runner = r.id_runner
-            JOIN zona z ON cz.id_zona = z.id_zona
-            WHERE cz.id_runner IN (SELECT id_seguido FROM seguidor WHERE id_seguidor = %s)
-            ORDER BY cz.fecha_hora DESC LIMIT 20;
-        """
-        cur.execute(sql, (id_mi_usuario,))
-        feed = [{"usuario": i[0], "accion": f"Conquistó una zona en {i[1]}", "puntos": i[2], "cuando": i[3]} for i in cur.fetchall()]
-        cur.close(); conn.close()
-        return {"feed": feed}
+        filas, siguiente = await feed.leer_feed(cur, id_mi_usuario, limite, cursor)
+        await cur.close()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
+    entradas = []
+    for id_actividad, fecha, usuario, id_ruta, distancia, duracion, nuevas, robadas, defendidas, puntos in filas:
+        zonas = nuevas + robadas + defendidas
+        accion = f"Corrió {distancia / 1000:.2f} km"
+        if zonas:
+            accion += f" y conquistó {zonas} zonas" + (f" ({robadas} robadas)" if robadas else "")
+        entradas.append({
+            "id_actividad": id_actividad, "usuario": usuario, "accion": accion, "puntos": puntos, "cuando": fecha,
+            "id_ruta": id_ruta, "distancia_metros": distancia, "duracion_segundos": duracion,
+            "zonas": {"nuevas": nuevas, "robadas": robadas, "defendidas": defendidas},
+        })
+    return {"feed": entradas, "siguiente_cursor": siguiente}
+
 @router.get("/notificaciones/{id_usuario}")
 def ver_notificaciones(
     id_usuario: int,
+    cursor: Optional[str] = None,
+    limite: int = Query(20, ge=1, le=100),
+    marcar_leidas: bool = True,
     # OJO: Este es muy sensible, mejor protegerlo para que nadie lea mis mensajes.
     # Como el endpoint pide {id_usuario} en la URL, podríamos comparar:
-    id_runner_autenticado: int = Depends(obtener_runner_actual)
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion)
 ):
     if id_usuario != id_runner_autenticado:
         raise HTTPException(status_code=403, detail="No puedes leer notificaciones ajenas")
 
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
+    # Paginado: solo se marcan como leídas las de esta página
     try:
         cur = conn.cursor()
-        cur.execute("SELECT tipo, titulo, mensaje, fecha_hora, leida FROM notificacion WHERE id_runner = %s ORDER BY fecha_hora DESC", (id_runner_autenticado,))
-        notis = [{"tipo":n[0], "titulo":n[1], "mensaje":n[2], "fecha":n[3], "nueva":not n[4]} for n in cur.fetchall()]
-        cur.execute("UPDATE notificacion SET leida = TRUE WHERE id_runner = %s", (id_runner_autenticado,))
+        filas, siguiente = notificaciones.leer_pagina(cur, id_runner_autenticado, limite, cursor, marcar_leidas)
         conn.commit()
-        cur.close(); conn.close()
-        return {"tus_notificaciones": notis}
+        cur.close()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    notis = [{"id": n[0], "tipo": n[1], "titulo": n[2], "mensaje": n[3], "fecha": n[4], "nueva": not n[5]} for n in filas]
+    return {"tus_notificaciones": notis, "siguiente_cursor": siguiente}
+
+@router.get("/notificaciones/{id_usuario}/no-leidas")
+def contar_notificaciones(
+    id_usuario: int,
+    id_runner_autenticado: int = Depends(obtener_runner_actual),
+    conn=Depends(obtener_conexion)
+):
+    # Para el globo rojo de la app: una lectura por clave primaria
+    if id_usuario != id_runner_autenticado:
+        raise HTTPException(status_code=403, detail="No puedes leer notificaciones ajenas")
+    try:
+        cur = conn.cursor()
+        no_leidas = notificaciones.contar_no_leidas(cur, id_runner_autenticado)
+        cur.close()
+        return {"no_leidas": no_leidas}
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from src.database import get_db_connection
+from src import cache
 import datetime
 
 router = APIRouter()
@@ -13,9 +13,10 @@ class TemporadaCreate(BaseModel):
 @router.get("/temporadas/actual")
 def obtener_temporada_actual():
     """Devuelve la temporada activa. Si no hay, crea una automática para el mes actual."""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
-    
+    # Solo cambia al empezar una temporada nueva: con un minuto de caché vamos sobrados
+    return cache.consultar("temporada:actual", _calcular_temporada_actual, ttl=60, obsoleto=60)
+
+def _calcular_temporada_actual(conn):
     try:
         cur = conn.cursor()
         ahora = datetime.datetime.now()
@@ -26,7 +27,7 @@ def obtener_temporada_actual():
         res = cur.fetchone()
         
         if res:
-            cur.close(); conn.close()
+            cur.close()
             return {"id": res[0], "nombre": res[1], "inicio": res[2], "fin": res[3]}
         
         # 2. Si NO hay temporada (ej: es el día 1 del mes), ¡CREAMOS UNA!
@@ -43,10 +44,12 @@ def obtener_temporada_actual():
         cur.execute(sql_crear, (nombre_nueva, inicio, fin))
         nuevo_id = cur.fetchone()[0]
         conn.commit()
+        # No cacheamos este mensaje de bienvenida: la próxima lectura ya verá la temporada normal
+        cache.cache_global.invalidar("temporada:", duro=True)
         
-        cur.close(); conn.close()
+        cur.close()
         return {"mensaje": "Nueva temporada inaugurada automáticamente", "id": nuevo_id, "nombre": nombre_nueva}
 
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from src.database import get_db_connection
+from src.database import obtener_conexion
 from src.dependencies import obtener_runner_actual # <--- IMPORT SEGURIDAD
 
 router = APIRouter()
@@ -18,10 +18,8 @@ class PreferenciasUpdate(BaseModel):
 # --- ENDPOINTS ---
 
 @router.get("/usuario/preferencias/{id_runner}")
-def obtener_preferencias(id_runner: int):
+def obtener_preferencias(id_runner: int, conn=Depends(obtener_conexion)):
     # Este lo dejamos público (o semi-público) para saber si podemos ver su perfil
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
@@ -32,7 +30,7 @@ def obtener_preferencias(id_runner: int):
         """
         cur.execute(sql, (id_runner,))
         res = cur.fetchone()
-        cur.close(); conn.close()
+        cur.close()
         
         if res:
             return {
@@ -46,17 +44,15 @@ def obtener_preferencias(id_runner: int):
                 "acepta_solicitudes_seguidor": True, "mostrar_ubicacion": True, "recibir_notificaciones": True
             }
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/usuario/preferencias")
 def guardar_preferencias(
     datos: PreferenciasUpdate,
-    id_runner_autenticado: int = Depends(obtener_runner_actual) # <--- CANDADO
+    id_runner_autenticado: int = Depends(obtener_runner_actual), # <--- CANDADO
+    conn=Depends(obtener_conexion)
 ):
     """Guarda o Actualiza TODAS las preferencias del usuario LOGUEADO."""
-    conn = get_db_connection()
-    if not conn: raise HTTPException(status_code=500, detail="Sin conexión DB")
     
     try:
         cur = conn.cursor()
@@ -79,9 +75,9 @@ def guardar_preferencias(
         cur.execute(sql, params)
         
         conn.commit()
-        cur.close(); conn.close()
+        cur.close()
         return {"mensaje": "Preferencias guardadas correctamente ✅"}
         
     except Exception as e:
-        if conn: conn.rollback()
+        conn.rollback()
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
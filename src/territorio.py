@@ -0,0 +1,210 @@
+import os
+from src import eventos, regiones
+
+# --- RESOLUCIÓN DE TERRITORIO EN BLOQUE ---
+# En vez de 3 consultas por hexágono, hacemos 3 consultas por carrera:
+# 1. Leemos los dueños anteriores de TODAS las celdas.
+# 2. Hacemos el UPSERT de todas las celdas de golpe.
+# 3. Guardamos el historial de capturas de golpe.
+
+# --- FUERZA DE LAS ZONAS Y PUNTOS POR CAPTURA ---
+# Una zona tiene fuerza 1 al conquistarla o defenderla y se reduce a la mitad cada
+# VIDA_MEDIA_DIAS; por debajo de FUERZA_MINIMA vuelve a ser neutral (tarea decaer_zonas).
+# Los puntos dependen de lo disputada que estaba la celda:
+#   NUEVA    PUNTOS_NUEVA
+#   ROBO     PUNTOS_ROBO + hasta BONO_ROBO más cuanto más fuerte era la zona robada
+#   DEFENSA  PUNTOS_DEFENSA + hasta BONO_DEFENSA más cuanto más debilitada estaba
+# La fuerza para puntuar se calcula al vuelo desde fecha_conquista; la columna 'fuerza'
+# es la que ven el mapa y la tarea periódica.
+VIDA_MEDIA_DIAS = float(os.getenv("ZONA_VIDA_MEDIA_DIAS", "14"))
+FUERZA_MINIMA = float(os.getenv("ZONA_FUERZA_MINIMA", "0.1"))
+PUNTOS_NUEVA = 10
+PUNTOS_ROBO = 20
+BONO_ROBO = 20
+PUNTOS_DEFENSA = 5
+BONO_DEFENSA = 10
+
+# (EXTRACT devuelve numeric: en float8 el cálculo es decenas de veces más rápido)
+FUERZA_ACTUAL = f"""power(0.5, GREATEST(EXTRACT(EPOCH FROM NOW() - COALESCE(fecha_conquista, NOW()))::float8, 0)
+                         / {VIDA_MEDIA_DIAS * 86400.0})"""
+
+SQL_DUENOS_ANTERIORES = f"""
+    SELECT id_zona, id_runner, {FUERZA_ACTUAL} FROM zona
+    WHERE id_zona = ANY(%s::bigint[])
+    ORDER BY id_zona
+    FOR UPDATE;
+"""
+
+# La versión (sql/002_zona_version.sql) solo avanza si de verdad cambia lo que se pinta:
+# una DEFENSA no obliga a los clientes a volver a descargar la celda
+SQL_UPSERT_ZONAS = """
+    INSERT INTO zona (id_zona, id_runner, id_equipo, color_hex, fecha_conquista, fuerza, id_region)
+    SELECT c.celda, %s::int, %s::int, %s::text, NOW(), 1, c.id_region
+    FROM unnest(%s::bigint[], %s::int[]) AS c(celda, id_region)
+    ON CONFLICT (id_zona) DO UPDATE SET
+        id_runner = EXCLUDED.id_runner,
+        id_equipo = EXCLUDED.id_equipo,
+        color_hex = EXCLUDED.color_hex,
+        fecha_conquista = NOW(),
+        fuerza = 1,
+        id_region = COALESCE(EXCLUDED.id_region, zona.id_region),
+        version = CASE
+            WHEN (zona.id_runner, zona.id_equipo, zona.color_hex)
+                 IS DISTINCT FROM (EXCLUDED.id_runner, EXCLUDED.id_equipo, EXCLUDED.color_hex)
+            THEN EXCLUDED.version
+            ELSE zona.version
+        END;
+"""
+
+# --- ORDEN DE LAS VERSIONES DEL MAPA ---
+# La versión de una zona es el id de la transacción que la cambia (sql/013_zona_version_xid.sql):
+# /zonas/mapa/cambios solo lee las de transacciones ya terminadas, así que los escritores no
+# necesitan turnarse para que el lector no se salte cambios.
+VERSION_ACTUAL = "(pg_current_xact_id()::text)::bigint"
+
+SQL_HISTORIAL_CAPTURAS = """
+    INSERT INTO captura_zona (id_zona, id_runner, id_ruta, tipo_captura, puntos_ganados, id_region)
+    SELECT c.celda, %s::int, %s::int, c.tipo, c.puntos, c.id_region
+    FROM unnest(%s::bigint[], %s::text[], %s::int[], %s::int[]) AS c(celda, tipo, puntos, id_region);
+"""
+
+
+def clasificar_celdas(celdas, duenos_anteriores, id_runner):
+    """Decide el tipo de acción (NUEVA / DEFENSA / ROBO) de cada celda según su dueño anterior."""
+    tipos = []
+    for celda in celdas:
+        if celda not in duenos_anteriores:
+            tipos.append("NUEVA")
+        elif duenos_anteriores[celda] == id_runner:
+            tipos.append("DEFENSA")
+        else:
+            tipos.append("ROBO")
+    return tipos
+
+
+def puntos_captura(tipo, fuerza):
+    """Puntos de una captura según su tipo y la fuerza que tenía la zona (0 si era neutral)."""
+    if tipo == "ROBO":
+        return PUNTOS_ROBO + round(BONO_ROBO * fuerza)
+    if tipo == "DEFENSA":
+        return PUNTOS_DEFENSA + round(BONO_DEFENSA * (1 - fuerza))
+    return PUNTOS_NUEVA
+
+
+async def resolver_territorio(cur, id_runner, id_equipo, color_zona, id_ruta, ids_hexagonos):
+    """
+    Aplica la conquista de todas las celdas de una carrera dentro de la transacción de 'cur'.
+    Devuelve los contadores {"nuevas", "robadas", "defendidas"}, en "puntos" y "regiones" los
+    puntos y la región (src/regiones.py) de cada celda (en orden de celda), en "cambiadas" las celdas que han cambiado de dueño (para
+    invalidar las teselas del mapa que las contienen) y en "detalle" esas mismas como
+    (celda, tipo, id_runner_anterior) para los eventos en vivo.
+    """
+    contadores = {"nuevas": 0, "robadas": 0, "defendidas": 0, "puntos": [], "regiones": [],
+                  "cambiadas": [], "detalle": []}
+    if not ids_hexagonos:
+        return contadores
+
+    # Orden fijo para que dos carreras simultáneas bloqueen las filas en el mismo orden
+    celdas = sorted(ids_hexagonos)
+    # Región de cada celda: en memoria, antes de empezar a bloquear filas
+    regiones_celdas = regiones.resolver(celdas)
+
+    # 1. Dueños actuales de todas las celdas (las neutrales cuentan como sin dueño)
+    await cur.execute(SQL_DUENOS_ANTERIORES, (celdas,))
+    filas = [f for f in await cur.fetchall() if f[1] is not None]
+    duenos_anteriores = {celda: dueno for celda, dueno, _ in filas}
+    fuerzas = {celda: fuerza for celda, _, fuerza in filas}
+    tipos = clasificar_celdas(celdas, duenos_anteriores, id_runner)
+    puntos = [puntos_captura(t, fuerzas.get(c, 0.0)) for c, t in zip(celdas, tipos)]
+
+    # 2. UPSERT de todas las celdas (las filas existentes ya están bloqueadas por el paso 1)
+    await cur.execute(SQL_UPSERT_ZONAS, (id_runner, id_equipo, color_zona, celdas, regiones_celdas))
+
+    # 3. Historial con el tipo correcto
+    await cur.execute(SQL_HISTORIAL_CAPTURAS, (id_runner, id_ruta, celdas, tipos, puntos, regiones_celdas))
+
+    contadores["nuevas"] = tipos.count("NUEVA")
+    contadores["defendidas"] = tipos.count("DEFENSA")
+    contadores["robadas"] = tipos.count("ROBO")
+    contadores["puntos"] = puntos
+    contadores["regiones"] = regiones_celdas
+    contadores["cambiadas"] = [c for c, t in zip(celdas, tipos) if t != "DEFENSA"]
+    contadores["detalle"] = [(c, t, duenos_anteriores.get(c)) for c, t in zip(celdas, tipos) if t != "DEFENSA"]
+    return contadores
+
+
+# --- DECAIMIENTO DE ZONAS (tarea periódica) ---
+# Recorre las zonas con dueño por rangos de clave de 'tam_lote' en 'tam_lote' (memoria
+# acotada aunque haya millones) con un commit por lote. La fuerza se guarda redondeada a
+# centésimas y solo se bloquean y escriben las filas cuyo valor cambia. Las zonas que bajan de
+# FUERZA_MINIMA pasan a neutrales con versión nueva (salen en /zonas/mapa/cambios) y se
+# avisa en vivo a quien las esté mirando (y cada worker invalida las teselas que las contienen).
+# Las filas se bloquean en el orden de resolver_territorio (por id_zona), así una carrera y
+# la tarea no se bloquean mutuamente.
+
+SQL_FIN_LOTE = """
+    SELECT MAX(id_zona) FROM (
+        SELECT id_zona FROM zona
+        WHERE id_runner IS NOT NULL AND id_zona > %s
+        ORDER BY id_zona
+        LIMIT %s
+    ) lote;
+"""
+
+FUERZA_REDONDEADA = f"round(({FUERZA_ACTUAL})::numeric, 2)::real"
+
+# Solo se bloquean (en orden) las filas que van a cambiar
+SQL_BLOQUEAR_CAMBIOS = f"""
+    SELECT z.id_zona, c.fuerza < {FUERZA_MINIMA}
+    FROM zona z, LATERAL (SELECT {FUERZA_REDONDEADA} AS fuerza) c
+    WHERE z.id_runner IS NOT NULL AND z.id_zona > %s AND z.id_zona <= %s
+      AND (c.fuerza < {FUERZA_MINIMA} OR z.fuerza IS DISTINCT FROM c.fuerza)
+    ORDER BY z.id_zona
+    FOR UPDATE OF z;
+"""
+
+SQL_DECAER = f"""
+    WITH calculo AS (
+        SELECT id_zona, id_runner, {FUERZA_REDONDEADA} AS fuerza FROM zona
+        WHERE id_zona > %s AND id_zona <= %s AND id_zona = ANY(%s::bigint[]) AND id_runner IS NOT NULL
+    )
+    UPDATE zona z SET
+        fuerza = CASE WHEN c.fuerza < {FUERZA_MINIMA} THEN 0 ELSE c.fuerza END,
+        id_runner = CASE WHEN c.fuerza < {FUERZA_MINIMA} THEN NULL ELSE z.id_runner END,
+        id_equipo = CASE WHEN c.fuerza < {FUERZA_MINIMA} THEN NULL ELSE z.id_equipo END,
+        color_hex = CASE WHEN c.fuerza < {FUERZA_MINIMA} THEN NULL ELSE z.color_hex END,
+        version = CASE WHEN c.fuerza < {FUERZA_MINIMA} THEN {VERSION_ACTUAL} ELSE z.version END
+    FROM calculo c
+    WHERE z.id_zona = c.id_zona
+    RETURNING z.id_zona, c.fuerza < {FUERZA_MINIMA}, c.id_runner;
+"""
+
+
+def decaer_zonas(conn, tam_lote=5000):
+    """
+    Recalcula la fuerza de todas las zonas con dueño y neutraliza las agotadas.
+    Devuelve (zonas actualizadas, zonas neutralizadas).
+    """
+    cur = conn.cursor()
+    ultimo, actualizadas, neutralizadas = 0, 0, 0
+    while True:
+        cur.execute(SQL_FIN_LOTE, (ultimo, tam_lote))
+        hasta = cur.fetchone()[0]
+        if hasta is None:
+            conn.rollback()
+            break
+        cur.execute(SQL_BLOQUEAR_CAMBIOS, (ultimo, hasta))
+        bloqueadas = cur.fetchall()
+        filas = []
+        if bloqueadas:
+            cur.execute(SQL_DECAER, (ultimo, hasta, [celda for celda, _ in bloqueadas]))
+            filas = cur.fetchall()
+        neutras = [(celda, "NEUTRAL", anterior) for celda, neutral, anterior in filas if neutral]
+        if neutras:
+            eventos.publicar(cur, eventos.evento_zonas(None, None, None, neutras))
+        conn.commit()
+        ultimo = hasta
+        actualizadas += len(filas) - len(neutras)
+        neutralizadas += len(neutras)
+    cur.close()
+    return actualizadas, neutralizadas
@@ -0,0 +1,158 @@
+import io
+import os
+import numpy as np
+from psycopg2.extras import execute_values
+from src import formato_track, ejecutor
+
+# --- ESCRITURA MASIVA DE TRACKS GPS ---
+# Por defecto el track se guarda compacto: un único blob por ruta en ruta_track
+# (src/formato_track.py). Con TRACK_COMPACTO=0 se vuelve a una fila por punto en
+# track_point, en un único COPY FROM STDIN o, si el servidor no lo admite, con
+# execute_values (INSERT multi-fila por páginas).
+# El territorio se calcula siempre con los puntos completos que manda la app, antes de
+# guardar nada: simplificar (TRACK_TOLERANCIA_M > 0) solo afecta a lo que se guarda.
+
+COMPACTO = os.getenv("TRACK_COMPACTO", "1") == "1"
+TOLERANCIA_M = float(os.getenv("TRACK_TOLERANCIA_M", "0"))
+USAR_COPY = os.getenv("TRACK_USAR_COPY", "1") == "1"
+TAM_PAGINA_INSERT = 1000
+
+SQL_GUARDAR_COMPACTO = """
+    INSERT INTO ruta_track (id_ruta, formato, puntos, puntos_originales, tolerancia_m, datos)
+    VALUES %s
+    ON CONFLICT (id_ruta) DO NOTHING
+"""
+
+SQL_COPY_TRACK = "COPY track_point (id_ruta, latitud, longitud, orden, timestamp_relativo) FROM STDIN"
+SQL_INSERT_TRACK = "INSERT INTO track_point (id_ruta, latitud, longitud, orden, timestamp_relativo) VALUES %s"
+
+
+def buffer_copy_track(id_ruta, puntos, inicio):
+    """Construye el buffer de texto del COPY directamente desde la lista de PuntoGPS."""
+    buf = io.StringIO()
+    escribir = buf.write
+    prefijo = f"{id_ruta}\t"
+    for p in puntos:
+        escribir(f"{prefijo}{p.latitud!r}\t{p.longitud!r}\t{p.orden}\t{(p.timestamp - inicio).total_seconds()!r}\n")
+    buf.seek(0)
+    return buf
+
+
+def _filas_track(id_ruta, puntos, inicio):
+    """Generador de filas para execute_values (no materializa la lista entera)."""
+    for p in puntos:
+        yield (id_ruta, p.latitud, p.longitud, p.orden, (p.timestamp - inicio).total_seconds())
+
+
+async def guardar_compacto(cur, id_ruta, lats, lons, segundos):
+    """Codifica el track (en el pool de cálculo si es largo) y lo guarda como blob en ruta_track."""
+    blob, guardados = await ejecutor.ejecutar_async(formato_track.codificar, lats, lons, segundos, TOLERANCIA_M,
+                                                    tamano=len(lats))
+    await cur.insertar_lotes(SQL_GUARDAR_COMPACTO,
+                             [(id_ruta, formato_track.VERSION, guardados, len(lats), TOLERANCIA_M, blob)], 1)
+    return "compacto"
+
+
+async def guardar_track(cur, id_ruta, puntos):
+    """
+    Guarda los puntos GPS de una ruta dentro de la transacción de 'cur' (cursor de database_async).
+    Devuelve el método usado ("compacto", "copy" o "execute_values").
+    """
+    if not puntos:
+        return None
+    inicio = puntos[0].timestamp
+
+    if COMPACTO:
+        puntos = sorted(puntos, key=lambda p: p.orden)
+        n = len(puntos)
+        lats = np.fromiter((p.latitud for p in puntos), dtype=np.float64, count=n)
+        lons = np.fromiter((p.longitud for p in puntos), dtype=np.float64, count=n)
+        segundos = np.fromiter(((p.timestamp - inicio).total_seconds() for p in puntos), dtype=np.float64, count=n)
+        return await guardar_compacto(cur, id_ruta, lats, lons, segundos)
+
+    global USAR_COPY
+    if USAR_COPY:
+        # Savepoint: si el COPY falla, no perdemos lo que ya lleva la transacción
+        await cur.execute("SAVEPOINT guardar_track")
+        try:
+            await cur.copiar(SQL_COPY_TRACK, buffer_copy_track(id_ruta, puntos, inicio))
+            await cur.execute("RELEASE SAVEPOINT guardar_track")
+            return "copy"
+        except Exception:
+            # El servidor no admite COPY: INSERT por lotes desde ya y para el resto del proceso
+            USAR_COPY = False
+            await cur.execute("ROLLBACK TO SAVEPOINT guardar_track")
+
+    await cur.insertar_lotes(SQL_INSERT_TRACK, _filas_track(id_ruta, puntos, inicio), TAM_PAGINA_INSERT)
+    return "execute_values"
+
+
+# --- LECTURA (REPRODUCIR UNA RUTA) ---
+SQL_LEER_COMPACTO = "SELECT datos FROM ruta_track WHERE id_ruta = %s;"
+SQL_LEER_FILAS = """
+    SELECT latitud, longitud, COALESCE(timestamp_relativo, 0) FROM track_point
+    WHERE id_ruta = %s AND latitud IS NOT NULL AND longitud IS NOT NULL
+    ORDER BY orden;
+"""
+
+
+async def leer_blob(cur, id_ruta):
+    """Blob compacto de la ruta; si aún está en track_point, se codifica al vuelo (sin simplificar)."""
+    await cur.execute(SQL_LEER_COMPACTO, (id_ruta,))
+    fila = await cur.fetchone()
+    if fila:
+        return bytes(fila[0])
+    await cur.execute(SQL_LEER_FILAS, (id_ruta,))
+    filas = await cur.fetchall()
+    if not filas:
+        return None
+    datos = np.array(filas, dtype=np.float64)
+    return formato_track.codificar(datos[:, 0], datos[:, 1], datos[:, 2])[0]
+
+
+# --- MIGRACIÓN DE track_point A ruta_track (tarea offline) ---
+SQL_RUTAS_POR_MIGRAR = """
+    SELECT DISTINCT t.id_ruta FROM track_point t
+    WHERE t.id_ruta > %s AND t.latitud IS NOT NULL AND t.longitud IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM ruta_track rt WHERE rt.id_ruta = t.id_ruta)
+    ORDER BY t.id_ruta
+    LIMIT %s;
+"""
+
+SQL_PUNTOS_DE_RUTAS = """
+    SELECT id_ruta, latitud, longitud, COALESCE(timestamp_relativo, 0) FROM track_point
+    WHERE id_ruta = ANY(%s) AND latitud IS NOT NULL AND longitud IS NOT NULL
+    ORDER BY id_ruta, orden;
+"""
+
+
+def migrar_a_compacto(conn, tam_lote=200, tolerancia_m=0.0, borrar_filas=True):
+    """
+    Pasa las rutas de track_point a ruta_track de 'tam_lote' en 'tam_lote', un commit por lote.
+    Se puede cortar y relanzar: las rutas ya migradas se saltan. Las que solo tienen puntos
+    sin coordenadas no tienen nada que migrar y se quedan en track_point. Devuelve (rutas, puntos).
+    """
+    cur = conn.cursor()
+    ultimo, rutas, puntos = 0, 0, 0
+    while True:
+        cur.execute(SQL_RUTAS_POR_MIGRAR, (ultimo, tam_lote))
+        ids = [fila[0] for fila in cur.fetchall()]
+        if not ids:
+            break
+        cur.execute(SQL_PUNTOS_DE_RUTAS, (ids,))
+        datos = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 4)
+        # Cortes donde cambia id_ruta (las filas vienen agrupadas y en orden)
+        cortes = np.flatnonzero(np.diff(datos[:, 0])) + 1
+        filas = []
+        for bloque in np.split(datos, cortes) if len(datos) else []:
+            blob, guardados = formato_track.codificar(bloque[:, 1], bloque[:, 2], bloque[:, 3], tolerancia_m)
+            filas.append((int(bloque[0, 0]), formato_track.VERSION, guardados, len(bloque), tolerancia_m, blob))
+        execute_values(cur, SQL_GUARDAR_COMPACTO, filas, page_size=50)
+        if borrar_filas:
+            cur.execute("DELETE FROM track_point WHERE id_ruta = ANY(%s);", ([f[0] for f in filas],))
+        conn.commit()
+        ultimo = ids[-1]
+        rutas += len(filas)
+        puntos += len(datos)
+    cur.close()
+    return rutas, puntos
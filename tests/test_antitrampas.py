@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from benchmarks.bench_antitrampas import carrera, trampas
+from src import antitrampas
+
+CASOS = trampas()
+
+
+def test_carrera_normal_sin_motivos():
+    analisis = antitrampas.analizar(*CASOS["normal"])
+    assert analisis["rechazos"] == [] and analisis["avisos"] == []
+    assert analisis["distancia_m"] > 3.0 * 3_000             # ~3 m/s durante 3000 s, más el ruido del GPS
+    assert analisis["velocidad_sostenida_kmh"] < antitrampas.VELOCIDAD_MAX_KMH
+
+
+@pytest.mark.parametrize("nombre, medida", [("teletransporte", "saltos"), ("tiempo atrás", "retrocesos")])
+def test_imposibles_se_rechazan(nombre, medida):
+    analisis = antitrampas.analizar(*CASOS[nombre])
+    assert len(analisis["rechazos"]) == 1 and analisis[medida] > 0
+
+
+@pytest.mark.parametrize("nombre", ["vehiculo", "generado"])
+def test_sospechosos_solo_avisan(nombre):
+    analisis = antitrampas.analizar(*CASOS[nombre])
+    assert analisis["rechazos"] == [] and len(analisis["avisos"]) == 1
+
+
+def test_vuelta_reenviada_avisa_por_repeticion():
+    # Volver al inicio de la vuelta son saltos (rechazo), pero la repetición sale igualmente
+    analisis = antitrampas.analizar(*CASOS["reenviado"])
+    assert analisis["repetidas"] > antitrampas.MAX_REPETIDAS
+    assert any("repite coordenadas" in aviso for aviso in analisis["avisos"])
+
+
+def test_teletransporte_no_cuenta_en_la_distancia():
+    normal = antitrampas.analizar(*CASOS["normal"])
+    saltos = antitrampas.analizar(*CASOS["teletransporte"])
+    assert saltos["saltos"] == 3
+    assert saltos["distancia_m"] == pytest.approx(normal["distancia_m"], rel=0.01)
+
+
+def test_pico_suelto_del_gps_se_tolera():
+    lats, lons, segundos = carrera(600)
+    lats = lats.copy()
+    lats[300] += 0.05                                        # Ida y vuelta: dos saltos
+    analisis = antitrampas.analizar(lats, lons, segundos)
+    assert analisis["saltos"] == 2 and analisis["rechazos"] == []
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_sin_tramos(n):
+    analisis = antitrampas.analizar(np.zeros(n), np.zeros(n), np.zeros(n))
+    assert analisis["distancia_m"] == 0.0 and analisis["rechazos"] == [] and analisis["avisos"] == []
@@ -0,0 +1,130 @@
+import asyncio
+import contextlib
+import json
+import pytest
+from src import bandeja_salida
+
+
+class CursorFalso:
+    def __init__(self, eventos):
+        self.eventos = eventos
+        self.sentencias = []
+
+    async def execute(self, sql, params=None):
+        self.sentencias.append((" ".join(sql.split()), params))
+
+    async def fetchall(self):
+        return self.eventos
+
+    async def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, eventos):
+        self.cur = CursorFalso(eventos)
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        return self.cur
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def bandeja(monkeypatch):
+    """Bandeja con los eventos que se le pongan en 'pendientes'; devuelve las conexiones usadas."""
+    pendientes, conexiones, aplicados = [], [], []
+
+    @contextlib.asynccontextmanager
+    async def conexion_async():
+        conn = ConexionFalsa(list(pendientes))
+        pendientes.clear()
+        conexiones.append(conn)
+        yield conn
+
+    async def bien(cur, datos, con_puntos=True):
+        aplicados.append((datos, con_puntos))
+
+    async def mal(cur, datos, con_puntos=True):
+        raise RuntimeError("fallo al aplicar")
+
+    invalidadas = []
+    monkeypatch.setattr(bandeja_salida, "conexion_async", conexion_async)
+    monkeypatch.setattr(bandeja_salida, "MANEJADORES", {"bien": bien, "mal": mal})
+    monkeypatch.setattr(bandeja_salida, "_stats", {"procesados": 0, "fallos": 0, "muertos": 0})
+    monkeypatch.setattr(bandeja_salida.cache.cache_global, "invalidar", lambda prefijo="", duro=False: invalidadas.append(prefijo))
+    return pendientes, conexiones, aplicados, invalidadas
+
+
+def _con_prefijo(cur, prefijo):
+    return [params for sql, params in cur.sentencias if sql.startswith(prefijo)]
+
+
+def test_lote_aplica_y_borra_los_que_van_bien(bandeja):
+    pendientes, conexiones, aplicados, invalidadas = bandeja
+    pendientes += [(1, "bien", json.dumps({"a": 1}), 0, False), (2, "bien", {"b": 2}, 3, True)]
+    assert asyncio.run(bandeja_salida.procesar_lote()) == 2
+    cur = conexiones[0].cur
+    assert aplicados == [({"a": 1}, True), ({"b": 2}, False)]   # Los clasificados no suman puntos otra vez
+    assert _con_prefijo(cur, "DELETE FROM bandeja_salida") == [(1,), (2,)]
+    assert len(_con_prefijo(cur, "RELEASE SAVEPOINT")) == 2
+    assert conexiones[0].commits == 1 and invalidadas == ["ranking:"]
+    assert bandeja_salida._stats["procesados"] == 2
+
+
+def test_los_fallos_se_reprograman_con_espera_creciente(bandeja):
+    pendientes, conexiones, aplicados, invalidadas = bandeja
+    pendientes += [(1, "mal", {}, 3, False), (2, "desconocido", {}, 0, False), (3, "bien", {}, 0, False)]
+    assert asyncio.run(bandeja_salida.procesar_lote()) == 3
+    cur = conexiones[0].cur
+    fallos = _con_prefijo(cur, "UPDATE bandeja_salida")
+    assert [(espera, id_evento) for _, espera, _, id_evento in fallos] == [(8, 1), (1, 2)]
+    assert "fallo al aplicar" in fallos[0][0] and "desconocido" in fallos[1][0]
+    assert len(_con_prefijo(cur, "ROLLBACK TO SAVEPOINT")) == 2
+    assert _con_prefijo(cur, "DELETE FROM bandeja_salida") == [(3,)]
+    assert bandeja_salida._stats == {"procesados": 1, "fallos": 2, "muertos": 0}
+
+
+def test_tras_max_intentos_queda_muerto(bandeja):
+    pendientes, conexiones, _, invalidadas = bandeja
+    pendientes.append((1, "mal", {}, bandeja_salida.MAX_INTENTOS - 1, False))
+    asyncio.run(bandeja_salida.procesar_lote())
+    (_, espera, maximo, _), = _con_prefijo(conexiones[0].cur, "UPDATE bandeja_salida")
+    assert espera == min(2 ** (bandeja_salida.MAX_INTENTOS - 1), bandeja_salida.MAX_ESPERA_REINTENTO)
+    assert maximo == bandeja_salida.MAX_INTENTOS
+    assert bandeja_salida._stats["muertos"] == 1
+    assert invalidadas == []                                    # Nada aplicado: los rankings no cambian
+
+
+def test_trabajar_hasta_vaciar(bandeja):
+    pendientes, conexiones, aplicados, _ = bandeja
+    pendientes += [(1, "bien", {}, 0, False)]
+    asyncio.run(bandeja_salida.trabajar(hasta_vaciar=True))
+    assert len(aplicados) == 1 and len(conexiones) == 2        # El segundo lote ya sale vacío
+
+
+def test_efectos_carrera(monkeypatch):
+    llamadas = {}
+
+    def apuntar(nombre):
+        async def funcion(cur, *args, **kwargs):
+            llamadas[nombre] = (args, kwargs)
+        return funcion
+    monkeypatch.setattr(bandeja_salida.clasificaciones, "acumular_puntos", apuntar("puntos"))
+    monkeypatch.setattr(bandeja_salida.motor_logros, "registrar_actividad", apuntar("logros"))
+    monkeypatch.setattr(bandeja_salida.feed, "publicar_carrera", apuntar("feed"))
+    datos = {"id_runner": 7, "id_ruta": 3, "celdas": [10, 11], "puntos": [5, 8], "regiones": [1, None],
+             "nuevas": 1, "robadas": 1, "defendidas": 0, "distancia_metros": 4200.0,
+             "duracion_segundos": 1500, "dia": "2026-05-01"}
+    asyncio.run(bandeja_salida._efectos_carrera(None, datos))
+    assert llamadas["puntos"][0] == (7, [10, 11], [5, 8], [1, None])
+    assert llamadas["logros"][1]["capturas"] == 2 and llamadas["logros"][1]["carreras"] == 1
+    assert llamadas["feed"][0][-1] == 13
+    llamadas.clear()
+    asyncio.run(bandeja_salida._efectos_carrera(None, datos, con_puntos=False))
+    assert "puntos" not in llamadas and "feed" in llamadas
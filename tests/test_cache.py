@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import pytest
+from src import cache
+from src.cache import CacheTTL
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache.time, "monotonic", reloj)
+    return reloj
+
+
+def _esperar_recalculos(c):
+    for _ in range(500):
+        if not c.estadisticas()["calculando"]:
+            return
+        time.sleep(0.01)
+
+
+def _contador(valores):
+    llamadas = []
+
+    def cargador():
+        llamadas.append(1)
+        return valores[len(llamadas) - 1]
+    return cargador, llamadas
+
+
+def test_ttl(reloj):
+    c = CacheTTL()
+    cargador, llamadas = _contador(["a", "b"])
+    assert c.obtener("k", cargador, ttl=10) == "a"
+    reloj.ahora += 9
+    assert c.obtener("k", cargador, ttl=10) == "a"
+    reloj.ahora += 2
+    assert c.obtener("k", cargador, ttl=10) == "b"
+    assert len(llamadas) == 2
+    assert c.estadisticas()["aciertos"] == 1 and c.estadisticas()["fallos"] == 2
+
+
+def test_obsoleto_se_sirve_mientras_se_recalcula(reloj):
+    c = CacheTTL()
+    libre = threading.Event()
+    valores = iter(["viejo", "nuevo"])
+
+    def cargador():
+        valor = next(valores)
+        if valor == "nuevo":
+            libre.wait(5)
+        return valor
+    c.obtener("k", cargador, ttl=10, obsoleto=30)
+    reloj.ahora += 15
+    assert c.obtener("k", cargador, ttl=10, obsoleto=30) == "viejo"
+    assert c.obtener("k", cargador, ttl=10, obsoleto=30) == "viejo"    # Un solo recálculo en marcha
+    libre.set()
+    _esperar_recalculos(c)
+    assert c.obtener("k", cargador, ttl=10, obsoleto=30) == "nuevo"
+    assert c.estadisticas()["aciertos_obsoletos"] == 2
+
+
+def test_pasado_el_obsoleto_se_espera_al_dato_nuevo(reloj):
+    c = CacheTTL()
+    cargador, _ = _contador(["viejo", "nuevo"])
+    c.obtener("k", cargador, ttl=10, obsoleto=5)
+    reloj.ahora += 16
+    assert c.obtener("k", cargador, ttl=10, obsoleto=5) == "nuevo"
+
+
+def test_single_flight_hilos():
+    c = CacheTTL()
+    empezado, libre = threading.Event(), threading.Event()
+    llamadas = []
+
+    def cargador():
+        llamadas.append(1)
+        empezado.set()
+        libre.wait(5)
+        return "valor"
+    resultados = []
+    lider = threading.Thread(target=lambda: resultados.append(c.obtener("k", cargador, ttl=60)))
+    lider.start()
+    empezado.wait(5)
+    resto = [threading.Thread(target=lambda: resultados.append(c.obtener("k", cargador, ttl=60))) for _ in range(8)]
+    for hilo in resto:
+        hilo.start()
+    while c.estadisticas()["esperas"] < len(resto):
+        time.sleep(0.01)
+    libre.set()
+    for hilo in [lider] + resto:
+        hilo.join(5)
+    assert resultados == ["valor"] * 9 and len(llamadas) == 1
+
+
+def test_single_flight_async():
+    c = CacheTTL()
+    llamadas = []
+
+    async def cargador():
+        llamadas.append(1)
+        await asyncio.sleep(0.05)
+        return "valor"
+
+    async def pedir_todos():
+        return await asyncio.gather(*(c.obtener_async("k", cargador, ttl=60) for _ in range(10)))
+    assert asyncio.run(pedir_todos()) == ["valor"] * 10
+    assert len(llamadas) == 1 and c.estadisticas()["esperas"] == 9
+
+
+def test_los_errores_llegan_a_todos_y_no_se_guardan():
+    c = CacheTTL()
+
+    def falla():
+        raise ValueError("sin base de datos")
+    with pytest.raises(ValueError):
+        c.obtener("k", falla, ttl=60)
+    assert c.obtener("k", lambda: "bien", ttl=60) == "bien"
+    assert c.estadisticas()["errores"] == 1
+
+
+def test_invalidar_suave_y_duro(reloj):
+    c = CacheTTL()
+    cargador, _ = _contador(["a", "b", "c"])
+    c.obtener("ranking:1", cargador, ttl=60, obsoleto=30)
+    c.obtener("mapa:1", lambda: "m", ttl=60)
+    c.invalidar("ranking:")
+    # Suave: caduca ya, pero se sirve como obsoleto mientras se recalcula
+    assert c.obtener("ranking:1", cargador, ttl=60, obsoleto=30) == "a"
+    _esperar_recalculos(c)
+    assert c.obtener("ranking:1", cargador, ttl=60, obsoleto=30) == "b"
+    c.invalidar("ranking:", duro=True)
+    assert c.obtener("ranking:1", lambda: "duro", ttl=60, obsoleto=30) == "duro"
+    assert c.obtener("mapa:1", lambda: "otro", ttl=60) == "m"
+
+
+def test_invalidar_durante_el_calculo_no_guarda_el_dato_viejo():
+    c = CacheTTL()
+
+    def cargador():
+        c.invalidar("k", duro=True)      # Llega una captura mientras se consulta
+        return "viejo"
+    assert c.obtener("k", cargador, ttl=60) == "viejo"
+    assert c.obtener("k", lambda: "nuevo", ttl=60) == "nuevo"
+
+
+def test_invalidar_celdas_por_rangos():
+    c = CacheTTL()
+    for clave, rangos in (("mapa:a", [(10, 20), (40, 50)]), ("mapa:b", [(100, 200)])):
+        c.registrar_rangos(clave, rangos)
+        c.obtener(clave, lambda: clave, ttl=60)
+    c.obtener("mapa:sin-rangos", lambda: "s", ttl=60)
+    c.invalidar_celdas("mapa:", [45, 300], duro=True)
+    assert c.obtener("mapa:a", lambda: "nuevo", ttl=60) == "nuevo"
+    assert c.obtener("mapa:b", lambda: "nuevo", ttl=60) == "mapa:b"
+    assert c.obtener("mapa:sin-rangos", lambda: "nuevo", ttl=60) == "nuevo"
+
+
+def test_expulsion_lru():
+    c = CacheTTL(max_entradas=2)
+    c.obtener("a", lambda: 1, ttl=60)
+    c.obtener("b", lambda: 2, ttl=60)
+    c.obtener("a", lambda: 0, ttl=60)    # 'a' pasa a ser la más reciente
+    c.obtener("c", lambda: 3, ttl=60)
+    assert c.obtener("b", lambda: "recalculada", ttl=60) == "recalculada"
+    assert c.estadisticas()["expulsiones"] == 2
@@ -0,0 +1,102 @@
+import time
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from src import dependencies
+
+
+@pytest.fixture(autouse=True)
+def cache_limpia(monkeypatch):
+    """Caché de tokens vacía y la base de datos sustituida por 'revocados_bd' (huellas revocadas)."""
+    monkeypatch.setattr(dependencies, "CACHE_TOKENS_ACTIVA", True)
+    for nombre in ("_tokens", "_revocados", "_revocados_desde"):
+        monkeypatch.setattr(dependencies, nombre, type(getattr(dependencies, nombre))())
+    monkeypatch.setattr(dependencies, "_stats", dict.fromkeys(dependencies._stats, 0))
+    consultas, revocados_bd = [], set()
+
+    def revocado_en_bd(huella, id_runner, iat):
+        consultas.append(id_runner)
+        return huella in revocados_bd
+    monkeypatch.setattr(dependencies, "_revocado_en_bd", revocado_en_bd)
+    return consultas, revocados_bd
+
+
+def _token(id_runner, iat=None, caduca_en=3600):
+    ahora = time.time()
+    return jwt.encode({"sub": str(id_runner), "iat": ahora if iat is None else iat, "exp": int(ahora + caduca_en)},
+                      dependencies.SECRET_KEY, algorithm=dependencies.ALGORITHM)
+
+
+def _runner(token):
+    return dependencies.obtener_runner_actual(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+
+def _rechazado(token):
+    with pytest.raises(HTTPException) as error:
+        _runner(token)
+    return error.value.status_code == 401
+
+
+def test_token_valido_se_comprueba_una_vez(cache_limpia):
+    consultas, _ = cache_limpia
+    token = dependencies.crear_token_acceso({"sub": "7", "name": "ana"})
+    assert [_runner(token) for _ in range(3)] == [7, 7, 7]
+    assert consultas == [7]
+    estadisticas = dependencies.estadisticas_tokens()
+    assert estadisticas["aciertos"] == 2 and estadisticas["fallos"] == 1 and estadisticas["entradas"] == 1
+
+
+def test_tokens_invalidos():
+    assert _rechazado(_token(7, caduca_en=-10))
+    assert _rechazado(_token(7) + "x")
+    assert _rechazado(jwt.encode({"exp": int(time.time()) + 60}, dependencies.SECRET_KEY, algorithm="HS256"))
+    assert dependencies.estadisticas_tokens()["entradas"] == 0
+
+
+def test_revocado_en_bd_no_entra_en_cache(cache_limpia):
+    _, revocados_bd = cache_limpia
+    token = _token(7)
+    revocados_bd.add(dependencies._huella(token))
+    assert _rechazado(token)
+    assert dependencies.estadisticas_tokens()["entradas"] == 0
+
+
+def test_revocar_un_token_en_cache():
+    token, otro = _token(7, iat=time.time() - 1), _token(7)
+    _runner(token), _runner(otro)
+    exp = jwt.decode(token, dependencies.SECRET_KEY, algorithms=[dependencies.ALGORITHM])["exp"]
+    dependencies.aplicar_revocacion(dependencies.evento_revocacion(huella=dependencies._huella(token), exp=exp))
+    assert _rechazado(token)
+    assert _runner(otro) == 7
+
+
+def test_revocar_los_tokens_de_un_runner():
+    desde = time.time() - 30
+    antiguo, de_otro = _token(7, iat=desde - 60), _token(8, iat=desde - 60)
+    _runner(antiguo), _runner(de_otro)
+    dependencies.aplicar_revocacion(dependencies.evento_revocacion(id_runner=7, desde=desde))
+    assert _rechazado(antiguo)
+    assert _runner(de_otro) == 8
+    assert _runner(_token(7)) == 7                            # Login después del cambio de contraseña
+    # Una revocación anterior que llega tarde no adelanta el instante
+    dependencies.aplicar_revocacion(dependencies.evento_revocacion(id_runner=7, desde=desde - 3600))
+    assert _rechazado(_token(7, iat=desde - 1))
+
+
+def test_revocados_caducados_se_olvidan():
+    ahora = time.time()
+    dependencies.aplicar_revocacion(dependencies.evento_revocacion(huella=b"a" * 32, exp=ahora - 1))
+    dependencies.aplicar_revocacion(dependencies.evento_revocacion(huella=b"b" * 32, exp=ahora + 60))
+    assert set(dependencies._revocados) == {b"b" * 32}
+
+
+def test_sin_avisos_se_vuelve_a_comprobar(cache_limpia):
+    consultas, revocados_bd = cache_limpia
+    token = _token(7)
+    _runner(token)
+    # Revocado en otro worker cuyo aviso se ha perdido: tras reconectar se vacía la caché
+    revocados_bd.add(dependencies._huella(token))
+    dependencies.aplicar_revocacion(None)
+    assert _rechazado(token)
+    assert consultas == [7, 7]
@@ -0,0 +1,41 @@
+import zlib
+import numpy as np
+import pytest
+from src import formato_track
+
+
+def _track(n, semilla=0):
+    rnd = np.random.default_rng(semilla)
+    lats = 40.4 + np.cumsum(rnd.normal(0, 3e-5, n))
+    lons = -3.7 + np.cumsum(rnd.normal(0, 3e-5, n))
+    segundos = 1_700_000_000 + np.cumsum(rnd.uniform(0.5, 2.0, n))
+    return lats, lons, segundos
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 1000])
+def test_ida_y_vuelta_sin_simplificar(n):
+    lats, lons, segundos = _track(n)
+    blob, guardados = formato_track.codificar(lats, lons, segundos)
+    assert guardados == n
+    d_lats, d_lons, d_segundos = formato_track.decodificar(blob)
+    assert np.abs(d_lats - lats).max(initial=0) <= 0.5 / formato_track.ESCALA_GRADOS + 1e-12
+    assert np.abs(d_lons - lons).max(initial=0) <= 0.5 / formato_track.ESCALA_GRADOS + 1e-12
+    relativos = segundos - (segundos[0] if n else 0)
+    assert np.abs(d_segundos - relativos).max(initial=0) <= 0.5 / formato_track.ESCALA_TIEMPO + 1e-9
+
+
+def test_simplificar_conserva_extremos_y_reduce():
+    lats, lons, segundos = _track(5000, semilla=1)
+    blob, guardados = formato_track.codificar(lats, lons, segundos, tolerancia_m=5.0)
+    d_lats, d_lons, _ = formato_track.decodificar(blob)
+    assert 2 <= guardados < 5000
+    assert (d_lats[0], d_lons[0]) == pytest.approx((lats[0], lons[0]), abs=1e-6)
+    assert (d_lats[-1], d_lons[-1]) == pytest.approx((lats[-1], lons[-1]), abs=1e-6)
+
+
+def test_decodificar_rechaza_otro_formato():
+    blob, _ = formato_track.codificar(*_track(10))
+    with pytest.raises(ValueError):
+        formato_track.decodificar(b"XXX" + blob[3:])
+    with pytest.raises(ValueError):
+        formato_track.decodificar(blob[:8] + zlib.compress(b"\x00" * 12))
@@ -0,0 +1,57 @@
+import h3.api.basic_int as h3_int
+from src import huellas
+
+
+def _celdas(lat, lon, radio):
+    return h3_int.grid_disk(h3_int.latlng_to_cell(lat, lon, 10), radio)
+
+
+def test_calcular_ignora_rutas_cortas():
+    assert huellas.calcular(_celdas(40.4, -3.7, 0)) is None
+
+
+def test_sospechas_misma_ruta_y_parecidas():
+    celdas = _celdas(40.4, -3.7, 6)
+    propia = huellas.calcular(celdas)
+    casi_igual = huellas.calcular(celdas[:-2])
+    distinta = huellas.calcular(_celdas(41.38, 2.17, 6))
+    candidatos = [
+        (1, 10, distinta["firma"], False),
+        (2, 20, casi_igual["firma"], False),
+        (3, 30, propia["firma"], False),
+        (4, 40, distinta["firma"], True),      # Mismo fichero GPS: sale aunque no se parezca
+    ]
+    encontradas = huellas.sospechas(propia, candidatos)
+    assert encontradas[0]["id_ruta"] == 4
+    assert {s["id_ruta"] for s in encontradas[1:]} == {2, 3}
+    similitudes = {s["id_ruta"]: s["similitud"] for s in encontradas}
+    assert similitudes[3] == 1.0 and similitudes[2] >= huellas.UMBRAL_SIMILITUD
+    assert [s["similitud"] for s in encontradas[1:]] == sorted(similitudes[i] for i in (2, 3))[::-1]
+
+
+def test_sospechas_sin_candidatos():
+    assert huellas.sospechas(huellas.calcular(_celdas(40.4, -3.7, 3)), []) == []
+
+
+def test_bandas_coinciden_si_la_firma_coincide():
+    celdas = _celdas(40.4, -3.7, 5)
+    a, b = huellas.calcular(celdas), huellas.calcular(list(reversed(celdas)))
+    assert a["firma"] == b["firma"] and a["bandas"] == b["bandas"]
+
+
+def test_sospechas_mismo_runner_con_umbral_estricto(monkeypatch):
+    monkeypatch.setattr(huellas, "UMBRAL_SIMILITUD", 0.5)
+    monkeypatch.setattr(huellas, "UMBRAL_MISMO_RUNNER", 0.99)
+    celdas = _celdas(40.4, -3.7, 6)
+    propia = huellas.calcular(celdas)
+    parecida = huellas.calcular(celdas[:-20])
+    similitud = huellas.sospechas(propia, [(1, 20, parecida["firma"], False)])[0]["similitud"]
+    assert 0.5 <= similitud < 0.99
+    candidatos = [
+        (1, 20, parecida["firma"], False),     # Otro runner: basta UMBRAL_SIMILITUD
+        (2, 10, parecida["firma"], False),     # Su mismo circuito, algo distinto: no es sospechoso
+        (3, 10, propia["firma"], False),       # Su mismo fichero con las coordenadas movidas
+    ]
+    encontradas = {s["id_ruta"]: s for s in huellas.sospechas(propia, candidatos, id_runner=10)}
+    assert set(encontradas) == {1, 3}
+    assert encontradas[3]["mismo_runner"] and not encontradas[1]["mismo_runner"]
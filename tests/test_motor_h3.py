@@ -0,0 +1,37 @@
+import random
+import h3.api.basic_int as h3_int
+import numpy as np
+import pytest
+from benchmarks.bench_h3 import referencia, track_aleatorio
+from src import motor_h3
+from src.motor_h3 import RESOLUCION_H3
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_celdas_recorridas_igual_que_bucle_h3(semilla):
+    """Mismo conjunto de celdas que el bucle original (un grid_path_cells por segmento)."""
+    rnd = random.Random(semilla)
+    for _ in range(100):
+        lats, lons = track_aleatorio(rnd)
+        assert motor_h3.celdas_recorridas(np.array(lats), np.array(lons)) == referencia(lats, lons)
+
+
+def test_celdas_recorridas_sin_puntos():
+    assert motor_h3.celdas_recorridas(np.array([]), np.array([])) == set()
+
+
+@pytest.mark.parametrize("res", [0, 3, 6, 9])
+def test_mascaras_padre_igual_que_cell_to_parent(res):
+    rnd = random.Random(res)
+    celdas = [h3_int.latlng_to_cell(rnd.uniform(-80, 80), rnd.uniform(-180, 180), RESOLUCION_H3) for _ in range(500)]
+    y, o = motor_h3.mascaras_padre(res)
+    assert [(c & y) | o for c in celdas] == [h3_int.cell_to_parent(c, res) for c in celdas]
+
+
+def test_rango_descendientes_contiene_a_los_hijos():
+    padre = h3_int.latlng_to_cell(40.4168, -3.7038, 6)
+    lo, hi = motor_h3.rango_descendientes(padre)
+    hijos = h3_int.cell_to_children(padre, RESOLUCION_H3)
+    assert all(lo <= h <= hi for h in hijos)
+    vecino = next(v for v in h3_int.grid_disk(padre, 1) if v != padre)
+    assert not any(lo <= h <= hi for h in h3_int.cell_to_children(vecino, RESOLUCION_H3))
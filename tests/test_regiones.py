@@ -0,0 +1,49 @@
+import random
+import h3.api.basic_int as h3_int
+import pytest
+from src import regiones
+from src.motor_h3 import RESOLUCION_H3
+
+
+def _cuadrado(lat, lon, lado):
+    return {"type": "Polygon", "coordinates": [[
+        [lon, lat], [lon + lado, lat], [lon + lado, lat + lado], [lon, lat + lado], [lon, lat]]]}
+
+
+PAIS = _cuadrado(40.0, -4.0, 1.0)
+MUNICIPIO = _cuadrado(40.3, -3.8, 0.2)
+
+
+@pytest.fixture
+def indice(monkeypatch):
+    filas_regiones = [(1, "PAIS", "España", None), (2, "MUNICIPIO", "Madrid", 1)]
+    filas_celdas = ([(c, 1) for c in regiones.celdas_region(PAIS, 6)] +
+                    [(c, 2) for c in regiones.celdas_region(MUNICIPIO, 8)])
+    monkeypatch.setattr(regiones, "_indice", regiones.construir(filas_regiones, filas_celdas))
+    return filas_celdas
+
+
+def _esperada(celda, filas_celdas):
+    """Región más profunda cuyas celdas compactadas contienen a 'celda' (recorriendo todo)."""
+    dentro = {r for c, r in filas_celdas
+              if h3_int.get_resolution(c) <= RESOLUCION_H3 and h3_int.cell_to_parent(celda, h3_int.get_resolution(c)) == c}
+    return max(dentro) if dentro else None
+
+
+def test_resolver_igual_que_recorrer_las_celdas(indice):
+    rnd = random.Random(7)
+    celdas = [h3_int.latlng_to_cell(rnd.uniform(39.8, 41.2), rnd.uniform(-4.2, -2.8), RESOLUCION_H3) for _ in range(2000)]
+    assert regiones.resolver(celdas) == [_esperada(c, indice) for c in celdas]
+
+
+def test_resolver_municipio_gana_al_pais(indice):
+    madrid = h3_int.latlng_to_cell(40.4, -3.7, RESOLUCION_H3)
+    campo = h3_int.latlng_to_cell(40.8, -3.2, RESOLUCION_H3)
+    fuera = h3_int.latlng_to_cell(48.85, 2.35, RESOLUCION_H3)
+    assert regiones.resolver([madrid, campo, fuera]) == [2, 1, None]
+    assert regiones.ancestros(2) == [2, 1]
+
+
+def test_buscar_sin_tildes_ni_mayusculas(indice):
+    assert regiones.buscar("  MADRID ", "MUNICIPIO", pais="espana") == [2]
+    assert regiones.buscar("Madrid", "PAIS") == []